@@ -1,11 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, Response
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, Response, g, has_app_context
 from functools import wraps
+import click
 import sqlite3
 import os
-from decimal import Decimal
+import re
+import hashlib
+import mimetypes
+import time
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from flask import send_file
+from database import ConnectionPool, open_connection, storage_profile
+from migrations import run_migrations, current_version
+from cache import make_cache, PageCache, LRUCache
+import search as product_search
+import pagination
+import sitemaps
+import images as product_images
+import assets
+from conditional import conditional, make_etag
+from featured import FeaturedSampler
+from summaries import ProductSummaries
+import cart_pricing
+import cart_store
+import orders
+import ratings
+import facets
+import repository
+import reservations
+import queue
+import threading
 
 #Todo
 #add proper filtering
@@ -30,7 +54,8 @@ app.config['SESSION_COOKIE_SECURE'] = SSL_ENABLED
 if SSL_ENABLED:
     app.config['PREFERRED_URL_SCHEME'] = 'https'
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "webstore.db")
+# DATABASE_PATH points the app at another database file (e.g. in tests)
+DB_PATH = os.environ.get('DATABASE_PATH') or os.path.join(os.path.dirname(__file__), "webstore.db")
 
 # SQLite INTEGER is signed 64-bit: range is -(2**63) .. 2**63-1
 # Protect against Python ints larger than the SQLite C type can hold.
@@ -51,42 +76,142 @@ except Exception:
     db = None
 
 
-# Simple in-memory TTL cache used for page fragments (product pages, sitemap).
-# This avoids adding external dependencies. Keys and values live in process memory
-# and are suitable for small deployments or demo sites.
-class SimpleCache:
-    def __init__(self):
-        # key -> (expires_ts, value)
-        self._store = {}
+# Cache for page fragments (product pages, sitemap). CACHE_BACKEND=memory keeps a
+# bounded LRU per process; CACHE_BACKEND=sqlite shares one on-disk cache between
+# all worker processes on the host (CACHE_PATH), so renders and invalidations
+# are seen by every worker. CACHE_MAX_ENTRIES / CACHE_MAX_BYTES tune the limits.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+_cache = make_cache(
+    CACHE_BACKEND,
+    path=os.environ.get('CACHE_PATH', os.path.join(os.path.dirname(__file__), 'cache.db')),
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 2048)),
+    max_bytes=int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+)
 
-    def set(self, key, value, ttl=60):
-        self._store[key] = (datetime.utcnow().timestamp() + ttl, value)
+# full-page cache for product pages
+_page_cache = PageCache(_cache)
+
+
+# home-page featured products are drawn from a pre-sampled pool instead of
+# ORDER BY RANDOM(); the pool is rebuilt on catalog changes or every
+# FEATURED_REFRESH_SECONDS
+_featured = FeaturedSampler(
+    pool_size=int(os.environ.get('FEATURED_POOL_SIZE', 500)),
+    refresh_interval=int(os.environ.get('FEATURED_REFRESH_SECONDS', 300)),
+)
+
+
+# product card rows (with seller fields) shared by the listing-style views;
+# a small per-process cache in front of one IN (...) query
+_summaries = ProductSummaries(
+    max_entries=int(os.environ.get('PRODUCT_SUMMARY_CACHE_SIZE', 2048)),
+    ttl=int(os.environ.get('PRODUCT_SUMMARY_TTL', 60)),
+)
 
-    def get(self, key):
-        v = self._store.get(key)
-        if not v:
-            return None
-        expires, val = v
-        if datetime.utcnow().timestamp() > expires:
-            try:
-                del self._store[key]
-            except Exception:
-                pass
-            return None
-        return val
 
-    def delete(self, key):
+# the logged-in user's username/is_admin/is_seller, looked up once per request
+# and kept for PRINCIPAL_CACHE_TTL seconds (see current_principal())
+_principals = LRUCache(max_entries=4096, default_ttl=int(os.environ.get('PRINCIPAL_CACHE_TTL', 30)))
+
+
+def invalidate_cache(*tags):
+    """Invalidate cached pages/fragments that depend on any of the given tags.
+
+    Tags in use: 'product:<id>', 'seller:<user id>', 'category:<id>' and
+    'catalog' (pages listing the set of active products, e.g. the sitemap).
+    Every call also bumps 'content', and 'sellers' / 'categories' when a
+    seller or category tag is among them.
+    """
+    # coarse tags behind the conditional-GET validators (see _tag_validators)
+    derived = {'content'}
+    for tag in tags:
+        if tag.startswith('seller:'):
+            derived.add('sellers')
+        elif tag.startswith('category:'):
+            derived.add('categories')
+    _page_cache.invalidate(*tags, *derived)
+    for tag in tags:
+        if tag.startswith('product:'):
+            _summaries.invalidate(tag.split(':', 1)[1])
+        elif tag.startswith('seller:'):
+            # seller name/rating is denormalized into every summary of their products
+            _summaries.clear()
+
+
+# Image variants are generated on a background thread once the product is
+# committed, so resizing never holds the write lock or delays the response.
+_image_jobs = queue.Queue()
+_image_worker_lock = threading.Lock()
+_image_worker_started = False
+
+
+def _image_worker():
+    while True:
+        image_url, product_id = _image_jobs.get()
         try:
-            del self._store[key]
-        except KeyError:
+            if product_images.generate(image_url):
+                # pages rendered in the meantime lack the <picture> sources
+                invalidate_cache(f"product:{product_id}", 'catalog')
+        except Exception:
+            # best-effort, see images.py
             pass
 
-    def clear(self):
-        self._store.clear()
+
+def process_product_image(image_url, product_id):
+    """Queue generating the resized srcset variants of a product's image."""
+    global _image_worker_started
+    if not image_url or not product_images.available():
+        return
+    with _image_worker_lock:
+        if not _image_worker_started:
+            threading.Thread(target=_image_worker, name='image-variants', daemon=True).start()
+            _image_worker_started = True
+    _image_jobs.put((image_url, product_id))
 
 
-# global simple cache instance
-_cache = SimpleCache()
+# <picture> sources for product images: image_sources(url) -> [{'type', 'srcset'}]
+app.add_template_global(product_images.sources, 'image_sources')
+
+
+# Fingerprinted static assets (assets.py), built by `flask build-assets` and
+# served from /assets/ with immutable caching. Behind a proxy, USE_X_SENDFILE=1
+# hands the file transfer to Apache/lighttpd (X-Sendfile), or ASSET_ACCEL_PREFIX
+# (e.g. /_assets) to nginx (X-Accel-Redirect to an internal location mapped to
+# static/dist).
+_assets = assets.AssetManifest()
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE', '0') == '1'
+ASSET_ACCEL_PREFIX = os.environ.get('ASSET_ACCEL_PREFIX', '').rstrip('/')
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+@app.template_global()
+def static_url(filename):
+    """URL of a static file: its fingerprinted /assets/ copy when built, else /static/."""
+    hashed = _assets.lookup(filename)
+    if hashed:
+        return url_for('asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    path = safe_join(assets.DIST_DIR, filename)
+    if path is None or not os.path.isfile(path) or filename == assets.MANIFEST_NAME:
+        return ("Not found", 404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    path, encoding = _assets.encoded_variant(path, request.accept_encodings)
+    if ASSET_ACCEL_PREFIX:
+        resp = Response(mimetype=mimetype)
+        resp.headers['X-Accel-Redirect'] = f"{ASSET_ACCEL_PREFIX}/{os.path.relpath(path, assets.DIST_DIR).replace(os.sep, '/')}"
+    else:
+        resp = send_file(path, mimetype=mimetype, conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    # the name changes whenever the content does
+    resp.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return resp
+
 
 # Rate limiter (best-effort). Try to import Flask-Limiter dynamically so missing
 # packages don't create static import errors in editors/linters.
@@ -111,27 +236,85 @@ def ratelimit_handler(e):
     # Friendly response for rate-limited requests
     return Response('Too many requests, please try again later.', status=429, mimetype='text/plain')
 
+# Storage profile applied to every pooled connection. DB_STORAGE_PROFILE picks a
+# named PRAGMA set ('wal' by default, 'safe' for the classic rollback journal)
+# and the individual DB_* variables override single settings.
+DB_STORAGE = storage_profile(
+    os.environ.get('DB_STORAGE_PROFILE', 'wal'),
+    synchronous=os.environ.get('DB_SYNCHRONOUS'),
+    mmap_size=os.environ.get('DB_MMAP_SIZE'),
+    cache_size=os.environ.get('DB_CACHE_SIZE'),
+    temp_store=os.environ.get('DB_TEMP_STORE'),
+    busy_timeout=os.environ.get('DB_BUSY_TIMEOUT'),
+)
+
+# Bounded pools of long-lived sqlite3 connections. Each app context borrows one
+# connection (cached on `g`) and returns it on teardown, so helpers that call
+# get_db_connection() several times per request share a single connection.
+# Catalog views read through a separate query_only pool so they never queue
+# behind order writers for a connection.
+_db_pool = ConnectionPool(
+    DB_PATH,
+    max_size=int(os.environ.get('DB_POOL_SIZE', 8)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    pragmas=DB_STORAGE,
+)
+_db_read_pool = ConnectionPool(
+    DB_PATH,
+    max_size=int(os.environ.get('DB_READ_POOL_SIZE', 8)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    pragmas=DB_STORAGE,
+    readonly=True,
+)
+
+# Let the ORM wait on a locked database as long as the sqlite3 connections do.
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+    'connect_args': {'timeout': int(DB_STORAGE.get('busy_timeout', 5000)) / 1000.0},
+})
+
+
 def get_db_connection(path=DB_PATH):
-    conn = sqlite3.connect(path)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    # Ensure legacy databases gain the is_active column for products.
-    try:
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(products)")
-        cols = [r['name'] for r in cur.fetchall()]
-        if 'is_active' not in cols:
-            try:
-                cur.execute("ALTER TABLE products ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1")
-                conn.commit()
-            except Exception:
-                # Best-effort: if alter fails (older DB layouts), continue without raising
-                pass
-    except Exception:
-        pass
+    """Return the connection for the current app context.
+
+    Inside a request this is the pooled connection bound to `g`; calling close()
+    on it is harmless and it goes back to the pool at teardown. Outside an app
+    context (startup code, scripts) or for other database files a plain
+    connection is opened and the caller owns it.
+    """
+    if path != DB_PATH or not has_app_context():
+        return open_connection(path, pragmas=DB_STORAGE)
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = _db_pool.acquire()
+        g.db_conn = conn
+    return conn
+
+
+def get_read_connection():
+    """Return a read-only (query_only) connection for catalog views.
+
+    Works like get_db_connection() but draws from the read pool; any attempt to
+    write through it raises sqlite3.OperationalError.
+    """
+    if not has_app_context():
+        return open_connection(DB_PATH, pragmas=DB_STORAGE, readonly=True)
+    conn = g.get('db_read_conn')
+    if conn is None:
+        conn = _db_read_pool.acquire()
+        g.db_read_conn = conn
     return conn
 
 
+@app.teardown_appcontext
+def release_db_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        _db_pool.release(conn)
+    conn = g.pop('db_read_conn', None)
+    if conn is not None:
+        _db_read_pool.release(conn)
+
+
 # Security headers helper
 @app.after_request
 def set_security_headers(response):
@@ -145,10 +328,6 @@ def set_security_headers(response):
     return response
 
 
-# Ensure categories table and products.category_id exist on startup (best-effort)
-# (moved later — ensure_categories_table is defined below)
-
-
 @app.route('/favicon.ico')
 def favicon():
     """Serve the generated favicon.ico for clients that request /favicon.ico directly."""
@@ -214,227 +393,213 @@ def robots_txt():
     return Response("\n".join(lines) + "\n", mimetype='text/plain')
 
 
+# Conditional GET (conditional.py). Validators only read cache tag versions and
+# never render. Besides their tags, pages vary by viewer (navbar, member-only
+# review form) and by the deployed templates and assets.
+def _hash_templates():
+    parts = []
+    for root, _, names in sorted(os.walk(os.path.join(app.root_path, 'templates'))):
+        for name in sorted(names):
+            with open(os.path.join(root, name), 'rb') as f:
+                parts.append(hashlib.sha1(f.read()).hexdigest())
+    return make_etag(parts)
+
+
+_RENDER_VERSION = _hash_templates()
+# ETags/Last-Modified built from cache tag versions are only sound when every
+# worker sees the same versions, i.e. with the shared sqlite cache backend. With
+# CACHE_BACKEND=memory each process has its own, so a worker that missed an
+# invalidation would answer 304 for changed pages; CONDITIONAL_GET=1 turns them
+# on anyway for single-process deployments. (Sitemap validators come from the
+# database and are always on.)
+CONDITIONAL_GET = os.environ.get('CONDITIONAL_GET', '1' if CACHE_BACKEND == 'sqlite' else '0') == '1'
+_BOOT_TIME = time.time()
+
+
+def _viewer_parts():
+    principal = current_principal()
+    return [session.get('user_id') or '', session.get('username') or '',
+            bool(principal and principal['is_admin']), bool(principal and principal['is_seller']),
+            datetime.now().year, _RENDER_VERSION, _assets.version or '']
+
+
+def _tag_validators(tags, extra=()):
+    """(parts, last_modified) for a page built from the given cache tags."""
+    if not CONDITIONAL_GET:
+        return None
+    parts = [_page_cache.tag_version(t) for t in tags] + list(extra) + _viewer_parts()
+    times = [_page_cache.tag_modified(t) for t in tags]
+    # Last-Modified only when every tag's change time is known; never older
+    # than this process, so a deploy doesn't answer with stale 304s
+    modified = max(times + [_BOOT_TIME]) if all(times) else None
+    return parts, modified
+
+
+def _sitemap_validators(n=None):
+    manifest = _sitemap_manifest()
+    return [manifest['token'], SITEMAP_GZIP, n, request.path, 'gzip' in request.accept_encodings], None
+
+
+# Sitemaps (sitemaps.py): /sitemap.xml is an index of shards of at most
+# SITEMAP_MAX_URLS URLs, persisted gzipped in SITEMAP_DIR. SITEMAP_GZIP=1 makes
+# the index link the .xml.gz variants.
+_sitemaps = sitemaps.SitemapStore(
+    os.environ.get('SITEMAP_DIR', os.path.join(os.path.dirname(__file__), 'sitemaps')),
+    max_urls=int(os.environ.get('SITEMAP_MAX_URLS', 50000)),
+)
+SITEMAP_GZIP = os.environ.get('SITEMAP_GZIP', '0') == '1'
+
+
+def _sitemap_manifest():
+    # the fingerprint costs one index scan, so keep it until the catalog changes
+    fp = _page_cache.get('sitemap_fingerprint')
+    if fp is None:
+        versions = _page_cache.snapshot(['catalog'])
+        conn = get_read_connection()
+        try:
+            fp = sitemaps.fingerprint(conn)
+        finally:
+            conn.close()
+        _page_cache.set('sitemap_fingerprint', fp, ttl=300, tags=('catalog',), versions=versions)
+    return _sitemaps.manifest(fp, request.url_root.rstrip('/'))
+
+
 @app.route('/sitemap.xml')
+@conditional(_sitemap_validators, cache_control='public, no-cache')
 def sitemap_xml():
-    # Return cached sitemap when possible
-    cached = _cache.get('sitemap_xml')
-    if cached:
-        return Response(cached, mimetype='application/xml')
-
-    base = request.url_root.rstrip('/')
-    urls = []
-    # static pages
-    static_paths = ['/', '/products', '/about', '/contact', '/terms', '/privacy', '/cookies', '/returns']
-    today = datetime.utcnow().date().isoformat()
-    for p in static_paths:
-        urls.append((base + p, today))
-
-    # product pages
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id, created_at FROM products WHERE is_active = 1")
-        for r in cur.fetchall():
-            pid = r['id']
-            try:
-                lastmod = r['created_at'] or today
-            except Exception:
-                lastmod = today
-            # normalize to date only if it's a datetime-like string
-            try:
-                lastmod = lastmod.split(' ')[0]
-            except Exception:
-                pass
-            urls.append((f"{base}/product/{pid}", lastmod))
-    except Exception:
-        # if table missing, skip
-        pass
-    conn.close()
+    return Response(_sitemaps.index_xml(_sitemap_manifest(), gzip_links=SITEMAP_GZIP), mimetype='application/xml')
 
-    # build XML
-    parts = ['<?xml version="1.0" encoding="UTF-8"?>', '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
-    for loc, lastmod in urls:
-        parts.append('  <url>')
-        parts.append(f'    <loc>{loc}</loc>')
-        parts.append(f'    <lastmod>{lastmod}</lastmod>')
-        parts.append('  </url>')
-    parts.append('</urlset>')
-    xml = '\n'.join(parts)
-    # cache sitemap for a short period
-    _cache.set('sitemap_xml', xml, ttl=300)
-    return Response(xml, mimetype='application/xml')
-
-
-def ensure_seller_applications_table(conn):
-    """Ensure the seller_applications table exists and has the expected columns.
-    Adds a `status` column if it's missing to support approve/reject flows.
-    """ 
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS seller_applications (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            business_name TEXT,
-            message TEXT,
-            logo_url TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
-    conn.commit()
-    # ensure `status` column exists (older installs may have a table without it)
-    cur.execute("PRAGMA table_info(seller_applications)")
-    cols = [r[1] for r in cur.fetchall()]
-    # ensure `status` column exists (older installs may have a table without it)
-    if 'status' not in cols:
-        cur.execute("ALTER TABLE seller_applications ADD COLUMN status TEXT DEFAULT 'pending'")
-        conn.commit()
-    # ensure seller_description column exists
-    if 'seller_description' not in cols:
-        cur.execute("ALTER TABLE seller_applications ADD COLUMN seller_description TEXT")
-        conn.commit()
 
+@app.route('/sitemap-<int:n>.xml')
+@app.route('/sitemap-<int:n>.xml.gz', endpoint='sitemap_shard_gz')
+@conditional(_sitemap_validators, cache_control='public, no-cache')
+def sitemap_shard(n):
+    path = _sitemaps.shard_path(_sitemap_manifest(), n, lambda: open_connection(DB_PATH, pragmas=DB_STORAGE, readonly=True))
+    if path is None:
+        return ("Not found", 404)
+    if request.path.endswith('.gz'):
+        return Response(_sitemaps.stream(path), mimetype='application/gzip')
+    # shards are stored gzipped: pass them through to clients that accept it
+    if 'gzip' in request.accept_encodings:
+        resp = Response(_sitemaps.stream(path), mimetype='application/xml')
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = Response(_sitemaps.stream(path, decompress=True), mimetype='application/xml')
+    resp.vary.add('Accept-Encoding')
+    return resp
 
-def ensure_categories_table(conn):
-    """Create categories table if missing and add category_id column to products if needed.
-    This is a best-effort, non-destructive migration: category_id is nullable.
-    """
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            slug TEXT UNIQUE,
-            description TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        )
-    """)
-    conn.commit()
 
-    # ensure products table has category_id column (nullable)
+# Apply pending schema migrations once at startup (best-effort). Deployments that
+# run `flask --app app migrate` as a release step can disable this with
+# AUTO_MIGRATE=0; either way request handlers never run DDL.
+if os.environ.get('AUTO_MIGRATE', '1').lower() in ('1', 'true', 'yes'):
     try:
-        cur.execute("PRAGMA table_info(products)")
-        cols = [r[1] for r in cur.fetchall()]
-        if 'category_id' not in cols:
-            cur.execute("ALTER TABLE products ADD COLUMN category_id INTEGER")
-            conn.commit()
+        _conn = get_db_connection()
+        run_migrations(_conn)
+        _conn.close()
     except Exception:
-        # if products table doesn't exist yet or other error, skip quietly
+        # If the DB isn't reachable yet, `flask migrate` can be run later
         pass
 
-    # create association table for many-to-many product<->category mapping
-    try:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS product_categories (
-                product_id INTEGER NOT NULL,
-                category_id INTEGER NOT NULL,
-                PRIMARY KEY (product_id, category_id),
-                FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE,
-                FOREIGN KEY(category_id) REFERENCES categories(id) ON DELETE CASCADE
-            )
-        """)
-        conn.commit()
-    except Exception:
-        pass
 
-    # create an index to speed lookups
-    try:
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id)")
-        conn.commit()
-    except Exception:
-        pass
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations to the webstore database."""
+    conn = get_db_connection()
     try:
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_category_id ON product_categories(category_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_product_id ON product_categories(product_id)")
-        conn.commit()
-    except Exception:
-        pass
+        applied = run_migrations(conn)
+        for version, description in applied:
+            click.echo(f"Applied migration {version}: {description}")
+        click.echo(f"Schema is at version {current_version(conn)}.")
+    finally:
+        conn.close()
 
 
-def ensure_reviews_table(conn):
-    """Create reviews table to store product reviews and moderation status."""
-    cur = conn.cursor()
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the products_fts full-text index from the products table."""
+    conn = get_db_connection()
     try:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY,
-                product_id INTEGER NOT NULL,
-                user_id INTEGER,
-                title TEXT,
-                body TEXT,
-                rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
-                status TEXT DEFAULT 'pending',
-                created_at TEXT DEFAULT (datetime('now')),
-                FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE SET NULL
-            )
-        """)
-        conn.commit()
-    except Exception:
-        pass
+        product_search.rebuild_index(conn)
+        click.echo("Search index rebuilt.")
+    finally:
+        conn.close()
 
 
-def ensure_products_rating_column(conn):
-    """Ensure products table has a 'rating' REAL column to store aggregated product ratings."""
-    cur = conn.cursor()
+@app.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """Recompute product and seller ratings from approved reviews."""
+    conn = get_db_connection()
     try:
-        cur.execute("PRAGMA table_info(products)")
-        cols = [r[1] for r in cur.fetchall()]
-        if 'rating' not in cols:
-            cur.execute("ALTER TABLE products ADD COLUMN rating REAL DEFAULT 0.0")
-            conn.commit()
-    except Exception:
-        # if products table doesn't exist yet or other error, skip quietly
-        pass
+        ratings.rebuild(conn)
+        click.echo("Ratings rebuilt.")
+    finally:
+        conn.close()
+    # cached pages show ratings (this reaches a running server only with a shared cache backend)
+    _cache.clear()
 
 
-def recalc_product_rating(conn, product_id):
-    """Recalculate average approved review rating for a product and store it in products.rating."""
+@app.cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recompute the category/price facet counts of the product listing."""
+    conn = get_db_connection()
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT AVG(rating) AS avg_rating FROM reviews WHERE product_id = ? AND status = 'approved'", (product_id,))
-        avg = cur.fetchone()['avg_rating']
-        if avg is None:
-            avg = 0.0
-        cur.execute("UPDATE products SET rating = ? WHERE id = ?", (avg, product_id))
-        conn.commit()
-    except Exception:
-        # best-effort: ignore failures here
-        pass
+        facets.rebuild(conn)
+        click.echo("Facets rebuilt.")
+    finally:
+        conn.close()
+    _cache.clear()
 
 
-def recalc_seller_rating(conn, seller_id):
-    """Recalculate seller rating as the average of all approved reviews for their products."""
+@app.cli.command('build-image-variants')
+def build_image_variants_command():
+    """Generate srcset variants for every local product image."""
+    if not product_images.available():
+        click.echo("Pillow is not installed; nothing to do.", err=True)
+        raise SystemExit(1)
+    conn = get_db_connection()
     try:
-        cur = conn.cursor()
-        # join reviews to products to find reviews for this seller's products
-        cur.execute(
-            "SELECT AVG(r.rating) AS avg_rating FROM reviews r JOIN products p ON r.product_id = p.id WHERE p.seller_id = ? AND r.status = 'approved'",
-            (seller_id,)
-        )
-        avg = cur.fetchone()['avg_rating']
-        if avg is None:
-            avg = 0.0
-        cur.execute("UPDATE users SET rating = ? WHERE id = ?", (avg, seller_id))
-        conn.commit()
-    except Exception:
-        pass
+        urls = [r[0] for r in conn.execute("SELECT DISTINCT image_url FROM products WHERE image_url IS NOT NULL")]
+    finally:
+        conn.close()
+    done = 0
+    for url in urls:
+        try:
+            if product_images.generate(url):
+                done += 1
+        except Exception as e:
+            click.echo(f"{url}: {e}", err=True)
+    click.echo(f"Generated variants for {done} of {len(urls)} images.")
 
 
-# Backfill seller ratings at startup (best-effort): compute rating as avg of approved reviews
-try:
-    _conn = get_db_connection()
-    cur = _conn.cursor()
-    cur.execute("SELECT id FROM users WHERE is_seller = 1")
-    for r in cur.fetchall():
-        try:
-            recalc_seller_rating(_conn, r['id'])
-        except Exception:
-            # ignore per-seller failures
-            pass
-    _conn.close()
-except Exception:
-    pass
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ into static/dist (restart the app to pick it up)."""
+    manifest = assets.build()
+    click.echo(f"Built {len(manifest['files'])} assets (version {manifest['version']}).")
+
+
+@app.cli.command('sweep-carts')
+def sweep_carts_command():
+    """Delete carts unused for CART_TTL_DAYS days and expired stock holds."""
+    click.echo(f"Removed {sweep_carts()} expired carts and {sweep_stock_holds()} expired stock holds.")
+
+
+@app.cli.command('check-query-plans')
+@click.option('--live', is_flag=True, help='Check against webstore.db (with its statistics) instead of a schema-only database.')
+def check_query_plans_command(live):
+    """Fail if a hot query's plan falls back to a full table scan."""
+    import query_plans
+    conn = get_db_connection() if live else query_plans.schema_connection()
+    try:
+        regressions = query_plans.check_query_plans(conn)
+    finally:
+        conn.close()
+    for name, detail in regressions:
+        click.echo(f"{name}: {detail}", err=True)
+    if regressions:
+        raise SystemExit(1)
+    click.echo(f"All {len(query_plans.HOT_QUERIES)} hot queries use indexes.")
 
 
 @app.errorhandler(404)
@@ -445,63 +610,170 @@ def page_not_found(e):
         return ("Not found", 404)
 
 
-# Call the migration helper on startup (best-effort). This must run after
-# the function is defined so imports won't fail when the module loads.
-try:
-    _conn = get_db_connection()
-    ensure_categories_table(_conn)
-    try:
-        ensure_reviews_table(_conn)
-    except Exception:
-        pass
-    try:
-        ensure_products_rating_column(_conn)
-    except Exception:
-        pass
-    _conn.close()
-except Exception:
-    # If DB isn't yet created or another startup issue occurs, skip; migration will run later when needed
-    pass
+# Server-side carts (cart_store.py): carts untouched for CART_TTL_DAYS are
+# removed by a background sweep every CART_SWEEP_INTERVAL seconds (0 disables
+# it; `flask sweep-carts` runs one by hand).
+CART_TTL_DAYS = int(os.environ.get('CART_TTL_DAYS', 30))
+CART_SWEEP_INTERVAL = int(os.environ.get('CART_SWEEP_INTERVAL', 3600))
+
+# Stock holds (reservations.py): adding to the cart holds the stock for
+# STOCK_HOLD_SECONDS; expired holds are deleted every STOCK_HOLD_SWEEP_INTERVAL
+# seconds by the same background sweeper.
+STOCK_HOLD_SECONDS = int(os.environ.get('STOCK_HOLD_SECONDS', 900))
+STOCK_HOLD_SWEEP_INTERVAL = int(os.environ.get('STOCK_HOLD_SWEEP_INTERVAL', 60))
 
 
 def ensure_cart():
-    if 'cart' not in session:
-        session['cart'] = {}
-    return session['cart']
+    """Return the visitor's cart as {product_id (str): quantity}.
 
-def cart_total_items_and_amount(cart):
-    total_items = 0
-    total_amount = Decimal("0.00")
+    The lines are stored server-side; the session only holds `cart_id`. Use
+    save_cart() to change it.
+    """
+    if 'cart' in g:
+        return g.cart
+    cart = {}
+    cart_id = session.get('cart_id')
+    if cart_id:
+        cart = cart_store.load(get_read_connection(), cart_id, session.get('user_id'))
+        if not cart:
+            # expired, emptied elsewhere or not ours
+            session.pop('cart_id', None)
+    g.cart = cart
+    # carts kept in the cookie by older versions move to the server on first use
+    legacy = session.pop('cart', None)
+    if legacy:
+        merged = dict(cart)
+        for pid, qty in legacy.items():
+            merged[str(pid)] = merged.get(str(pid), 0) + int(qty)
+        save_cart(merged)
+    return g.cart
+
+
+def save_cart(cart):
+    """Persist the visitor's cart, creating it server-side on first use."""
+    cart = {str(pid): int(qty) for pid, qty in cart.items() if int(qty) > 0}
+    cart_id = session.get('cart_id')
+    conn = get_db_connection()
     if not cart:
-        return total_items, total_amount
-    ids = list(cart.keys())
-    # Prefer ORM lookup when available
-    rows = {}
+        if cart_id:
+            cart_store.delete(conn, cart_id)
+            session.pop('cart_id', None)
+    else:
+        if not cart_id:
+            cart_id = cart_store.new_cart_id()
+            session['cart_id'] = cart_id
+        cart_store.save(conn, cart_id, cart, user_id=session.get('user_id'))
+    conn.close()
+    g.cart = cart
+
+
+def hold_stocks(quantities):
+    """Hold {product id: units} for the visitor's cart in one transaction; returns the units granted.
+
+    A quantity of 0 releases the hold on that product.
+    """
+    cart_id = session.get('cart_id')
+    if not cart_id:
+        cart_id = cart_store.new_cart_id()
+        session['cart_id'] = cart_id
+    conn = get_db_connection()
+    # the holds reference the cart row, so make sure it exists
+    cart_store.ensure(conn, cart_id, user_id=session.get('user_id'))
+    granted = reservations.hold_many(conn, cart_id, quantities, STOCK_HOLD_SECONDS)
+    conn.close()
+    return granted
+
+
+def hold_stock(product_id, quantity):
+    """Hold `quantity` units of a product for the visitor's cart; returns the units granted."""
+    return hold_stocks({product_id: quantity})[product_id]
+
+
+def release_stock(product_id):
+    """Drop the visitor's cart hold on a product."""
+    cart_id = session.get('cart_id')
+    if cart_id:
+        conn = get_db_connection()
+        reservations.release(conn, cart_id, product_id)
+        conn.close()
+
+
+def attach_cart_to_user(user_id):
+    """Merge the guest cart into the user's cart after login/registration."""
     try:
-        if db is not None:
-            from models import Product
-            prods = Product.query.filter(Product.id.in_([int(i) for i in ids]), Product.is_active == True).all()
-            rows = {str(p.id): Decimal(str(p.price)) for p in prods}
-        else:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            placeholders = ",".join("?" for _ in ids)
-            cur.execute(f"SELECT id, price FROM products WHERE id IN ({placeholders}) AND is_active = 1", ids)
-            rows = {str(r["id"]): Decimal(str(r["price"])) for r in cur.fetchall()}
-            conn.close()
-    except Exception:
-        # fallback to sqlite path on any ORM error
         conn = get_db_connection()
-        cur = conn.cursor()
-        placeholders = ",".join("?" for _ in ids)
-        cur.execute(f"SELECT id, price FROM products WHERE id IN ({placeholders}) AND is_active = 1", ids)
-        rows = {str(r["id"]): Decimal(str(r["price"])) for r in cur.fetchall()}
+        cart_id = cart_store.attach_to_user(conn, session.get('cart_id'), user_id)
+        conn.close()
+    except Exception:
+        # never block a login on the cart
+        return
+    if cart_id:
+        session['cart_id'] = cart_id
+    else:
+        session.pop('cart_id', None)
+    g.pop('cart', None)
+
+
+def sweep_carts():
+    conn = open_connection(DB_PATH, pragmas=DB_STORAGE)
+    try:
+        return cart_store.sweep(conn, CART_TTL_DAYS)
+    finally:
+        conn.close()
+
+
+def sweep_stock_holds():
+    conn = open_connection(DB_PATH, pragmas=DB_STORAGE)
+    try:
+        return reservations.sweep(conn)
+    finally:
+        conn.close()
+
+
+_cart_sweeper_lock = threading.Lock()
+_cart_sweeper_started = False
+
+
+def _cart_sweeper():
+    # each job runs on its own interval (<= 0 disables it)
+    jobs = [(interval, job) for interval, job in ((CART_SWEEP_INTERVAL, sweep_carts),
+                                                   (STOCK_HOLD_SWEEP_INTERVAL, sweep_stock_holds)) if interval > 0]
+    due = {job: time.time() + interval for interval, job in jobs}
+    while True:
+        time.sleep(max(1, min(due.values()) - time.time()))
+        for interval, job in jobs:
+            if time.time() < due[job]:
+                continue
+            due[job] = time.time() + interval
+            try:
+                job()
+            except Exception:
+                # best-effort: try again next interval
+                pass
+
+
+@app.before_request
+def start_cart_sweeper():
+    # started lazily so CLI commands and imports don't spawn it
+    global _cart_sweeper_started
+    if _cart_sweeper_started or (CART_SWEEP_INTERVAL <= 0 and STOCK_HOLD_SWEEP_INTERVAL <= 0):
+        return
+    with _cart_sweeper_lock:
+        if not _cart_sweeper_started:
+            threading.Thread(target=_cart_sweeper, name='cart-sweeper', daemon=True).start()
+            _cart_sweeper_started = True
+
+def price_cart(cart, extra_ids=()):
+    """Price `cart` with one product query (see cart_pricing.py).
+
+    `extra_ids` are loaded into the same snapshot (e.g. a product being added).
+    """
+    conn = get_read_connection()
+    try:
+        products = cart_pricing.load_products(conn, list((cart or {}).keys()) + list(extra_ids))
+    finally:
         conn.close()
-    for pid, qty in cart.items():
-        total_items += qty
-        price = rows.get(str(pid), Decimal("0.00"))
-        total_amount += price * qty
-    return total_items, total_amount
+    return cart_pricing.price_cart(cart, products)
 
 def login_required(f):
     @wraps(f)
@@ -512,29 +784,62 @@ def login_required(f):
     return decorated
 
 
-@app.context_processor
-def inject_user_permissions():
-    """Inject a helper into templates: current_user_is_admin -> True/False
-    True if the logged-in user has is_admin flag or matches the special admin username.
+def current_principal():
+    """Return the logged-in user as {'id', 'username', 'is_admin', 'is_seller'}, or None.
+
+    Shared by the template context processor and the admin/seller decorators:
+    the row is loaded at most once per request (kept on `g`) and cached across
+    requests for PRINCIPAL_CACHE_TTL seconds. Call invalidate_principal() after
+    changing a user's roles.
     """
     uid = session.get('user_id')
-    is_admin_flag = False
-    is_seller_flag = False
-    if uid:
-        conn = get_db_connection()
+    if not uid:
+        return None
+    cached = g.get('principal')
+    if cached is not None and cached[0] == uid:
+        return cached[1]
+    principal = _principals.get(uid)
+    if principal is None:
+        conn = get_read_connection()
         cur = conn.cursor()
-        cur.execute("SELECT username, is_admin, is_seller FROM users WHERE id = ?", (uid,))
+        cur.execute("SELECT id, username, is_admin, is_seller FROM users WHERE id = ?", (uid,))
         u = cur.fetchone()
         conn.close()
+        # {} remembers a deleted user
+        principal = {}
         if u:
             allowed_admin_username = 'Bean'
-            if (u['username'] and u['username'].strip().lower() == allowed_admin_username.strip().lower()) or u['is_admin']:
-                is_admin_flag = True
-            # expose seller flag to templates so navbar can show a Seller Dashboard link
-            try:
-                is_seller_flag = bool(u['is_seller'])
-            except Exception:
-                is_seller_flag = False
+            has_name_match = bool(u['username'] and u['username'].strip().lower() == allowed_admin_username.strip().lower())
+            principal = {
+                'id': u['id'],
+                'username': u['username'],
+                # either the special username or any user with is_admin truthy
+                'is_admin': has_name_match or bool(u['is_admin']),
+                'is_seller': bool(u['is_seller']),
+            }
+        _principals.set(uid, principal)
+    principal = principal or None
+    g.principal = (uid, principal)
+    return principal
+
+
+def invalidate_principal(user_id):
+    """Forget the cached roles of a user (after toggling admin/seller or deleting them)."""
+    _principals.delete(user_id)
+    cached = g.get('principal') if has_app_context() else None
+    if cached is not None and cached[0] == user_id:
+        g.pop('principal', None)
+
+
+@app.context_processor
+def inject_user_permissions():
+    """Inject a helper into templates: current_user_is_admin -> True/False
+    True if the logged-in user has is_admin flag or matches the special admin username.
+    """
+    principal = current_principal()
+    is_admin_flag = bool(principal and principal['is_admin'])
+    # expose seller flag to templates so navbar can show a Seller Dashboard link
+    is_seller_flag = bool(principal and principal['is_seller'])
     # resolve a sensible contact URL for the footer: prefer seller_contact, then contact endpoint, else a fallback path
     contact_url = '/contact'
     try:
@@ -556,21 +861,11 @@ def inject_user_permissions():
 def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        # restrict admin area to a single user account (by username)
         uid = session.get('user_id')
         if not uid:
             return redirect(url_for('login', next=request.path))
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # fetch both username and is_admin flag so toggling is_admin grants access
-        cur.execute("SELECT username, is_admin FROM users WHERE id = ?", (uid,))
-        u = cur.fetchone()
-        conn.close()
-        # allow either the special username or any user with is_admin truthy
-        allowed_admin_username = 'Bean'
-        has_name_match = bool(u and u['username'] and u['username'].strip().lower() == allowed_admin_username.strip().lower())
-        has_admin_flag = bool(u and u['is_admin'])
-        if not (has_name_match or has_admin_flag):
+        principal = current_principal()
+        if not (principal and principal['is_admin']):
             flash("Admin access required.")
             return redirect(url_for('index'))
         return f(*args, **kwargs)
@@ -578,48 +873,16 @@ def admin_required(f):
 
 @app.route('/')
 def index():
-    # Prefer using SQLAlchemy ORM when available for cleaner queries and safer migrations.
     featured = []
     try:
-        if db is not None:
-            # Use ORM: pick 6 random active products to feature.
-            from sqlalchemy import func
-            from models import Product
-
-            prods = Product.query.filter(Product.is_active == True).order_by(func.random()).limit(6).all()
-
-            def _to_row(prod):
-                seller = getattr(prod, 'seller', None)
-                return {
-                    'id': prod.id,
-                    'title': prod.title,
-                    'description': prod.description,
-                    'price': prod.price,
-                    'stock': prod.stock,
-                    'created_at': prod.created_at.isoformat() if getattr(prod, 'created_at', None) is not None else '',
-                    'seller_id': prod.seller_id,
-                    'image_url': prod.image_url,
-                    'business_name': getattr(seller, 'business_name', None) if seller else None,
-                    'rating': getattr(seller, 'rating', None) if seller else None,
-                    'seller_username': getattr(seller, 'username', None) if seller else None,
-                    'last_sold': None
-                }
-
-            featured = [_to_row(p) for p in prods]
-        else:
-            # fallback: use sqlite3 raw SQL to select 6 random active products
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, u.business_name, u.rating, u.username AS seller_username FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.is_active = 1 ORDER BY RANDOM() LIMIT 6")
-            featured = cur.fetchall()
-            conn.close()
+        # 6 random active products from the featured pool (see featured.py)
+        featured_ids = _featured.sample(6, get_read_connection, version=_page_cache.tag_version('catalog'))
+        featured = _summaries.get_many(featured_ids, get_read_connection)
     except Exception:
-        # On any ORM error, fall back to sqlite3-based behavior to keep the app running.
+        # On any sampler error, fall back to the newest products to keep the app running.
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, u.business_name, u.rating, u.username AS seller_username FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.is_active = 1 ORDER BY p.created_at DESC LIMIT 6")
-            featured = cur.fetchall()
+            conn = get_read_connection()
+            featured = repository.newest(conn, 6)
             conn.close()
         except Exception:
             featured = []
@@ -630,20 +893,7 @@ def index():
         # ensure ints and limited to 3
         rv_ids = [int(x) for x in rv_ids][:3]
         if rv_ids:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            for pid in rv_ids:
-                try:
-                    cur.execute(
-                        "SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, u.business_name, u.rating, u.username AS seller_username FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.id = ? AND p.is_active = 1",
-                        (pid,)
-                    )
-                    r = cur.fetchone()
-                    if r:
-                        recently_viewed_products.append(r)
-                except Exception:
-                    continue
-            conn.close()
+            recently_viewed_products = _summaries.get_many(rv_ids, get_read_connection)
     except Exception:
         recently_viewed_products = []
 
@@ -653,296 +903,117 @@ def index():
 def about():
     return render_template('about.html')
 
-@app.route('/products')
-def products():
-    search = request.args.get('search', '')
-    # Default to an alphabetical listing by title (A → Z)
-    sort = request.args.get('sort', 'title_az')
-    # pagination
+def _attach_search_snippets(products, match):
+    """Add a highlighted description snippet to each product dict on the page."""
+    if not match or not products:
+        return
     try:
-        page = int(request.args.get('page', 1))
+        snips = product_search.snippets(get_read_connection(), match, [p['id'] for p in products])
     except Exception:
-        page = 1
-    if page < 1:
-        page = 1
-    category_filter = request.args.get('category', '').strip()
-    # Use ORM for product listing when available. Keep previous SQL behavior as fallback.
+        return
+    for p in products:
+        p['snippet'] = snips.get(p['id'])
+
+def _cached_product_count(search, filter_key, compute):
+    """Total number of listings for a search/facet filter.
+
+    The exact COUNT(*) costs as much as scanning every match, so it is
+    cached per filter and dropped whenever the catalog changes.
+    """
+    key = f"product_count:{filter_key}:{search}"
+    count = _page_cache.get(key)
+    if count is None:
+        versions = _page_cache.snapshot(['catalog'])
+        count = int(compute())
+        _page_cache.set(key, count, ttl=300, tags=('catalog',), versions=versions)
+    return count
+
+def _listing_facets(category_values, price_buckets):
+    """Category/price facets for the /products filters (see facets.py).
+
+    Returns (categories, prices, category_ids, total): the menus with their
+    counts, the ids the `category` values (slugs or ids) resolve to, and the
+    number of matching active products when the facet table can answer it
+    (at most one category selected), else None.
+    """
+    conn = get_read_connection()
     try:
-        if db is not None:
-            from models import Product, Category, User
-            # join to seller and category relationships via relationship attributes
-            # avoid passing RelationshipProperty to join() which some linters/type-checkers complain about
-            # SQLAlchemy runtime provides `.query` and relationship attributes like
-            # `seller`/`category`, but static checkers may not have stubs for them.
-            # Silence Pylance/pyright false-positives for this dynamic API.
-            q = Product.query.outerjoin(Product.seller).outerjoin(Product.category).filter(Product.is_active == True)  # type: ignore[attr-defined]
-            if search:
-                term = f"%{search}%"
-                # SQLAlchemy's InstrumentedAttribute supports `.ilike()` at runtime,
-                # but static type checkers (Pylance/pyright) may not have stubs for it
-                # and will raise "attribute not found" errors. Silence that with
-                # a narrow type-ignore so the runtime behavior is unchanged.
-                q = q.filter((Product.title.ilike(term)) | (Product.description.ilike(term)))  # type: ignore[attr-defined]
-            if category_filter:
-                try:
-                    cat_id = int(category_filter)
-                except Exception:
-                    cat_id = None
-                # Build filter conditions carefully: only compare Product.category_id when we have a numeric id.
-                conds = []
-                if cat_id is not None:
-                    conds.append(Product.category_id == cat_id)
-                # Match primary category slug or any linked category via the association table
-                conds.append(Category.slug == category_filter)
-                conds.append(Product.categories.any(Category.slug == category_filter))  # type: ignore[attr-defined]
-                # Combine with OR
-                from sqlalchemy import or_
-                q = q.filter(or_(*conds))
-            if sort == 'price_low':
-                q = q.order_by(Product.price.asc())
-            elif sort == 'price_high':
-                q = q.order_by(Product.price.desc())
-            elif sort == 'title_az':
-                q = q.order_by(Product.title.asc())
-            elif sort == 'title_za':
-                q = q.order_by(Product.title.desc())
-            else:
-                # newest (default)
-                q = q.order_by(Product.created_at.desc())
-
-            total_count = q.count()
-            page_size = 24
-            total_pages = max(1, (int(total_count) + page_size - 1) // page_size)
-            if page > total_pages:
-                page = total_pages
-            offset = (page - 1) * page_size
-            prods = q.limit(page_size).offset(offset).all()
-
-            products = []
-            for p in prods:
-                products.append({
-                    'id': p.id,
-                    'title': p.title,
-                    'description': p.description,
-                    'price': p.price,
-                    'created_at': p.created_at.isoformat() if getattr(p, 'created_at', None) is not None else '',
-                    'stock': p.stock,
-                    'image_url': p.image_url,
-                    'business_name': getattr(p.seller, 'business_name', None) if getattr(p, 'seller', None) else None,
-                    'rating': getattr(p.seller, 'rating', None) if getattr(p, 'seller', None) else None,
-                    'seller_id': p.seller_id,
-                    'category_name': getattr(p.category, 'name', None) if getattr(p, 'category', None) else None,
-                    'category_slug': getattr(p.category, 'slug', None) if getattr(p, 'category', None) else None,
-                })
-
-            # categories for sidebar
-            categories = [ {'id': c.id, 'name': c.name, 'slug': c.slug} for c in Category.query.order_by(Category.name).all() ]
-            return render_template('products.html', products=products, search=search, sort=sort, categories=categories, page=page, total_pages=total_pages, page_size=page_size, total_count=total_count)
+        rows = conn.execute("SELECT id, name, slug FROM categories ORDER BY name").fetchall()
+        counts = facets.counts(conn, price_buckets)
+        category_ids = [r['id'] for r in rows if r['slug'] in category_values or str(r['id']) in category_values]
+        by_bucket = None
+        if not category_values:
+            by_bucket = facets.bucket_counts(conn)
+        elif len(category_ids) == 1:
+            by_bucket = facets.bucket_counts(conn, category_ids[0])
+    finally:
+        conn.close()
+    categories = [{'id': r['id'], 'name': r['name'], 'slug': r['slug'], 'count': counts.get(r['id'], 0),
+                   'selected': r['id'] in category_ids} for r in rows]
+    prices = [{'bucket': b, 'label': facets.bucket_label(b),
+               'count': by_bucket.get(b, 0) if by_bucket is not None else None,
+               'selected': b in price_buckets} for b in range(len(facets.PRICE_BOUNDS))]
+    total = None
+    if by_bucket is not None:
+        total = sum(n for b, n in by_bucket.items() if not price_buckets or b in price_buckets)
+    elif category_values and not category_ids:
+        total = 0
+    return categories, prices, category_ids, total
+
+@app.route('/products')
+@conditional(lambda: _tag_validators(['content'], [request.full_path]))
+def products():
+    search = request.args.get('search', '')
+    # Default to an alphabetical listing by title (A → Z), or best match when searching
+    sort = request.args.get('sort', 'relevance' if search else 'title_az')
+    # FTS5 MATCH expression for the search box (None when it has no searchable words)
+    match = product_search.build_match_query(search) if search else None
+    if sort not in pagination.KEYSET_SORTS or (sort == 'relevance' and not match):
+        sort = pagination.DEFAULT_SORT
+    sort_key, _ = pagination.keyset_sort(sort)
+    # keyset pagination: the opaque cursor marks where the requested page starts
+    cursor = pagination.decode_cursor(request.args.get('cursor'), sort)
+    ascending = pagination.scan_ascending(sort, cursor)
+    page_size = 24
+    # facet filters: any of the selected categories, and any of the selected price buckets
+    category_values = [v.strip() for v in request.args.getlist('category') if v.strip()]
+    price_buckets = sorted({int(v) for v in request.args.getlist('price')
+                            if v.isdecimal() and int(v) < len(facets.PRICE_BOUNDS)})
+    filter_key = f"{','.join(category_values)}|{','.join(map(str, price_buckets))}"
+    categories, prices, category_ids, facet_total = _listing_facets(category_values, price_buckets)
+    filters = {'match': match, 'category_ids': category_ids if category_values else None, 'price_buckets': price_buckets}
+    if search and not match:
+        # nothing searchable in the query
+        rows, total_count = [], 0
+    else:
+        conn = get_read_connection()
+        rows = repository.listing(conn, sort_key, ascending, page_size + 1,
+                                  after=(cursor[1], cursor[2]) if cursor else None, **filters)
+        if facet_total is not None and not search:
+            total_count = facet_total
         else:
-            # fallback to original SQL path
-            conn = get_db_connection()
-            cur = conn.cursor()
-            # Use DISTINCT to avoid duplicate rows when a product is linked to multiple categories
-            base = """
-             SELECT DISTINCT p.id, p.title, p.description, p.price, p.created_at, 
-                 p.stock, p.image_url, u.business_name, u.rating, p.seller_id,
-                 c.name AS category_name, c.slug AS category_slug
-                FROM products p 
-                LEFT JOIN users u ON p.seller_id = u.id
-                LEFT JOIN categories c ON p.category_id = c.id
-            """
-            params = []
-            where = ""
-            if search:
-                where = " WHERE (p.title LIKE ? OR p.description LIKE ?)"
-                params.extend([f"%{search}%", f"%{search}%"])
-            if category_filter:
-                # Match either the product's direct category_id, the primary category slug (c.slug),
-                # or any linked category slug from the product_categories join (c2.slug).
-                if where:
-                    where += " AND (c.slug = ? OR p.category_id = ? OR c2.slug = ?)"
-                else:
-                    where = " WHERE (c.slug = ? OR p.category_id = ? OR c2.slug = ?)"
-                params.append(category_filter)
-                try:
-                    params.append(int(category_filter))
-                except Exception:
-                    params.append(-1)
-                # include the slug again for c2.slug
-                params.append(category_filter)
-            # Always exclude archived products from public listings
-            if where:
-                where += " AND p.is_active = 1"
-            else:
-                where = " WHERE p.is_active = 1"
-            if sort == 'price_low':
-                order = " ORDER BY p.price ASC"
-            elif sort == 'price_high':
-                order = " ORDER BY p.price DESC"
-            elif sort == 'title_az':
-                order = " ORDER BY p.title ASC"
-            elif sort == 'title_za':
-                order = " ORDER BY p.title DESC"
-            else:
-                order = " ORDER BY p.created_at DESC"
-            try:
-                # Count distinct products matching the same join/where conditions (include product_categories joins)
-                count_sql = (
-                    "SELECT COUNT(DISTINCT p.id) AS cnt FROM products p LEFT JOIN users u ON p.seller_id = u.id "
-                    "LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN product_categories pc ON pc.product_id = p.id LEFT JOIN categories c2 ON pc.category_id = c2.id"
-                    + where
-                )
-                cur.execute(count_sql, params)
-                total_count = cur.fetchone()['cnt'] or 0
-            except Exception:
-                total_count = 0
-
-            page_size = 24
-            total_pages = max(1, (int(total_count) + page_size - 1) // page_size)
-            if page > total_pages:
-                page = total_pages
-            offset = (page - 1) * page_size
-            # include joins to product_categories and a second categories alias (c2) so
-            # products assigned via the many-to-many table are matched by slug
-            base = base + " LEFT JOIN product_categories pc ON pc.product_id = p.id LEFT JOIN categories c2 ON pc.category_id = c2.id"
-            main_sql = base + where + order + " LIMIT ? OFFSET ?"
-            main_params = list(params) + [page_size, offset]
-            cur.execute(main_sql, main_params)
-            products = cur.fetchall()
-            try:
-                cur.execute("SELECT id, name, slug FROM categories ORDER BY name")
-                categories = cur.fetchall()
-            except Exception:
-                categories = []
-            conn.close()
-            return render_template('products.html', products=products, search=search, sort=sort, categories=categories, page=page, total_pages=total_pages, page_size=page_size, total_count=total_count)
-    except Exception:
-        # On any failure, fall back to original SQL implementation to keep site live
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT p.id, p.title, p.description, p.price, p.created_at, p.stock, p.image_url, u.business_name, u.rating, p.seller_id, c.name AS category_name, c.slug AS category_slug FROM products p LEFT JOIN users u ON p.seller_id = u.id LEFT JOIN categories c ON p.category_id = c.id WHERE p.is_active = 1 ORDER BY p.created_at DESC LIMIT 24")
-        products = cur.fetchall()
+            total_count = _cached_product_count(match or search, filter_key,
+                                                lambda: repository.listing_count(conn, **filters))
         conn.close()
-        return render_template('products.html', products=products, search=search, sort=sort, categories=[], page=1, total_pages=1, page_size=24, total_count=len(products))
+    products, next_cursor, prev_cursor = pagination.finish_page(
+        rows, page_size, sort, cursor, key_of=lambda r: r['sort_key'], id_of=lambda r: r['id'])
+    _attach_search_snippets(products, match)
+    return render_template('products.html', products=products, search=search, sort=sort, categories=categories, prices=prices, next_cursor=next_cursor, prev_cursor=prev_cursor, page_size=page_size, total_count=total_count)
 
-@app.route('/product/<int:product_id>')
-def product_detail(product_id):
-    # Prefer ORM when available for clearer code and typed objects.
-    product = None
-    reviews = []
+def _load_product_detail(product_id):
+    """Load an active product and its approved reviews for the detail page.
+
+    Returns (None, []) when the product does not exist or is archived.
+    """
+    conn = get_read_connection()
     try:
-        if db is not None:
-            from models import Product, Review
-            # Load product via ORM. We avoid using joinedload here to keep type
-            # checkers and IDE linters happy; templates perform minimal attribute
-            # accesses and performance is acceptable for this app size.
-            product_obj = Product.query.filter_by(id=product_id, is_active=True).first()
-            if product_obj:
-                product = {
-                    'id': product_obj.id,
-                    'title': product_obj.title,
-                    'description': product_obj.description,
-                    'price': product_obj.price,
-                    'stock': product_obj.stock,
-                    'image_url': product_obj.image_url,
-                    'seller_id': product_obj.seller_id,
-                    'created_at': product_obj.created_at.isoformat() if getattr(product_obj, 'created_at', None) is not None else '',
-                    'business_name': getattr(product_obj.seller, 'business_name', None) if product_obj.seller else None,
-                    'seller_description': getattr(product_obj.seller, 'seller_description', None) if product_obj.seller else None,
-                    'rating': getattr(product_obj.seller, 'rating', None) if product_obj.seller else None,
-                    'category_name': getattr(product_obj.category, 'name', None) if product_obj.category else None,
-                    'category_slug': getattr(product_obj.category, 'slug', None) if product_obj.category else None,
-                    'categories': [{'name': c.name, 'slug': c.slug} for c in (product_obj.categories.all() if hasattr(product_obj, 'categories') else [])],
-                }
-                # approved reviews
-                rev_objs = Review.query.filter_by(product_id=product_id, status='approved').order_by(Review.created_at.desc()).all()
-                reviews = [{'id': r.id, 'title': r.title, 'body': r.body, 'rating': r.rating, 'created_at': (r.created_at.isoformat() if getattr(r, 'created_at', None) is not None else ''), 'author': getattr(r.author, 'username', None)} for r in rev_objs]
-            else:
-                product = None
-        else:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("""
-             SELECT p.id, p.title, p.description, p.price, p.stock, p.image_url,
-                 u.id AS seller_id, u.business_name, u.seller_description, u.rating,
-                 c.name AS category_name, c.slug AS category_slug
-             FROM products p
-             LEFT JOIN users u ON p.seller_id = u.id
-             LEFT JOIN categories c ON p.category_id = c.id
-             WHERE p.id = ? AND p.is_active = 1
-            """, (product_id,))
-            product = cur.fetchone()
-            conn.close()
-            if product is None:
-                flash("Product not found.")
-                return redirect(url_for('products'))
-            # load many-to-many categories for this product
-            try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT c.name, c.slug FROM categories c JOIN product_categories pc ON c.id = pc.category_id WHERE pc.product_id = ?", (product_id,))
-                product_categories = cur.fetchall()
-                cats = []
-                for r in product_categories:
-                    try:
-                        cats.append({'name': r['name'], 'slug': r['slug']})
-                    except Exception:
-                        continue
-                # attach categories list to product (sqlite3.Row remains usable for other fields)
-                product = dict(product)
-                product['categories'] = cats
-            except Exception:
-                # fallback: no categories list
-                try:
-                    product = dict(product)
-                    product['categories'] = []
-                except Exception:
-                    pass
-            finally:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-            # fetch approved reviews for this product
-            conn = get_db_connection()
-            cur = conn.cursor()
-            try:
-                cur.execute("SELECT r.id, r.title, r.body, r.rating, r.created_at, u.username AS author FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.product_id = ? AND r.status = 'approved' ORDER BY r.created_at DESC", (product_id,))
-                reviews = cur.fetchall()
-            except Exception:
-                reviews = []
-            conn.close()
-    except Exception:
-        # Any ORM failure should fall back to sqlite3-based handling to keep the site live.
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("""
-             SELECT p.id, p.title, p.description, p.price, p.stock, p.image_url,
-                 u.id AS seller_id, u.business_name, u.seller_description, u.rating,
-                 c.name AS category_name, c.slug AS category_slug
-             FROM products p
-             LEFT JOIN users u ON p.seller_id = u.id
-             LEFT JOIN categories c ON p.category_id = c.id
-             WHERE p.id = ? AND p.is_active = 1
-            """, (product_id,))
-            product = cur.fetchone()
-            conn.close()
-            if product is None:
-                flash("Product not found.")
-                return redirect(url_for('products'))
-            conn = get_db_connection()
-            cur = conn.cursor()
-            try:
-                cur.execute("SELECT r.id, r.title, r.body, r.rating, r.created_at, u.username AS author FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.product_id = ? AND r.status = 'approved' ORDER BY r.created_at DESC", (product_id,))
-                reviews = cur.fetchall()
-            except Exception:
-                reviews = []
-            conn.close()
-        except Exception:
-            flash("Product not found.")
-            return redirect(url_for('products'))
-    # Record recently viewed products in session (most-recent-first, keep up to 3)
+        return repository.product_detail(conn, product_id)
+    finally:
+        conn.close()
+
+
+def _record_recently_viewed(product_id):
+    """Record a product in the session's recently viewed list (most-recent-first, keep up to 3)."""
     try:
         rv = session.get('recently_viewed', []) or []
         # normalize to ints
@@ -956,25 +1027,43 @@ def product_detail(product_id):
     except Exception:
         # non-fatal if session update fails
         pass
-    # fetch approved reviews for this product
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT r.id, r.title, r.body, r.rating, r.created_at, u.username AS author FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.product_id = ? AND r.status = 'approved' ORDER BY r.created_at DESC", (product_id,))
-        reviews = cur.fetchall()
-    except Exception:
-        reviews = []
-    conn.close()
 
-    # Try cached full HTML for this product page
-    cache_key = f"product_html:{product_id}"
-    cached = _cache.get(cache_key)
-    if cached:
-        return Response(cached, mimetype='text/html')
 
-    html = render_template('product_detail.html', product=product, reviews=reviews)
-    # cache for short period; invalidated on product edits/deletes and review actions
-    _cache.set(cache_key, html, ttl=60)
+@app.route('/product/<int:product_id>')
+@conditional(lambda product_id: _tag_validators([f"product:{product_id}", 'sellers', 'categories']),
+             on_not_modified=_record_recently_viewed)
+def product_detail(product_id):
+    # The product body is cached per product (and per guest/member variant, since
+    # only members see the review form) and checked before any database work.
+    # Navbar, session state and the recently-viewed list are handled per request
+    # outside the cached fragment.
+    # Entries are tagged with the product, its seller and its categories so edits
+    # to any of them invalidate the page. The seller and categories are only
+    # known after loading, so the coarse 'sellers'/'categories' tags are
+    # snapshotted beforehand to catch edits made while the page was built.
+    variant = 'member' if session.get('user_id') else 'guest'
+    cache_key = f"product_html:{product_id}:{variant}"
+    page = _page_cache.get(cache_key)
+    if page is None:
+        started = time.perf_counter()
+        versions = _page_cache.snapshot([f"product:{product_id}", 'sellers', 'categories'])
+        product, reviews = _load_product_detail(product_id)
+        if product is None:
+            flash("Product not found.")
+            return redirect(url_for('products'))
+        body = render_template('_product_detail_body.html', product=product, reviews=reviews)
+        page = {'title': product['title'], 'body': body}
+        tags = [f"product:{product_id}"]
+        if product['seller_id']:
+            tags.append(f"seller:{product['seller_id']}")
+        if product.get('category_id'):
+            tags.append(f"category:{product['category_id']}")
+        for c in product.get('categories') or []:
+            tags.append(f"category:{c['id']}")
+        _page_cache.set(cache_key, page, ttl=600, tags=tags, versions=versions)
+        _page_cache.record_render(time.perf_counter() - started)
+    _record_recently_viewed(product_id)
+    html = render_template('product_detail.html', page_title=page['title'], product_body=page['body'])
     return Response(html, mimetype='text/html')
 
 
@@ -1012,7 +1101,7 @@ def submit_review(product_id):
     cur.execute("INSERT INTO reviews (product_id, user_id, title, body, rating, status) VALUES (?, ?, ?, ?, ?, 'pending')", (product_id, uid, title, body, rating))
     conn.commit()
     # invalidate product page cache so pending state doesn't show stale content (admin will approve later)
-    _cache.delete(f"product_html:{product_id}")
+    invalidate_cache(f"product:{product_id}")
     conn.close()
     flash('Review submitted and awaiting moderation.')
     return redirect(url_for('product_detail', product_id=product_id))
@@ -1021,59 +1110,28 @@ def submit_review(product_id):
 @app.route('/cart')
 def cart_view():
     cart = ensure_cart()
-    items = []
-    if cart:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        for pid, qty in cart.items():
-            cur.execute("SELECT id, title, price FROM products WHERE id = ? AND is_active = 1", (pid,))
-            product = cur.fetchone()
-            if product:
-                items.append({
-                    'product': product,
-                    'quantity': qty,
-                    'line_total': float(product['price']) * qty
-                })
-        conn.close()
-    total_items, total_amount = cart_total_items_and_amount(cart)
+    summary = price_cart(cart)
     # Load recently viewed products for display on the cart page
     recently_viewed_products = []
     try:
         rv_ids = session.get('recently_viewed', []) or []
         rv_ids = [int(x) for x in rv_ids][:3]
         if rv_ids:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            for pid in rv_ids:
-                try:
-                    cur.execute(
-                        "SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, u.business_name, u.rating, u.username AS seller_username FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.id = ? AND p.is_active = 1",
-                        (pid,)
-                    )
-                    r = cur.fetchone()
-                    if r:
-                        recently_viewed_products.append(r)
-                except Exception:
-                    continue
-            conn.close()
+            recently_viewed_products = _summaries.get_many(rv_ids, get_read_connection)
     except Exception:
         recently_viewed_products = []
 
-    return render_template('cart.html', items=items, total_items=total_items, total_amount=total_amount, recently_viewed_products=recently_viewed_products)
+    return render_template('cart.html', items=summary.items, total_items=summary.total_items, total_amount=summary.total_amount, recently_viewed_products=recently_viewed_products)
 
 @app.route('/cart/add', methods=['POST'])
 @limiter.limit("60 per minute")
 def cart_add():
     product_id = request.form.get('product_id')
     qty = int(request.form.get('quantity', 1))
-    # ensure product exists and respect stock limits
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id, stock FROM products WHERE id = ? AND is_active = 1", (product_id,))
-        prod = cur.fetchone()
-    finally:
-        conn.close()
+    # one snapshot of the cart's products plus the one being added
+    cart = dict(ensure_cart())
+    summary = price_cart(cart, extra_ids=[product_id])
+    prod = summary.products.get(str(product_id))
 
     if not prod:
         flash("Product not found.")
@@ -1081,12 +1139,11 @@ def cart_add():
 
     # stock == None/NULL means unlimited
     stock = prod['stock']
-    cart = ensure_cart()
-    cart = dict(cart)
     current = cart.get(product_id, 0)
     add_requested = max(1, qty)
     if stock is not None:
-        available = stock - current
+        # hold the stock for this cart; units other carts hold aren't available
+        available = hold_stock(product_id, current + add_requested) - current
         if available <= 0:
             wants_json = request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.accept_mimetypes.accept_json
             if wants_json:
@@ -1098,8 +1155,9 @@ def cart_add():
         add_amount = add_requested
 
     cart[product_id] = current + add_amount
-    session['cart'] = cart
-    total_items, total_amount = cart_total_items_and_amount(cart)
+    save_cart(cart)
+    summary = cart_pricing.price_cart(cart, summary.products)
+    total_items, total_amount = summary.total_items, summary.total_amount
     wants_json = request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.accept_mimetypes.accept_json
     if wants_json:
         # include how many were actually added and a helpful message
@@ -1123,43 +1181,51 @@ def cart_add():
         flash("Added to cart.")
     return redirect(request.form.get('next') or url_for('cart_view'))
 
+def _cart_summary_validators():
+    if not CONDITIONAL_GET:
+        return None
+    # the lines come from one primary-key query; pricing is what a 304 saves
+    return [sorted(ensure_cart().items()), _page_cache.tag_version('content')], None
+
+
 @app.route('/cart/summary')
+@conditional(_cart_summary_validators)
 def cart_summary():
-    cart = ensure_cart()
-    total_items, total_amount = cart_total_items_and_amount(cart)
-    return jsonify({"total_items": total_items, "total_amount": float(total_amount)})
+    return jsonify(price_cart(ensure_cart()).to_dict())
 
 @app.route('/cart/update', methods=['POST'])
 def cart_update():
     cart = ensure_cart()
     cart = dict(cart)
-    # For each qty_<id> field, ensure quantity does not exceed stock
-    conn = get_db_connection()
-    cur = conn.cursor()
-    for pid, qty in request.form.items():
-        if not pid.startswith("qty_"):
-            continue
-        prod_id = pid[4:]
+    # For each qty_<id> field, ensure quantity does not exceed stock; stock for
+    # every product involved comes from one snapshot. Fields whose id isn't a
+    # product id are ignored.
+    fields = [(k[4:], v) for k, v in request.form.items()
+              if k.startswith("qty_") and k[4:].isascii() and k[4:].isdigit()]
+    products = price_cart(cart, extra_ids=[pid for pid, _ in fields]).products
+    wanted = {}
+    holds = {}
+    for prod_id, qty in fields:
         try:
             q = int(qty)
         except ValueError:
             q = 0
-        if q <= 0:
-            cart.pop(prod_id, None)
-            continue
-
-        # check stock for this product
-        cur.execute("SELECT stock FROM products WHERE id = ? AND is_active = 1", (prod_id,))
-        r = cur.fetchone()
-        if r and r['stock'] is not None:
-            stock = r['stock']
-            if q > stock:
-                q = stock
-                flash(f"Quantity for product {prod_id} reduced to available stock ({stock}).")
-
-        cart[prod_id] = q
-    conn.close()
-    session['cart'] = cart
+        # clamp to the snapshot's stock (0 for archived or deleted products)
+        r = products.get(prod_id)
+        wanted[prod_id] = q
+        cart[prod_id] = cart_pricing.clamp_quantity(r, q)
+        if cart[prod_id] <= 0 or r['stock'] is not None:
+            holds[prod_id] = max(0, cart[prod_id])
+    # re-hold (or release) every stocked line in one transaction; other carts'
+    # holds may lower the quantities further
+    if holds:
+        cart.update(hold_stocks(holds))
+    for prod_id, q in wanted.items():
+        if cart[prod_id] <= 0:
+            cart.pop(prod_id)
+        elif cart[prod_id] < q:
+            flash(f"Quantity for product {prod_id} reduced to available stock ({cart[prod_id]}).")
+    save_cart(cart)
     flash("Cart updated.")
     return redirect(url_for('cart_view'))
 
@@ -1168,7 +1234,8 @@ def cart_remove(product_id):
     cart = ensure_cart()
     cart = dict(cart)
     cart.pop(str(product_id), None)
-    session['cart'] = cart
+    release_stock(product_id)
+    save_cart(cart)
     flash("Removed item.")
     return redirect(url_for('cart_view'))
 
@@ -1218,6 +1285,7 @@ def register():
         session.permanent = True
         session['user_id'] = user_id
         session['username'] = username
+        attach_cart_to_user(user_id)
         flash("Registered and logged in.")
         next_url = request.args.get('next') or url_for('index')
         return redirect(next_url)
@@ -1240,6 +1308,7 @@ def login():
         session.permanent = True
         session['user_id'] = user['id']
         session['username'] = user['username']
+        attach_cart_to_user(user['id'])
         flash("Logged in.")
         return redirect(request.args.get('next') or url_for('index'))
     return render_template('login.html')
@@ -1248,6 +1317,8 @@ def login():
 def logout():
     session.pop('user_id', None)
     session.pop('username', None)
+    # the cart stays with the account and comes back on the next login
+    session.pop('cart_id', None)
     flash("Logged out.")
     return redirect(url_for('index'))
 
@@ -1263,28 +1334,6 @@ def checkout():
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # build items list for display and compute total (include stock for checks)
-    ids = list(cart.keys())
-    placeholders = ",".join("?" for _ in ids)
-    cur.execute(f"SELECT id, title, price, stock, seller_id FROM products WHERE id IN ({placeholders}) AND is_active = 1", ids)
-    rows = {str(r["id"]): r for r in cur.fetchall()}
-    from decimal import Decimal
-    items = []
-    total = Decimal('0.00')
-    for pid, qty in cart.items():
-        r = rows.get(str(pid))
-        if not r:
-            continue
-        # Use Decimal for currency arithmetic (safer than float)
-        try:
-            unit_price = Decimal(str(r['price']))
-        except Exception:
-            # fallback to 0.00 if price is malformed
-            unit_price = Decimal('0.00')
-        line_total = unit_price * Decimal(int(qty))
-        items.append({"product": r, "quantity": qty, "line_total": float(line_total)})
-        total += line_total
-
     if request.method == 'POST':
         name = request.form.get('name','').strip()
         email = request.form.get('email','').strip()
@@ -1293,21 +1342,15 @@ def checkout():
             flash("Please fill all fields.")
             return redirect(url_for('checkout'))
 
-        # re-validate stock for all items before creating order
-        insufficient = []
-        for pid, qty in cart.items():
-            prod = rows.get(str(pid))
-            if not prod:
-                insufficient.append((pid, 0, qty))
-                continue
-            stock = prod['stock']
-            if stock is not None and stock < qty:
-                insufficient.append((pid, stock, qty))
-        if insufficient:
+        # stock is re-validated and decremented atomically inside place_order()
+        try:
+            order_id, ordered = orders.place_order(conn, cart, session.get('user_id'), name, email, address,
+                                                   cart_id=session.get('cart_id'))
+        except orders.OutOfStock as e:
             # inform user and redirect back to cart so they can adjust
             msgs = []
-            for pid, avail, wanted in insufficient:
-                if avail == 0:
+            for pid, avail, wanted in e.shortages:
+                if not avail:
                     msgs.append(f"Product {pid} is no longer available.")
                 else:
                     msgs.append(f"Product {pid} only has {avail} left (you wanted {wanted}).")
@@ -1315,60 +1358,30 @@ def checkout():
                 flash(m)
             conn.close()
             return redirect(url_for('cart_view'))
-
-        # create order (include shipping)
-        buyer_id = session.get('user_id')
-        # add flat shipping fee
-        shipping_fee = Decimal('5.00')
-        total_with_shipping = total + shipping_fee
-        cur.execute(
-            "INSERT INTO orders (buyer_id, buyer_name, buyer_email, shipping_address, total) VALUES (?, ?, ?, ?, ?)",
-            (buyer_id, name, email, address, float(total_with_shipping))
-        )
-        order_id = cur.lastrowid
-
-        # save address for user (avoid duplicates due to UNIQUE constraint)
-        try:
-            if buyer_id:
-                cur.execute("INSERT OR IGNORE INTO addresses (user_id, label, address_text) VALUES (?, ?, ?)",
-                            (buyer_id, None, address))
-        except Exception:
-            pass
-
-        # insert order items and reduce stock
-        for pid, qty in cart.items():
-            prod = rows.get(str(pid))
-            if not prod:
-                continue
-            # store unit_price as float for DB (serialize Decimal safely)
-            try:
-                unit_price = float(Decimal(str(prod['price'])))
-            except Exception:
-                unit_price = 0.0
-            cur.execute("INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)",
-                        (order_id, int(pid), qty, unit_price))
-            # decrement stock if not NULL
-            cur.execute("UPDATE products SET stock = stock - ? WHERE id = ? AND stock IS NOT NULL", (qty, int(pid)))
-            # increment seller's total_sales if seller_id present
-            seller_id = prod.get('seller_id') if isinstance(prod, dict) else prod['seller_id']
-            if seller_id:
-                cur.execute("UPDATE users SET total_sales = COALESCE(total_sales, 0) + ? WHERE id = ?", (qty, seller_id))
-        conn.commit()
+        except orders.CheckoutBusy:
+            conn.close()
+            flash("We're very busy right now. Please try placing your order again.")
+            return redirect(url_for('checkout'))
         conn.close()
-        session.pop('cart', None)
+        # product pages show stock levels
+        invalidate_cache(*[f"product:{line.product_id}" for line in ordered.lines])
+        save_cart({})
 
         # redirect to order confirmation page (new)
         flash("Order placed successfully!")
         return redirect(url_for('order_confirmation', order_id=order_id))
 
-    # GET: prefill name/email if available
+    # GET: items and total for display, prefill name/email if available
+    summary = cart_pricing.price_cart(cart, cart_pricing.load_products(conn, cart.keys()))
+    items = summary.items
+    total = summary.total_amount
     cur.execute("SELECT username, email FROM users WHERE id = ?", (session.get('user_id'),))
     u = cur.fetchone()
     conn.close()
     pre_name = u['username'] if u else ''
     pre_email = u['email'] if u else ''
     # include shipping in the displayed total
-    shipping_fee = Decimal('5.00')
+    shipping_fee = orders.SHIPPING_FEE
     total_with_shipping = total + shipping_fee
     return render_template('checkout.html', items=items, total_amount=float(total_with_shipping), shipping_fee=float(shipping_fee), pre_name=pre_name, pre_email=pre_email)
 
@@ -1434,8 +1447,9 @@ def address_suggestions():
     return jsonify([{"id": r["id"], "label": r["label"], "address": r["address_text"]} for r in rows])
 
 @app.route('/seller/<int:seller_id>')
+@conditional(lambda seller_id: _tag_validators(['content'], [request.full_path]))
 def seller_profile(seller_id):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute(
         "SELECT id, username, business_name, seller_description, rating, total_sales, logo_url FROM users WHERE id = ?",
@@ -1445,11 +1459,7 @@ def seller_profile(seller_id):
 
     products = []
     if seller:
-        cur.execute(
-            "SELECT id, title, description, price, stock, created_at, image_url FROM products WHERE seller_id = ? AND is_active = 1 ORDER BY created_at DESC",
-            (seller_id,)
-        )
-        products = cur.fetchall()
+        products = _summaries.get_many(repository.seller_product_ids(conn, seller_id), get_read_connection)
 
     conn.close()
     return render_template('seller_profile.html', seller=seller, products=products)
@@ -1483,20 +1493,7 @@ def seller_contact(seller_id):
                 return jsonify({"ok": False, "error": "Please fill in your name, email and message."}), 400
             return render_template('seller_contact.html', seller=seller, form=request.form)
 
-        # store message for review (table created on demand)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS seller_messages (
-                id INTEGER PRIMARY KEY,
-                seller_id INTEGER,
-                sender_name TEXT,
-                sender_email TEXT,
-                subject TEXT,
-                message TEXT,
-                created_at TEXT DEFAULT (datetime('now'))
-            )
-            """
-        )
+        # store message for review
         cur.execute("INSERT INTO seller_messages (seller_id, sender_name, sender_email, subject, message) VALUES (?, ?, ?, ?, ?)",
                     (seller_id, name, email, subject, message))
         conn.commit()
@@ -1516,10 +1513,8 @@ def seller_contact(seller_id):
 @limiter.limit("3 per hour")
 @login_required
 def apply_seller():
-    # ensure applications table exists with expected schema
     conn = get_db_connection()
     cur = conn.cursor()
-    ensure_seller_applications_table(conn)
 
     if request.method == 'POST':
         business_name = request.form.get('business_name','').strip() or None
@@ -1542,9 +1537,6 @@ def apply_seller():
 def admin_index():
     conn = get_db_connection()
     cur = conn.cursor()
-    # ensure applications and reviews tables exist so the subqueries below won't fail
-    ensure_seller_applications_table(conn)
-    ensure_reviews_table(conn)
     cur.execute("""
         SELECT
           (SELECT COUNT(*) FROM products WHERE is_active = 1) AS products_count,
@@ -1558,6 +1550,22 @@ def admin_index():
     return render_template('admin/dashboard.html', stats=stats)
 
 
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Runtime counters for capacity planning (connection pools and caches)."""
+    return jsonify({
+        'db_pool': _db_pool.stats(),
+        'db_read_pool': _db_read_pool.stats(),
+        'cache': _cache.stats(),
+        'page_cache': _page_cache.stats(),
+        'featured': _featured.stats(),
+        'product_summaries': _summaries.stats(),
+        'principals': _principals.stats(),
+        'catalog_queries': repository.stats(),
+    })
+
+
 @app.route('/fong')
 @login_required
 def fong_page():
@@ -1626,7 +1634,6 @@ def admin_order_detail(order_id):
 def admin_seller_applications():
     conn = get_db_connection()
     cur = conn.cursor()
-    ensure_seller_applications_table(conn)
     cur.execute("SELECT sa.id, sa.user_id, sa.business_name, sa.seller_description, sa.logo_url, sa.status, sa.created_at, u.username, u.email FROM seller_applications sa LEFT JOIN users u ON sa.user_id = u.id ORDER BY sa.created_at DESC")
     applications = cur.fetchall()
     conn.close()
@@ -1662,34 +1669,25 @@ def admin_review_action(review_id, action):
         conn.close()
         flash('Review not found.')
         return redirect(url_for('admin_reviews'))
-    if action == 'approve':
-        cur.execute("UPDATE reviews SET status = 'approved' WHERE id = ?", (review_id,))
-        # Recalculate product rating and the owning seller's rating
-        try:
-            recalc_product_rating(conn, r['product_id'])
-            # fetch seller id for this product and update their rating
-            cur.execute("SELECT seller_id FROM products WHERE id = ?", (r['product_id'],))
-            pr = cur.fetchone()
-            if pr and pr['seller_id']:
-                recalc_seller_rating(conn, pr['seller_id'])
-        except Exception:
-            pass
-        flash('Review approved.')
-    else:
-        cur.execute("UPDATE reviews SET status = 'rejected' WHERE id = ?", (review_id,))
-        # Recalculate product rating and owning seller's rating to exclude this review
-        try:
-            recalc_product_rating(conn, r['product_id'])
-            cur.execute("SELECT seller_id FROM products WHERE id = ?", (r['product_id'],))
-            pr = cur.fetchone()
-            if pr and pr['seller_id']:
-                recalc_seller_rating(conn, pr['seller_id'])
-        except Exception:
-            pass
-        flash('Review rejected.')
+    new_status = 'approved' if action == 'approve' else 'rejected'
+    # only move the review on from the status read above: if another moderator
+    # changed it meanwhile, the totals were adjusted by that request
+    cur.execute("UPDATE reviews SET status = ? WHERE id = ? AND status IS ?", (new_status, review_id, r['status']))
+    if cur.rowcount != 1:
+        conn.rollback()
+        conn.close()
+        flash('Review was moderated by someone else meanwhile; please check it again.')
+        return redirect(url_for('admin_reviews'))
+    # adjust the product's and its seller's rating totals in the same transaction
+    ratings.review_status_changed(conn, r['product_id'], r['rating'], r['status'], new_status)
+    cur.execute("SELECT seller_id FROM products WHERE id = ?", (r['product_id'],))
+    pr = cur.fetchone()
+    flash('Review approved.' if action == 'approve' else 'Review rejected.')
     conn.commit()
-    # invalidate product page cache
-    _cache.delete(f"product_html:{r['product_id']}")
+    # invalidate the product page, and every page showing the seller's (changed) rating
+    invalidate_cache(f"product:{r['product_id']}")
+    if pr and pr['seller_id']:
+        invalidate_cache(f"seller:{pr['seller_id']}")
     conn.close()
     return redirect(url_for('admin_reviews'))
 
@@ -1718,6 +1716,8 @@ def admin_seller_application_action(app_id, action):
         )
         # remove the application after approval
         cur.execute("DELETE FROM seller_applications WHERE id = ?", (app_id,))
+        invalidate_cache(f"seller:{app_row['user_id']}")
+        invalidate_principal(app_row['user_id'])
         flash('Application approved and user promoted to seller.')
     else:
         # remove application on rejection
@@ -1776,6 +1776,8 @@ def admin_category_new():
         try:
             cur.execute("INSERT INTO categories (name, slug, description) VALUES (?, ?, ?)", (name, slug, description))
             conn.commit()
+            # the listing's category menu
+            invalidate_cache(f"category:{cur.lastrowid}")
             flash('Category created.')
             return redirect(url_for('admin_categories'))
         except sqlite3.IntegrityError:
@@ -1807,6 +1809,7 @@ def admin_category_edit(cat_id):
         try:
             cur.execute("UPDATE categories SET name = ?, slug = ?, description = ? WHERE id = ?", (name, slug, description, cat_id))
             conn.commit()
+            invalidate_cache(f"category:{cat_id}")
             flash('Category updated.')
             conn.close()
             return redirect(url_for('admin_categories'))
@@ -1825,9 +1828,11 @@ def admin_category_delete(cat_id):
     cur = conn.cursor()
     # disassociate products from this category
     cur.execute("UPDATE products SET category_id = NULL WHERE category_id = ?", (cat_id,))
+    facets.category_deleted(conn, cat_id)
     cur.execute("DELETE FROM categories WHERE id = ?", (cat_id,))
     conn.commit()
     conn.close()
+    invalidate_cache(f"category:{cat_id}")
     flash('Category deleted (products unassigned).')
     return redirect(url_for('admin_categories'))
 
@@ -1891,14 +1896,15 @@ def admin_product_new():
                 except Exception:
                     continue
                 cur.execute("INSERT OR IGNORE INTO product_categories (product_id, category_id) VALUES (?, ?)", (new_id, cidi))
-            conn.commit()
         except Exception:
             pass
+        # facet counts change in the same transaction as the product
+        facets.product_changed(conn, new_id, frozenset())
         conn.commit()
         # invalidate sitemap cache and the new product page (defensive)
-        _cache.delete('sitemap_xml')
-        _cache.delete(f"product_html:{new_id}")
+        invalidate_cache(f"product:{new_id}", 'catalog')
         conn.close()
+        process_product_image(image_url, new_id)
         flash("Product created.")
         return redirect(url_for('admin_products'))
     # GET
@@ -1982,12 +1988,20 @@ def admin_product_edit(product_id):
         if image_url and not (image_url.startswith('http://') or image_url.startswith('https://') or image_url.startswith('/')):
             image_url = f"/static/img/{image_url}"
 
+        old_seller_id = product.get('seller_id')
+        try:
+            new_seller_id = int(seller_id) if seller_id else None
+        except ValueError:
+            new_seller_id = None
+        facets_before = facets.membership(conn, product_id)
         if image_url is not None:
             cur.execute("UPDATE products SET seller_id = ?, title = ?, description = ?, price = ?, stock = ?, image_url = ?, category_id = ? WHERE id = ?",
                 (seller_id, title, description, price_val, stock_val, image_url, category_id, product_id))
         else:
             cur.execute("UPDATE products SET seller_id = ?, title = ?, description = ?, price = ?, stock = ?, category_id = ? WHERE id = ?",
                 (seller_id, title, description, price_val, stock_val, category_id, product_id))
+        # the product's review totals move with it to its new seller
+        ratings.product_seller_changed(conn, product_id, old_seller_id, new_seller_id)
         # update many-to-many category associations
         try:
             # remove existing links
@@ -1998,15 +2012,19 @@ def admin_product_edit(product_id):
                 except Exception:
                     continue
                 cur.execute("INSERT OR IGNORE INTO product_categories (product_id, category_id) VALUES (?, ?)", (product_id, cidi))
-            conn.commit()
         except Exception:
             pass
+        # facet counts change in the same transaction as the product
+        facets.product_changed(conn, product_id, facets_before)
         # commit and redirect after POST
         conn.commit()
-        # invalidate cache for this product and sitemap
-        _cache.delete(f"product_html:{product_id}")
-        _cache.delete('sitemap_xml')
+        # invalidate cache for this product and sitemap, and both sellers' pages on a reassignment
+        tags = [f"product:{product_id}", 'catalog']
+        if new_seller_id != old_seller_id:
+            tags += [f"seller:{sid}" for sid in (old_seller_id, new_seller_id) if sid]
+        invalidate_cache(*tags)
         conn.close()
+        process_product_image(image_url, product_id)
         flash("Product updated.")
         return redirect(url_for('admin_products'))
 
@@ -2023,10 +2041,6 @@ def admin_product_edit(product_id):
 def admin_product_delete(product_id):
     conn = get_db_connection()
     cur = conn.cursor()
-    # capture seller before deleting so we can update their aggregated rating
-    cur.execute("SELECT seller_id FROM products WHERE id = ?", (product_id,))
-    pr = cur.fetchone()
-    seller_id = pr['seller_id'] if pr else None
     # Prevent deleting products that are referenced by order_items (historical orders)
     try:
         cur.execute("SELECT COUNT(1) AS cnt FROM order_items WHERE product_id = ?", (product_id,))
@@ -2040,17 +2054,12 @@ def admin_product_delete(product_id):
         pass
 
     # Archive the product instead of deleting
+    facets_before = facets.membership(conn, product_id)
     cur.execute("UPDATE products SET is_active = 0 WHERE id = ?", (product_id,))
+    facets.product_changed(conn, product_id, facets_before)
     conn.commit()
     # invalidate cache for this product and sitemap
-    _cache.delete(f"product_html:{product_id}")
-    _cache.delete('sitemap_xml')
-    # Recalculate seller rating in case reviews or product visibility changed
-    try:
-        if seller_id:
-            recalc_seller_rating(conn, seller_id)
-    except Exception:
-        pass
+    invalidate_cache(f"product:{product_id}", 'catalog')
     conn.close()
     # Write a short debug log entry so we can confirm the route was reached and DB updated
     try:
@@ -2082,15 +2091,11 @@ def admin_product_toggle(product_id):
     except Exception:
         current = 1
     new_state = 0 if current == 1 else 1
+    facets_before = facets.membership(conn, product_id)
     cur.execute("UPDATE products SET is_active = ? WHERE id = ?", (new_state, product_id))
+    facets.product_changed(conn, product_id, facets_before)
     conn.commit()
-    _cache.delete(f"product_html:{product_id}")
-    _cache.delete('sitemap_xml')
-    try:
-        if p['seller_id']:
-            recalc_seller_rating(conn, p['seller_id'])
-    except Exception:
-        pass
+    invalidate_cache(f"product:{product_id}", 'catalog')
     conn.close()
     wants_json = (request.headers.get('X-Requested-With') == 'XMLHttpRequest') or request.is_json or request.headers.get('Accept','').lower().find('application/json') != -1
     if wants_json:
@@ -2124,7 +2129,9 @@ def dev_archive_product(product_id):
         conn.close()
         return jsonify({'ok': False, 'error': 'Product not found'}), 404
     try:
+        facets_before = facets.membership(conn, product_id)
         cur.execute('UPDATE products SET is_active = 0 WHERE id = ?', (product_id,))
+        facets.product_changed(conn, product_id, facets_before)
         conn.commit()
         try:
             with open(os.path.join(os.path.dirname(__file__), 'archive.log'), 'a', encoding='utf-8') as _lf:
@@ -2139,6 +2146,16 @@ def dev_archive_product(product_id):
 # Serve service worker from root so it controls the whole origin
 @app.route('/sw.js')
 def service_worker():
+    # with an asset build, name the cache after the build so clients drop stale assets
+    if _assets.version:
+        try:
+            with open(os.path.join(app.root_path, 'static', 'sw.js'), encoding='utf-8') as f:
+                js = re.sub(r"const CACHE_NAME = '[^']*';", f"const CACHE_NAME = 'cardhaven-{_assets.version}';", f.read(), count=1)
+            resp = Response(js, mimetype='application/javascript')
+            resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+        except OSError:
+            pass
     # serve the file from the static folder
     try:
         return send_from_directory(os.path.join(app.root_path, 'static'), 'sw.js', mimetype='application/javascript')
@@ -2172,12 +2189,8 @@ def seller_required(f):
         uid = session.get('user_id')
         if not uid:
             return redirect(url_for('login', next=request.path))
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT is_seller FROM users WHERE id = ?", (uid,))
-        u = cur.fetchone()
-        conn.close()
-        if not (u and u['is_seller']):
+        principal = current_principal()
+        if not (principal and principal['is_seller']):
             flash('Seller access required.')
             return redirect(url_for('index'))
         return f(*args, **kwargs)
@@ -2281,14 +2294,15 @@ def seller_product_new():
                 except Exception:
                     continue
                 cur.execute("INSERT OR IGNORE INTO product_categories (product_id, category_id) VALUES (?, ?)", (new_id, cidi))
-            conn.commit()
         except Exception:
             pass
+        # facet counts change in the same transaction as the product
+        facets.product_changed(conn, new_id, frozenset())
         conn.commit()
         # invalidate sitemap and product cache
-        _cache.delete('sitemap_xml')
-        _cache.delete(f"product_html:{new_id}")
+        invalidate_cache(f"product:{new_id}", 'catalog')
         conn.close()
+        process_product_image(image_url, new_id)
         flash("Product created.")
         return redirect(url_for('seller_dashboard'))
 
@@ -2368,7 +2382,7 @@ def seller_product_edit(product_id):
             except Exception:
                 category_id = None
 
-        old_seller_id = product.get('seller_id')
+        facets_before = facets.membership(conn, product_id)
         if image_url is not None:
             cur.execute("UPDATE products SET title = ?, description = ?, price = ?, stock = ?, image_url = ?, category_id = ? WHERE id = ?",
                         (title, description, price_val, stock_val, image_url, category_id, product_id))
@@ -2384,25 +2398,15 @@ def seller_product_edit(product_id):
                 except Exception:
                     continue
                 cur.execute("INSERT OR IGNORE INTO product_categories (product_id, category_id) VALUES (?, ?)", (product_id, cidi))
-            conn.commit()
         except Exception:
             pass
+        # facet counts change in the same transaction as the product
+        facets.product_changed(conn, product_id, facets_before)
         conn.commit()
         # invalidate cache for this product and sitemap
-        _cache.delete(f"product_html:{product_id}")
-        _cache.delete('sitemap_xml')
-        # If seller assignment changed (edge case), recalc ratings for affected sellers
-        try:
-            cur.execute("SELECT seller_id FROM products WHERE id = ?", (product_id,))
-            pr = cur.fetchone()
-            new_seller_id = pr['seller_id'] if pr else None
-            if old_seller_id and old_seller_id != new_seller_id:
-                recalc_seller_rating(conn, old_seller_id)
-            if new_seller_id:
-                recalc_seller_rating(conn, new_seller_id)
-        except Exception:
-            pass
+        invalidate_cache(f"product:{product_id}", 'catalog')
         conn.close()
+        process_product_image(image_url, product_id)
         flash('Product updated.')
         return redirect(url_for('seller_dashboard'))
 
@@ -2455,11 +2459,12 @@ def seller_product_delete(product_id):
         pass
 
     # Archive the product instead of deleting
+    facets_before = facets.membership(conn, product_id)
     cur.execute("UPDATE products SET is_active = 0 WHERE id = ?", (product_id,))
+    facets.product_changed(conn, product_id, facets_before)
     conn.commit()
     # invalidate cache for this product and sitemap
-    _cache.delete(f"product_html:{product_id}")
-    _cache.delete('sitemap_xml')
+    invalidate_cache(f"product:{product_id}", 'catalog')
     conn.close()
     # Write debug log for seller archive actions
     try:
@@ -2496,15 +2501,11 @@ def seller_product_toggle(product_id):
     except Exception:
         current = 1
     new_state = 0 if current == 1 else 1
+    facets_before = facets.membership(conn, product_id)
     cur.execute("UPDATE products SET is_active = ? WHERE id = ?", (new_state, product_id))
+    facets.product_changed(conn, product_id, facets_before)
     conn.commit()
-    _cache.delete(f"product_html:{product_id}")
-    _cache.delete('sitemap_xml')
-    try:
-        if p['seller_id']:
-            recalc_seller_rating(conn, p['seller_id'])
-    except Exception:
-        pass
+    invalidate_cache(f"product:{product_id}", 'catalog')
     conn.close()
     wants_json = (request.headers.get('X-Requested-With') == 'XMLHttpRequest') or request.is_json or request.headers.get('Accept','').lower().find('application/json') != -1
     if wants_json:
@@ -2538,6 +2539,7 @@ def admin_user_toggle_admin(user_id):
     cur.execute("UPDATE users SET is_admin = ? WHERE id = ?", (new, user_id))
     conn.commit()
     conn.close()
+    invalidate_principal(user_id)
     flash("User admin status updated.")
     return redirect(url_for('admin_users'))
 
@@ -2557,6 +2559,7 @@ def admin_user_toggle_seller(user_id):
     cur.execute("UPDATE users SET is_seller = ? WHERE id = ?", (new, user_id))
     conn.commit()
     conn.close()
+    invalidate_principal(user_id)
     flash("User seller status updated.")
     # if we just promoted them to seller, send admin to the seller details form to fill info
     if new == 1:
@@ -2601,6 +2604,9 @@ def admin_edit_seller(user_id):
                         (business_name, seller_description, rating, total_sales, user_id))
         conn.commit()
         conn.close()
+        # product pages show the seller's name, description and rating
+        invalidate_cache(f"seller:{user_id}")
+        invalidate_principal(user_id)
         flash("Seller details updated.")
         return redirect(url_for('admin_users'))
 
@@ -2619,6 +2625,9 @@ def admin_user_delete(user_id):
     cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
     conn.commit()
     conn.close()
+    invalidate_principal(user_id)
+    # their products lose the seller (ON DELETE SET NULL)
+    invalidate_cache(f"seller:{user_id}")
     flash("User deleted.")
     return redirect(url_for('admin_users'))
 
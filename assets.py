@@ -0,0 +1,110 @@
+"""Fingerprinted static assets.
+
+build() copies every file under static/ into static/dist/ with a content hash
+in its name (css/theme.css -> css/theme.3f9a1c2b7d.css), writes pre-gzipped
+(and, when the `brotli` package is installed, pre-brotli'd) siblings for
+text formats, and records the mapping in static/dist/manifest.json. Run it
+with `flask --app app build-assets` as a deploy step.
+
+Templates call static_url('css/theme.css'); with a manifest that resolves to
+the hashed file under /assets/, which app.py serves with a one-year immutable
+Cache-Control. Without a manifest (development) it falls back to the plain
+/static/ URL, so nothing breaks before the first build.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+# not fingerprinted: the build output itself, generated image variants (already
+# content-hashed, see images.py) and the service worker, which must keep its URL
+SKIP_DIRS = ('dist/', 'img/derived/')
+SKIP_FILES = ('sw.js',)
+
+# formats worth precompressing
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.webmanifest', '.ico', '.txt', '.xml', '.html')
+
+# encodings stored next to an asset, best first: (Accept-Encoding token, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _hashed_name(rel, digest):
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{digest}{ext}"
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Fingerprint and precompress every asset; returns the manifest dict."""
+    files = {}
+    for root, dirs, names in os.walk(static_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            if rel.startswith(SKIP_DIRS) or rel in SKIP_FILES or name.startswith('.'):
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(rel, hashlib.sha256(data).hexdigest()[:10])
+            files[rel] = hashed
+            dest = os.path.join(dist_dir, hashed)
+            if os.path.exists(dest):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(path, dest)
+            if rel.lower().endswith(COMPRESSIBLE):
+                with gzip.GzipFile(dest + '.gz', 'wb', compresslevel=9, mtime=0) as f:
+                    f.write(data)
+                if brotli is not None:
+                    with open(dest + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+    manifest = {
+        'version': hashlib.sha256(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()[:10],
+        'files': files,
+    }
+    os.makedirs(dist_dir, exist_ok=True)
+    tmp = os.path.join(dist_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(dist_dir, MANIFEST_NAME))
+    return manifest
+
+
+class AssetManifest:
+    """The build's logical name -> hashed name mapping, loaded once."""
+
+    def __init__(self, dist_dir=DIST_DIR):
+        self.dist_dir = dist_dir
+        self.files = {}
+        self.version = None
+        self.reload()
+
+    def reload(self):
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST_NAME), encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+            self.version = data.get('version')
+        except (OSError, ValueError):
+            self.files, self.version = {}, None
+
+    def lookup(self, filename):
+        """Hashed name for a static/ path, or None if it wasn't built."""
+        return self.files.get(filename.lstrip('/'))
+
+    def encoded_variant(self, path, accept_encodings):
+        """(path, encoding) of the best precompressed sibling the client accepts, or (path, None)."""
+        for token, suffix in ENCODINGS:
+            if token in accept_encodings and os.path.isfile(path + suffix):
+                return path + suffix, token
+        return path, None
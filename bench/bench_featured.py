@@ -0,0 +1,67 @@
+"""Home-page featured products: ORDER BY RANDOM() vs the sampled pool.
+
+For catalogs of 10k and 100k products (or --sizes), times picking 6 random
+active products with their seller fields the old way (ORDER BY RANDOM() over
+the joined catalog) against FeaturedSampler + ProductSummaries as index()
+does now, including the pool rebuilds forced every --refresh-every requests
+(standing in for catalog writes).
+
+    python bench/bench_featured.py [--sizes 10000 100000] [--requests 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import open_connection, storage_profile  # noqa: E402
+from featured import FeaturedSampler  # noqa: E402
+from seed import seed  # noqa: E402
+from summaries import ProductSummaries  # noqa: E402
+
+RANDOM_SQL = (
+    "SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, "
+    "u.business_name, u.rating, u.username AS seller_username "
+    "FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.is_active = 1 ORDER BY RANDOM() LIMIT 6"
+)
+
+
+def bench(path, requests, refresh_every):
+    conn = open_connection(path, pragmas=storage_profile('wal'), readonly=True)
+    started = time.perf_counter()
+    for _ in range(requests):
+        conn.execute(RANDOM_SQL).fetchall()
+    old = requests / (time.perf_counter() - started)
+
+    sampler = FeaturedSampler(pool_size=500, refresh_interval=3600)
+    summaries = ProductSummaries(max_entries=2048, ttl=60)
+    # both close what get_conn() hands them, as with the app's pooled connections
+    get_conn = lambda: open_connection(path, pragmas=storage_profile('wal'), readonly=True)  # noqa: E731
+    started = time.perf_counter()
+    for i in range(requests):
+        # a new version forces a rebuild, as a catalog write does in app.py
+        ids = sampler.sample(6, get_conn, version=i // refresh_every)
+        summaries.get_many(ids, get_conn)
+    new = requests / (time.perf_counter() - started)
+    conn.close()
+    return old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--refresh-every', type=int, default=100)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    print(f"{'products':>9} {'RANDOM() req/s':>15} {'pool req/s':>11}")
+    for size in args.sizes:
+        path = seed(os.path.join(tmp, f"featured-{size}.db"), products=size, reviews_per_product=0)
+        old, new = bench(path, args.requests, args.refresh_every)
+        print(f"{size:>9} {old:>15.1f} {new:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Catalog reader throughput while checkouts are writing.
+
+Runs reader threads doing listing-page queries (repository.listing) on
+query_only connections next to writer threads placing orders
+(orders.place_order), once per storage profile, and reports reads/s and
+orders/s. With the rollback journal ('safe') readers stall while a writer
+commits; with WAL they don't.
+
+    python bench/bench_readers.py [--db bench.db] [--products 20000] [--seconds 5]
+
+Without --db (or when the file does not exist) a synthetic catalog is seeded
+first (see seed.py).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orders  # noqa: E402
+import repository  # noqa: E402
+from database import open_connection, storage_profile  # noqa: E402
+from seed import seed  # noqa: E402
+
+
+def run(path, profile, readers, writers, seconds):
+    pragmas = storage_profile(profile)
+    # the journal mode is a property of the file; switch it before the threads start
+    conn = open_connection(path, pragmas=pragmas)
+    product_ids = [r[0] for r in conn.execute(
+        "SELECT id FROM products WHERE is_active = 1 AND stock IS NULL LIMIT 200")]
+    conn.close()
+    stop = threading.Event()
+    counts = {'reads': 0, 'orders': 0, 'busy': 0}
+    lock = threading.Lock()
+
+    def reader():
+        c = open_connection(path, pragmas=pragmas, readonly=True)
+        n = 0
+        while not stop.is_set():
+            repository.listing(c, 'created_at', False, 25)
+            n += 1
+        with lock:
+            counts['reads'] += n
+        c.close()
+
+    def writer(k):
+        c = open_connection(path, pragmas=pragmas)
+        n = busy = 0
+        i = k
+        while not stop.is_set():
+            cart = {str(product_ids[i % len(product_ids)]): 1}
+            i += writers
+            try:
+                orders.place_order(c, cart, None, 'Bench', 'bench@example.com', '1 Bench St')
+                n += 1
+            except orders.CheckoutBusy:
+                busy += 1
+        with lock:
+            counts['orders'] += n
+            counts['busy'] += busy
+        c.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k != 'busy' else v for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if not os.path.exists(path):
+        seed(path, products=args.products)
+    for profile in ('safe', 'wal'):
+        r = run(path, profile, args.readers, args.writers, args.seconds)
+        print(f"{profile:>5}: {r['reads']:9.1f} listing reads/s  {r['orders']:7.1f} orders/s  "
+              f"({r['busy']} checkouts gave up on the lock)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Catalog reads: repository.py vs the ORM path the views used before.
+
+Times a /products page (25 newest products with seller and category) and a
+/product/<id> body (product, categories, approved reviews) through
+repository.py on a sqlite3 connection, and through Flask-SQLAlchemy the way
+the old ORM branch loaded them (lazy relationships, so one extra SELECT per
+seller/category/author touched) and with eager loading. Reports ms per call
+and SQL statements per call.
+
+    python bench/bench_repository.py [--db bench.db] [--products 20000] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import joinedload, selectinload  # noqa: E402
+
+import repository  # noqa: E402
+from database import open_connection, storage_profile  # noqa: E402
+from models import Product, Review, db  # noqa: E402
+from seed import seed  # noqa: E402
+
+PAGE_SIZE = 25
+
+
+def _card(p):
+    return {'id': p.id, 'title': p.title, 'description': p.description, 'price': p.price,
+            'created_at': p.created_at.isoformat() if p.created_at else '', 'stock': p.stock,
+            'image_url': p.image_url, 'seller_id': p.seller_id,
+            'business_name': p.seller.business_name if p.seller else None,
+            'rating': p.seller.rating if p.seller else None,
+            'category_name': p.category.name if p.category else None,
+            'category_slug': p.category.slug if p.category else None}
+
+
+def orm_listing(eager):
+    q = Product.query.filter(Product.is_active.is_(True))
+    if eager:
+        q = q.options(joinedload(Product.seller), joinedload(Product.category))
+    rows = q.order_by(Product.created_at.desc(), Product.id.desc()).limit(PAGE_SIZE).all()
+    return [_card(p) for p in rows]
+
+
+def orm_detail(product_id, eager):
+    q = Product.query.filter_by(id=product_id, is_active=True)
+    if eager:
+        q = q.options(joinedload(Product.seller), joinedload(Product.category), selectinload(Product.categories))
+    p = q.first()
+    product = _card(p)
+    product['categories'] = [{'id': c.id, 'name': c.name, 'slug': c.slug} for c in p.categories]
+    reviews = Review.query.filter_by(product_id=product_id, status='approved')
+    if eager:
+        reviews = reviews.options(joinedload(Review.author))
+    reviews = [{'id': r.id, 'title': r.title, 'body': r.body, 'rating': r.rating,
+                'author': r.author.username if r.author else None}
+               for r in reviews.order_by(Review.created_at.desc()).all()]
+    return product, reviews
+
+
+def _time(fn, repeat, reset=None):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+        if reset:
+            # a new session per request, as Flask-SQLAlchemy does
+            reset()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if not os.path.exists(path):
+        seed(path, products=args.products)
+
+    conn = open_connection(path, pragmas=storage_profile('wal'), readonly=True)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(path)
+    db.init_app(app)
+
+    with app.app_context():
+        orm_statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: orm_statements.append(a[2]))
+        product_id = repository.newest(conn, 1)[0]['id']
+        cases = (
+            ('listing', lambda: repository.listing(conn, 'created_at', False, PAGE_SIZE),
+             lambda: orm_listing(False), lambda: orm_listing(True)),
+            ('detail', lambda: repository.product_detail(conn, product_id),
+             lambda: orm_detail(product_id, False), lambda: orm_detail(product_id, True)),
+        )
+        print(f"{'':<8} {'repository':>18} {'ORM lazy':>18} {'ORM eager':>18}   (ms/call, statements)")
+        for name, repo, lazy, eager in cases:
+            results = []
+            for fn, log, reset in ((repo, statements, None), (lazy, orm_statements, db.session.remove),
+                                   (eager, orm_statements, db.session.remove)):
+                ms = _time(fn, args.repeat, reset)
+                del log[:]
+                fn()
+                results.append(f"{ms:10.3f} ms {len(log):3d}")
+                if reset:
+                    reset()
+            print(f"{name:<8} " + " ".join(f"{r:>18}" for r in results))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
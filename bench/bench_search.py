@@ -0,0 +1,68 @@
+"""/products search: LIKE scans vs the products_fts index.
+
+For a set of search terms, times the old approach (title/description LIKE
+'%term%' for the page plus a COUNT) against the FTS5 path the view uses now
+(repository.listing / listing_count with a MATCH expression from
+search.build_match_query), on a synthetic catalog of --products products.
+
+    python bench/bench_search.py [--db bench.db] [--products 100000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import repository  # noqa: E402
+import search  # noqa: E402
+from database import open_connection, storage_profile  # noqa: E402
+from seed import seed  # noqa: E402
+
+TERMS = ('dragon', 'foil holo', 'myth', 'vintage sealed deck', 'zzz')
+
+LIKE_PAGE_SQL = (
+    "SELECT p.id, p.title, p.price FROM products p WHERE p.is_active = 1 "
+    "AND (p.title LIKE ? OR p.description LIKE ?) ORDER BY p.created_at DESC, p.id DESC LIMIT 25"
+)
+LIKE_COUNT_SQL = "SELECT COUNT(*) FROM products p WHERE p.is_active = 1 AND (p.title LIKE ? OR p.description LIKE ?)"
+
+
+def _time(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if not os.path.exists(path):
+        seed(path, products=args.products)
+    conn = open_connection(path, pragmas=storage_profile('wal'), readonly=True)
+    print(f"{'term':<22} {'LIKE ms':>9} {'FTS ms':>9} {'matches':>8}")
+    for term in TERMS:
+        like = f"%{term}%"
+
+        def with_like():
+            conn.execute(LIKE_PAGE_SQL, (like, like)).fetchall()
+            return conn.execute(LIKE_COUNT_SQL, (like, like)).fetchone()[0]
+
+        match = search.build_match_query(term)
+
+        def with_fts():
+            repository.listing(conn, 'created_at', False, 25, match=match)
+            return repository.listing_count(conn, match=match)
+
+        print(f"{term:<22} {_time(with_like, args.repeat):9.2f} {_time(with_fts, args.repeat):9.2f} {with_fts():>8}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
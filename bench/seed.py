@@ -0,0 +1,81 @@
+"""Synthetic catalogs for the benchmarks in this directory.
+
+seed(path, products=N) builds a fresh database at `path` through the app's
+migrations and fills it with sellers, categories, products (with category
+links, reviews and facet counts) in a few executemany batches. The data is
+generated from a fixed random seed, so runs are comparable.
+
+    python bench/seed.py /tmp/bench.db 100000
+"""
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import facets  # noqa: E402
+import ratings  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+WORDS = ('magic', 'pokemon', 'lorcana', 'booster', 'pack', 'foil', 'holo', 'rare', 'mythic', 'promo',
+         'dragon', 'wizard', 'elf', 'goblin', 'knight', 'angel', 'demon', 'island', 'forest', 'mountain',
+         'swamp', 'plains', 'legendary', 'vintage', 'sealed', 'graded', 'mint', 'played', 'deck', 'bundle')
+
+CATEGORIES = ('Magic: The Gathering', 'Pokemon', 'Lorcana', 'Yu-Gi-Oh', 'Accessories', 'Sealed Product')
+
+
+def _text(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def seed(path, products=10000, sellers=50, buyers=50, reviews_per_product=1, seed_value=42):
+    """Create a database at `path` with a synthetic catalog; returns its path."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    run_migrations(conn)
+    # password hashes are irrelevant here; nobody logs in
+    conn.executemany(
+        "INSERT INTO users (username, email, password_hash, is_seller, business_name, seller_description) "
+        "VALUES (?, ?, 'x', ?, ?, ?)",
+        [(f"seller{i}", f"seller{i}@example.com", 1, f"Shop {i}", _text(rng, 8)) for i in range(sellers)]
+        + [(f"buyer{i}", f"buyer{i}@example.com", 0, None, None) for i in range(buyers)])
+    seller_ids = [r[0] for r in conn.execute("SELECT id FROM users WHERE is_seller = 1")]
+    buyer_ids = [r[0] for r in conn.execute("SELECT id FROM users WHERE is_seller = 0")]
+    conn.executemany("INSERT INTO categories (name, slug) VALUES (?, ?)",
+                     [(name, name.lower().replace(':', '').replace(' ', '-')) for name in CATEGORIES])
+    category_ids = [r[0] for r in conn.execute("SELECT id FROM categories")]
+
+    rows = []
+    for i in range(products):
+        rows.append((rng.choice(seller_ids), f"{_text(rng, 3).title()} #{i}", _text(rng, 25),
+                     round(rng.lognormvariate(2.5, 1.2), 2), rng.choice((None, rng.randint(0, 50))),
+                     rng.choice(category_ids), 0 if rng.random() < 0.05 else 1,
+                     f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"))
+    conn.executemany(
+        "INSERT INTO products (seller_id, title, description, price, stock, category_id, is_active, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    product_ids = [r[0] for r in conn.execute("SELECT id FROM products")]
+    conn.executemany("INSERT OR IGNORE INTO product_categories (product_id, category_id) VALUES (?, ?)",
+                     [(pid, rng.choice(category_ids)) for pid in product_ids if rng.random() < 0.3])
+    conn.executemany(
+        "INSERT INTO reviews (product_id, user_id, title, body, rating, status) VALUES (?, ?, ?, ?, ?, 'approved')",
+        [(pid, rng.choice(buyer_ids), _text(rng, 3), _text(rng, 20), rng.randint(1, 5))
+         for pid in product_ids for _ in range(reviews_per_product)])
+    conn.commit()
+    facets.rebuild(conn)
+    ratings.rebuild(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return path
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else 'bench.db'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    seed(target, products=count)
+    print(f"seeded {count} products into {target}")
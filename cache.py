@@ -0,0 +1,406 @@
+"""Caches used for rendered pages and fragments (product pages, sitemap).
+
+All backends implement the CacheBackend interface (get/set/delete/clear/stats),
+so app.py can pick one at startup:
+
+- LRUCache keeps entries in process memory. It caps both the number of entries
+  and their approximate size in bytes, expires entries on a monotonic clock,
+  sweeps expired keys periodically, and is safe to share between threads.
+- SQLiteCache stores entries in a small SQLite file that every worker process
+  on the host opens, so a page rendered by one gunicorn worker is served by the
+  others and a delete() in one worker invalidates the entry for all of them.
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def _sizeof(value):
+    """Approximate memory cost of a cached value in bytes.
+
+    Rendered HTML dominates what we cache, so strings/bytes are counted by their
+    length and containers by the sum of their items; anything else falls back to
+    sys.getsizeof.
+    """
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class CacheBackend:
+    """Interface shared by the cache backends.
+
+    Values must be JSON-serializable (strings, numbers, lists and dicts of them)
+    so that every backend can store them. get() returns None on a miss.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe LRU cache with per-entry TTL and entry/byte limits.
+
+    When either limit is exceeded the least recently used entries are evicted.
+    A single value larger than `max_bytes` is not stored at all.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=64 * 1024 * 1024, default_ttl=60, sweep_interval=30):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        # key -> (expires_at, value, size); ordered from least to most recently used
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def _remove(self, key):
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def _maybe_sweep(self, now):
+        # amortized cleanup: at most once per sweep_interval, on a normal get/set
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        expired = [k for k, (expires, _, _) in self._store.items() if expires <= now]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._store.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._store.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        now = time.monotonic()
+        size = _sizeof(value)
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._maybe_sweep(now)
+            self._remove(key)
+            if size > self.max_bytes:
+                self.rejected += 1
+                return
+            self._store[key] = (expires, value, size)
+            self._bytes += size
+            while len(self._store) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._store))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._store),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'rejected': self.rejected,
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """Cache shared by all processes on a host, stored in a SQLite file.
+
+    Each thread keeps its own connection to the cache file (WAL mode, no fsync:
+    the contents are disposable). Expiry uses wall-clock time because the
+    monotonic clock is not comparable between processes. When the table grows
+    past `max_entries` the entries closest to expiry are dropped; that check and
+    the expired-row sweep run at most once per `sweep_interval`.
+    """
+
+    def __init__(self, path, max_entries=10000, default_ttl=60, sweep_interval=30):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at ON cache_entries(expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # autocommit: every statement is its own short transaction
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+        return conn
+
+    def _maybe_sweep(self, conn, now):
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        cur = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        expired = max(cur.rowcount, 0)
+        cur = conn.execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            " SELECT key FROM cache_entries ORDER BY expires_at"
+            " LIMIT max(0, (SELECT COUNT(*) FROM cache_entries) - ?))",
+            (self.max_entries,)
+        )
+        evicted = max(cur.rowcount, 0)
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        self._maybe_sweep(conn, now)
+        payload = json.dumps(value)
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, size) VALUES (?, ?, ?, ?)",
+            (key, payload, expires, len(payload))
+        )
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache_entries")
+
+    def stats(self):
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'sqlite',
+                'path': self.path,
+                'entries': row[0],
+                'max_entries': self.max_entries,
+                'bytes': row[1],
+                # hit/miss counters are per worker process
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def make_cache(backend='memory', path=None, max_entries=2048, max_bytes=64 * 1024 * 1024):
+    """Build the cache backend named by `backend` ('memory' or 'sqlite')."""
+    if backend == 'memory':
+        return LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("the sqlite cache backend needs a path")
+        return SQLiteCache(path, max_entries=max_entries)
+    raise ValueError(f"unknown cache backend: {backend!r}")
+
+
+class PageCache:
+    """Page/fragment cache with tag-based invalidation on top of a cache backend.
+
+    Entries are stored together with the tags they depend on (e.g. 'product:12',
+    'seller:3', 'category:2', 'catalog') and the version each tag had when the
+    entry was rendered. invalidate('seller:3') just bumps that tag's version, so
+    every entry that recorded the old version is treated as a miss; nothing has
+    to enumerate the dependent keys, and it works the same on every backend
+    (and across worker processes with the shared one). Tag versions are random
+    tokens, so a version that was evicted or expired can never be mistaken for
+    the one an entry recorded.
+
+    Hit/miss counters and timings (lookup latency, and how long misses spend
+    loading + rendering) are kept for /admin/metrics.
+    """
+    # tag versions must outlive the entries that reference them
+    tag_ttl = 7 * 24 * 3600
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+        self.lookup_time = 0.0
+        self.renders = 0
+        self.render_time = 0.0
+
+    @staticmethod
+    def _tag_key(tag):
+        return f"tag:{tag}"
+
+    def _tag_version(self, tag, create=True):
+        version = self.backend.get(self._tag_key(tag))
+        if version is None and create:
+            version = uuid.uuid4().hex
+            self.backend.set(self._tag_key(tag), version, ttl=self.tag_ttl)
+            # a new token is as good as an invalidation for Last-Modified purposes
+            self.backend.set(f"tagtime:{tag}", time.time(), ttl=self.tag_ttl)
+        return version
+
+    def tag_version(self, tag):
+        """Current version token of a tag; it changes on every invalidate(tag)."""
+        return self._tag_version(tag)
+
+    def tag_modified(self, tag):
+        """Unix time the tag's current version was set, or None if unknown (e.g. expired)."""
+        return self.backend.get(f"tagtime:{tag}")
+
+    def get(self, key):
+        started = time.perf_counter()
+        entry = self.backend.get(key)
+        value = None
+        stale = False
+        if entry is not None:
+            tags = entry.get('tags') or {}
+            if all(self._tag_version(t, create=False) == v for t, v in tags.items()):
+                value = entry.get('value')
+            else:
+                stale = True
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.lookup_time += elapsed
+            if value is None:
+                self.misses += 1
+                if stale:
+                    self.stale += 1
+            else:
+                self.hits += 1
+        return value
+
+    def snapshot(self, tags):
+        """Current versions of `tags`, to pass to set() for a value loaded after this call."""
+        return {t: self._tag_version(t) for t in set(tags)}
+
+    def set(self, key, value, ttl=60, tags=(), versions=None):
+        """Store `value` as depending on `tags`.
+
+        `versions` is a snapshot() taken before the value was loaded. Tags in it
+        are recorded at their snapshot version, so an invalidation between the
+        load and this call turns the entry into a miss instead of caching stale
+        data under the new version. Snapshot tags not among `tags` (e.g. a coarse
+        'sellers' tag standing in for the seller the load turned up) make set()
+        skip storing when they changed.
+        """
+        recorded = {t: self._tag_version(t) for t in set(tags)}
+        for tag, version in (versions or {}).items():
+            if tag in recorded:
+                recorded[tag] = version
+            elif self._tag_version(tag) != version:
+                return
+        self.backend.set(key, {'value': value, 'tags': recorded}, ttl=ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def invalidate(self, *tags):
+        """Invalidate every entry that depends on any of `tags`."""
+        now = time.time()
+        for tag in set(tags):
+            self.backend.set(self._tag_key(tag), uuid.uuid4().hex, ttl=self.tag_ttl)
+            self.backend.set(f"tagtime:{tag}", now, ttl=self.tag_ttl)
+        with self._lock:
+            self.invalidations += len(set(tags))
+
+    def record_render(self, elapsed):
+        with self._lock:
+            self.renders += 1
+            self.render_time += elapsed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'lookup_time_avg': round(self.lookup_time / lookups, 6) if lookups else 0.0,
+                'renders': self.renders,
+                'render_time_avg': round(self.render_time / self.renders, 6) if self.renders else 0.0,
+                'invalidations': self.invalidations,
+            }
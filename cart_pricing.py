@@ -0,0 +1,115 @@
+"""Cart pricing from a single product snapshot.
+
+The cart views used to query products once per cart line and then again for
+the totals. Here every product a request needs is loaded with one query
+(load_products), and line totals, the cart total and stock clamping are all
+computed from that snapshot. price_cart() returns a CartSummary that
+cart_view, cart_add, cart_update, /cart/summary and checkout share.
+
+Carts are the session dict {product_id (str): quantity}. A product stock of
+NULL means unlimited.
+"""
+from decimal import Decimal
+
+PRODUCT_SQL = (
+    "SELECT id, title, price, stock, seller_id, image_url FROM products "
+    "WHERE is_active = 1 AND id IN ({})"
+)
+
+# stay well below SQLite's bound-parameter limit
+_CHUNK = 500
+
+
+def _price(value):
+    try:
+        return Decimal(str(value))
+    except Exception:
+        # malformed price: treat as 0.00 rather than failing the whole cart
+        return Decimal('0.00')
+
+
+def load_products(conn, ids):
+    """Return {str(product id): row dict} for the active products among `ids`."""
+    wanted = []
+    for i in ids:
+        try:
+            i = int(i)
+        except (TypeError, ValueError):
+            continue
+        if i not in wanted:
+            wanted.append(i)
+    products = {}
+    cur = conn.cursor()
+    for n in range(0, len(wanted), _CHUNK):
+        chunk = wanted[n:n + _CHUNK]
+        cur.execute(PRODUCT_SQL.format(",".join("?" for _ in chunk)), chunk)
+        for r in cur.fetchall():
+            products[str(r['id'])] = dict(r)
+    return products
+
+
+def clamp_quantity(product, quantity):
+    """Limit `quantity` to the product's stock. Returns 0 for unavailable products."""
+    if not product:
+        return 0
+    stock = product.get('stock')
+    if stock is not None and quantity > stock:
+        return max(0, int(stock))
+    return quantity
+
+
+class CartLine:
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = _price(product['price'])
+        self.line_total = self.unit_price * quantity
+
+    @property
+    def product_id(self):
+        return str(self.product['id'])
+
+    def as_item(self):
+        """Dict in the shape the cart/checkout templates use."""
+        return {'product': self.product, 'quantity': self.quantity, 'line_total': float(self.line_total)}
+
+
+class CartSummary:
+    """Priced view of a cart: its lines, totals and unavailable products."""
+
+    def __init__(self, lines, missing, products):
+        self.lines = lines
+        # product ids in the cart that are archived or no longer exist
+        self.missing = missing
+        self.products = products
+        self.total_items = sum(line.quantity for line in lines)
+        self.total_amount = sum((line.line_total for line in lines), Decimal('0.00'))
+
+    @property
+    def items(self):
+        return [line.as_item() for line in self.lines]
+
+    def insufficient_stock(self):
+        """[(product id, available, wanted)] for lines that exceed stock (0 = unavailable)."""
+        short = [(pid, 0, None) for pid in self.missing]
+        for line in self.lines:
+            stock = line.product.get('stock')
+            if stock is not None and stock < line.quantity:
+                short.append((line.product_id, stock, line.quantity))
+        return short
+
+    def to_dict(self):
+        return {'total_items': self.total_items, 'total_amount': float(self.total_amount)}
+
+
+def price_cart(cart, products):
+    """Price `cart` against a snapshot from load_products(); lines keep cart order."""
+    lines = []
+    missing = []
+    for pid, qty in (cart or {}).items():
+        product = products.get(str(pid))
+        if not product:
+            missing.append(str(pid))
+            continue
+        lines.append(CartLine(product, int(qty)))
+    return CartSummary(lines, missing, products)
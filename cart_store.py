@@ -0,0 +1,123 @@
+"""Server-side cart storage (`carts` / `cart_items` tables, migration 11).
+
+Carts used to be serialized into the signed session cookie, so every request
+carried (and re-signed) the whole cart. Now the session only keeps an opaque
+cart id and the lines live in the database. A cart is a dict
+{product_id (str): quantity}, kept in insertion order.
+
+Guest carts have no user_id. On login the guest cart is merged into the
+user's cart, stock holds included (or adopted if the user has none). Carts that have not been
+changed for a while are deleted by sweep().
+"""
+import secrets
+import time
+
+
+def new_cart_id():
+    return secrets.token_urlsafe(18)
+
+
+def load(conn, cart_id, user_id=None):
+    """Return the cart's lines, or {} when the cart doesn't exist or belongs to another user."""
+    cur = conn.cursor()
+    cur.execute("SELECT user_id FROM carts WHERE id = ?", (cart_id,))
+    row = cur.fetchone()
+    if row is None or (row[0] is not None and row[0] != user_id):
+        return {}
+    cur.execute("SELECT product_id, quantity FROM cart_items WHERE cart_id = ? ORDER BY id", (cart_id,))
+    return {str(r[0]): r[1] for r in cur.fetchall()}
+
+
+def _touch(cur, cart_id, user_id):
+    cur.execute(
+        "INSERT INTO carts (id, user_id) VALUES (?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET updated_at = datetime('now'), user_id = COALESCE(carts.user_id, excluded.user_id)",
+        (cart_id, user_id)
+    )
+
+
+def ensure(conn, cart_id, user_id=None):
+    """Create the cart row if it doesn't exist yet (e.g. before reserving stock for it)."""
+    _touch(conn.cursor(), cart_id, user_id)
+    conn.commit()
+
+
+def save(conn, cart_id, cart, user_id=None):
+    """Replace the cart's lines with `cart` and mark it as recently used."""
+    items = []
+    for pid, qty in cart.items():
+        try:
+            pid, qty = int(pid), int(qty)
+        except (TypeError, ValueError):
+            continue
+        if qty > 0:
+            items.append((cart_id, pid, qty))
+    cur = conn.cursor()
+    _touch(cur, cart_id, user_id)
+    cur.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+    cur.executemany("INSERT INTO cart_items (cart_id, product_id, quantity) VALUES (?, ?, ?)", items)
+    conn.commit()
+
+
+def delete(conn, cart_id):
+    conn.execute("DELETE FROM carts WHERE id = ?", (cart_id,))
+    conn.commit()
+
+
+def user_cart_id(conn, user_id):
+    """Id of the user's most recently used cart, or None."""
+    row = conn.execute(
+        "SELECT id FROM carts WHERE user_id = ? ORDER BY updated_at DESC LIMIT 1", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def attach_to_user(conn, guest_cart_id, user_id):
+    """Attach the session's cart to the user who just logged in.
+
+    Returns the id of the cart the session should use from now on: the guest
+    cart merged into the user's existing cart, the guest cart itself if the
+    user had none, or the user's cart if there was no guest cart.
+    """
+    user_cart = user_cart_id(conn, user_id)
+    if not guest_cart_id or guest_cart_id == user_cart:
+        return user_cart
+    cur = conn.cursor()
+    if user_cart is None:
+        cur.execute("UPDATE carts SET user_id = ?, updated_at = datetime('now') WHERE id = ? AND user_id IS NULL",
+                    (user_id, guest_cart_id))
+        conn.commit()
+        return guest_cart_id if cur.rowcount else None
+    # only guest carts can be merged; quantities of shared products are added up
+    cur.execute("SELECT 1 FROM carts WHERE id = ? AND user_id IS NULL", (guest_cart_id,))
+    if cur.fetchone():
+        now = time.time()
+        cur.execute(
+            "INSERT INTO cart_items (cart_id, product_id, quantity) "
+            "SELECT ?, product_id, quantity FROM cart_items WHERE cart_id = ? ORDER BY id "
+            "ON CONFLICT(cart_id, product_id) DO UPDATE SET quantity = cart_items.quantity + excluded.quantity",
+            (user_cart, guest_cart_id)
+        )
+        # the guest cart's live stock holds (reservations.py) move along before the
+        # delete cascades to them; both were granted against the same stock, so
+        # their sum is still available. An expired hold of the user counts as 0.
+        cur.execute(
+            "INSERT INTO stock_reservations (cart_id, product_id, quantity, expires_at) "
+            "SELECT ?, product_id, quantity, expires_at FROM stock_reservations WHERE cart_id = ? AND expires_at > ? "
+            "ON CONFLICT(cart_id, product_id) DO UPDATE SET "
+            "quantity = excluded.quantity + CASE WHEN stock_reservations.expires_at > ? "
+            "THEN stock_reservations.quantity ELSE 0 END, "
+            "expires_at = MAX(stock_reservations.expires_at, excluded.expires_at)",
+            (user_cart, guest_cart_id, now, now)
+        )
+        cur.execute("DELETE FROM carts WHERE id = ?", (guest_cart_id,))
+        cur.execute("UPDATE carts SET updated_at = datetime('now') WHERE id = ?", (user_cart,))
+        conn.commit()
+    return user_cart
+
+
+def sweep(conn, max_age_days=30):
+    """Delete carts unchanged for `max_age_days`; returns how many were removed."""
+    cur = conn.execute("DELETE FROM carts WHERE updated_at < datetime('now', ?)", (f"-{int(max_age_days)} days",))
+    conn.commit()
+    return max(cur.rowcount, 0)
@@ -0,0 +1,72 @@
+"""Conditional GET (ETag / Last-Modified / 304) for cacheable views.
+
+@conditional(validators) wraps a view. `validators(*args, **kwargs)` is called
+first and must be cheap (no rendering, ideally no database work): it returns
+(parts, last_modified) where `parts` lists everything the response depends
+on (cache tag versions, query string, viewer) and `last_modified` is a unix
+time or None; or None to opt out for this request. The parts are hashed
+into a strong ETag; when the request's If-None-Match (or, without one,
+If-Modified-Since) matches, a 304 is returned without running the view.
+Otherwise the view runs and its 200 responses get the ETag and Last-Modified.
+
+Requests with pending flash messages always run the view, since the page has
+to show them.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+
+def make_etag(parts):
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _apply(resp, etag, last_modified, cache_control):
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.headers['Cache-Control'] = cache_control
+
+
+def conditional(validators, on_not_modified=None, cache_control='private, no-cache'):
+    """Answer conditional GETs with 304 before running the view (see module docstring).
+
+    `on_not_modified(*args, **kwargs)` runs on a 304 for per-request side effects
+    the view would have had (e.g. recording a recently viewed product).
+    `cache_control` defaults to making browsers revalidate on every use.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            found = validators(*args, **kwargs)
+            if found is None:
+                return view(*args, **kwargs)
+            parts, modified = found
+            etag = make_etag(parts)
+            # HTTP dates have second precision
+            last_modified = datetime.fromtimestamp(int(modified), timezone.utc) if modified else None
+            if _not_modified(etag, last_modified):
+                if on_not_modified is not None:
+                    on_not_modified(*args, **kwargs)
+                resp = Response(status=304)
+                _apply(resp, etag, last_modified, cache_control)
+                return resp
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code == 200:
+                _apply(resp, etag, last_modified, cache_control)
+            return resp
+        return wrapped
+    return decorator
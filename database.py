@@ -0,0 +1,215 @@
+"""SQLite connection management for the webstore.
+
+app.py used to open a brand new sqlite3 connection for every helper call, which
+meant several connects (and PRAGMA round-trips) per request. This module keeps a
+bounded pool of long-lived connections instead. app.py binds one connection to
+the Flask app context (`g`) and hands it back to the pool on teardown.
+
+Every connection is configured from a storage profile (journal mode, sync level,
+cache sizes, busy timeout) so the PRAGMA tuning lives in one place.
+"""
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+
+# Named PRAGMA sets applied to every new connection. 'wal' lets catalog readers
+# keep working while checkout/review writers commit; 'safe' keeps the classic
+# rollback journal with fully synchronous writes for environments without
+# shared-memory support (e.g. network filesystems).
+STORAGE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+}
+
+# PRAGMA values cannot be bound as parameters, so only accept plain words/numbers
+_PRAGMA_VALUE_RE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def storage_profile(name='wal', **overrides):
+    """Return a copy of a named storage profile with individual PRAGMAs overridden.
+
+    None overrides are ignored so callers can pass optional settings straight through.
+    """
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"unknown storage profile: {name!r}")
+    profile = dict(STORAGE_PROFILES[name])
+    for key, value in overrides.items():
+        if value is not None and value != '':
+            profile[key] = value
+    return profile
+
+
+def apply_pragmas(conn, pragmas):
+    for key, value in (pragmas or {}).items():
+        if not _PRAGMA_VALUE_RE.match(str(value)):
+            raise ValueError(f"invalid value for PRAGMA {key}: {value!r}")
+        conn.execute(f"PRAGMA {key} = {value}")
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that survives close() while it belongs to a pool.
+
+    Views still call conn.close() when they are done; for pooled connections that
+    is a no-op and the connection is returned to the pool at request teardown.
+    """
+    _pool = None
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+
+    def really_close(self):
+        sqlite3.Connection.close(self)
+
+
+def open_connection(path, factory=sqlite3.Connection, check_same_thread=True, pragmas=None, readonly=False):
+    """Open a connection configured the way the app expects (Row rows, foreign keys on).
+
+    `pragmas` is a storage profile (see storage_profile()). Read-only connections
+    additionally get `query_only` so a stray write raises instead of taking the
+    database write lock.
+    """
+    conn = sqlite3.connect(path, factory=factory, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    apply_pragmas(conn, pragmas)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of sqlite3 connections to a single database file.
+
+    Connections are created lazily up to `max_size`. When all of them are checked
+    out, acquire() waits up to `timeout` seconds for one to be released and then
+    raises PoolTimeout. Counters are kept so the pool can be sized under load.
+    Every connection is set up with the same storage profile; a `readonly` pool
+    hands out `query_only` connections for catalog reads.
+    """
+
+    def __init__(self, path, max_size=8, timeout=5.0, pragmas=None, readonly=False):
+        self.path = path
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.readonly = readonly
+        # LIFO keeps the most recently used (warm page cache) connections busy
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = open_connection(self.path, factory=PooledConnection, check_same_thread=False,
+                               pragmas=self.pragmas, readonly=self.readonly)
+        conn._pool = self
+        return conn
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"no database connection available after {self.timeout}s")
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # never hand out a connection with half-finished work on it
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # broken connection: drop it so a fresh one is created next time
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.really_close()
+            except Exception:
+                pass
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.really_close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'readonly': self.readonly,
+                'max_size': self.max_size,
+                'size': self._created,
+                'in_use': self._in_use,
+                'idle': self._created - self._in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._waits, 6) if self._waits else 0.0,
+            }
@@ -0,0 +1,162 @@
+"""Precomputed category and price facets for the product listing.
+
+product_facets (migration 14) holds the number of active products per
+(category, price bucket); category_id 0 stands for "any category", so its rows
+are the price-bucket totals of the whole active catalog. A product belongs to
+every category linked in product_categories, which also always holds its
+primary products.category_id (see sync_primary_link), so the listing can
+filter by category through product_categories alone.
+
+Write paths take membership(conn, id) before changing a product and call
+product_changed(conn, id, before) afterwards, in the same transaction; only
+the difference is applied. Callers commit themselves, as with ratings.py.
+
+rebuild() recomputes the table from scratch; run it with
+`flask --app app rebuild-facets` after editing products by hand.
+"""
+from collections import Counter
+
+# lower bounds of the price buckets; the last one is open-ended
+PRICE_BOUNDS = (0, 5, 10, 25, 50, 100, 250)
+
+ALL_CATEGORIES = 0
+
+LINKED_CATEGORIES_SQL = "SELECT category_id FROM product_categories WHERE product_id = ?"
+BUCKET_COUNTS_SQL = "SELECT bucket, product_count FROM product_facets WHERE category_id = ?"
+
+
+def _bucket_sql(column):
+    # CASE expression mapping a price column to its bucket index (NULL -> 0)
+    whens = ' '.join(f"WHEN {column} >= {lo} THEN {i}"
+                     for i, lo in reversed(list(enumerate(PRICE_BOUNDS))) if i)
+    return f"(CASE {whens} ELSE 0 END)"
+
+
+def bucket_of(price):
+    bucket = 0
+    for i, lo in enumerate(PRICE_BOUNDS):
+        if price is not None and price >= lo:
+            bucket = i
+    return bucket
+
+
+def bucket_range(bucket):
+    """(low, high) price bounds of a bucket; high is None for the last one."""
+    high = PRICE_BOUNDS[bucket + 1] if bucket + 1 < len(PRICE_BOUNDS) else None
+    return PRICE_BOUNDS[bucket], high
+
+
+def bucket_label(bucket):
+    low, high = bucket_range(bucket)
+    if high is None:
+        return f"${low}+"
+    if not low:
+        return f"Under ${high}"
+    return f"${low} - ${high}"
+
+
+def price_filter(column, buckets):
+    """(sql, params) matching prices in any of `buckets`."""
+    conds, params = [], []
+    for b in buckets:
+        low, high = bucket_range(b)
+        if high is None:
+            conds.append(f"{column} >= ?")
+            params.append(low)
+        elif not low:
+            conds.append(f"{column} < ?")
+            params.append(high)
+        else:
+            conds.append(f"({column} >= ? AND {column} < ?)")
+            params.extend([low, high])
+    return '(' + ' OR '.join(conds) + ')', params
+
+
+def category_filter(column, category_ids):
+    """(sql, params) matching product ids linked to any of `category_ids`.
+
+    Answered from the (category_id, product_id) index alone, and IN() needs no
+    DISTINCT however many of the categories a product is in.
+    """
+    marks = ','.join('?' * len(category_ids))
+    return f"{column} IN (SELECT product_id FROM product_categories WHERE category_id IN ({marks}))", list(category_ids)
+
+
+def sync_primary_link(conn, product_id):
+    """Make sure the product's primary category is also in product_categories."""
+    conn.execute(
+        "INSERT OR IGNORE INTO product_categories (product_id, category_id) "
+        "SELECT id, category_id FROM products WHERE id = ? AND category_id IS NOT NULL",
+        (product_id,))
+
+
+def membership(conn, product_id):
+    """The (category_id, bucket) cells a product currently counts in (empty when archived or missing)."""
+    row = conn.execute("SELECT is_active, price FROM products WHERE id = ?", (product_id,)).fetchone()
+    if not row or not row[0]:
+        return frozenset()
+    bucket = bucket_of(row[1])
+    cats = {r[0] for r in conn.execute(LINKED_CATEGORIES_SQL, (product_id,))}
+    return frozenset((c, bucket) for c in cats | {ALL_CATEGORIES})
+
+
+def _apply(conn, delta):
+    for (category_id, bucket), n in delta.items():
+        if n:
+            conn.execute(
+                "INSERT INTO product_facets (category_id, bucket, product_count) VALUES (?, ?, ?) "
+                "ON CONFLICT(category_id, bucket) DO UPDATE SET product_count = product_count + excluded.product_count",
+                (category_id, bucket, n))
+
+
+def product_changed(conn, product_id, before):
+    """Account for a product whose membership was `before` prior to the write."""
+    sync_primary_link(conn, product_id)
+    after = membership(conn, product_id)
+    delta = Counter({cell: 1 for cell in after - before})
+    delta.subtract({cell: 1 for cell in before - after})
+    _apply(conn, delta)
+
+
+def category_deleted(conn, category_id):
+    """Drop a deleted category's links and counts (products stay in the catalog)."""
+    conn.execute("DELETE FROM product_categories WHERE category_id = ?", (category_id,))
+    conn.execute("DELETE FROM product_facets WHERE category_id = ?", (category_id,))
+
+
+REBUILD_SQL = f"""
+    INSERT INTO product_facets (category_id, bucket, product_count)
+    SELECT category_id, bucket, COUNT(*) FROM (
+        SELECT pc.category_id AS category_id, {_bucket_sql('p.price')} AS bucket
+          FROM product_categories pc JOIN products p ON p.id = pc.product_id
+         WHERE p.is_active = 1
+        UNION ALL
+        SELECT {ALL_CATEGORIES}, {_bucket_sql('price')} FROM products WHERE is_active = 1
+    ) GROUP BY category_id, bucket
+"""
+
+
+def rebuild(conn):
+    """Recompute every count from products and product_categories."""
+    conn.execute(
+        "INSERT OR IGNORE INTO product_categories (product_id, category_id) "
+        "SELECT id, category_id FROM products WHERE category_id IS NOT NULL")
+    conn.execute("DELETE FROM product_facets")
+    conn.execute(REBUILD_SQL)
+    conn.commit()
+
+
+def counts(conn, buckets=None):
+    """{category_id: active product count}, optionally within the given price buckets."""
+    sql = "SELECT category_id, SUM(product_count) FROM product_facets"
+    params = []
+    if buckets:
+        sql += f" WHERE bucket IN ({','.join('?' * len(buckets))})"
+        params = list(buckets)
+    sql += " GROUP BY category_id"
+    return {r[0]: r[1] for r in conn.execute(sql, params)}
+
+
+def bucket_counts(conn, category_id=ALL_CATEGORIES):
+    """{bucket: active product count} within one category (or the whole catalog)."""
+    return {r[0]: r[1] for r in conn.execute(BUCKET_COUNTS_SQL, (category_id,))}
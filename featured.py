@@ -0,0 +1,83 @@
+"""Featured-products sampler for the home page.
+
+Picking featured products with ORDER BY RANDOM() makes SQLite read and sort
+the whole active catalog on every home-page hit. FeaturedSampler instead keeps
+a pool of up to `pool_size` randomly chosen active product ids and draws the
+featured ids from that pool in memory; the card fields (including the joined
+seller fields) come from the cached product summaries (summaries.py).
+
+The pool is rebuilt when it is older than `refresh_interval` seconds or when
+the catalog version passed to sample() changes (app.py passes the page cache's
+'catalog' tag version, which every catalog write bumps, so a rebuild is seen
+by all worker processes).
+"""
+import random
+import threading
+import time
+
+
+class FeaturedSampler:
+    """Draws random featured product ids from a periodically rebuilt pool."""
+
+    def __init__(self, pool_size=500, refresh_interval=300, rng=None):
+        self.pool_size = max(1, int(pool_size))
+        self.refresh_interval = refresh_interval
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        # held while rebuilding so concurrent requests don't all hit the database
+        self._refresh_lock = threading.Lock()
+        self._pool = []
+        self._version = None
+        self._expires = 0.0
+        self.refreshes = 0
+
+    def _load(self, conn):
+        cur = conn.cursor()
+        # id-only read served by the (is_active, created_at, id) index
+        cur.execute("SELECT id FROM products WHERE is_active = 1")
+        ids = [r[0] for r in cur.fetchall()]
+        if len(ids) > self.pool_size:
+            ids = self._rng.sample(ids, self.pool_size)
+        return ids
+
+    def refresh(self, conn, version=None):
+        """Rebuild the pool from the database."""
+        pool = self._load(conn)
+        with self._lock:
+            self._pool = pool
+            self._version = version
+            self._expires = time.monotonic() + self.refresh_interval
+            self.refreshes += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._expires = 0.0
+
+    def sample(self, k, get_conn, version=None):
+        """Return up to `k` random featured product ids.
+
+        `get_conn` is only called when the pool has to be rebuilt.
+        """
+        with self._lock:
+            stale = time.monotonic() >= self._expires or version != self._version
+        # while another thread rebuilds, keep serving the old pool (if there is one)
+        if stale and self._refresh_lock.acquire(blocking=not self._pool):
+            try:
+                conn = get_conn()
+                try:
+                    self.refresh(conn, version)
+                finally:
+                    conn.close()
+            finally:
+                self._refresh_lock.release()
+        with self._lock:
+            return self._rng.sample(self._pool, min(k, len(self._pool)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool': len(self._pool),
+                'pool_size': self.pool_size,
+                'refresh_interval': self.refresh_interval,
+                'refreshes': self.refreshes,
+            }
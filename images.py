@@ -0,0 +1,164 @@
+"""Resized product image variants for srcset.
+
+Product images are uploaded as-is (often 1-2 MB PNGs) but listing cards show
+them in a 140px box. generate() writes downscaled WebP (and AVIF, when the
+installed Pillow can encode it) copies at WIDTHS into static/img/derived/,
+named after a hash of the source file's content so a replaced image never
+serves stale variants. A small JSON sidecar per source image records what was
+generated; sources() reads it to build <picture> <source srcset> entries.
+
+Pillow is optional: without it generate() does nothing and templates keep
+using the original image.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+WIDTHS = (160, 320, 640)
+
+# (format, file extension, mime type, save options), best first
+FORMATS = (
+    ('AVIF', 'avif', 'image/avif', {'quality': 55}),
+    ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+)
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DERIVED_SUBDIR = 'img/derived'
+
+# how long sources() trusts what it read from a sidecar (other workers may generate)
+_LOOKUP_TTL = 60
+_lookups = {}
+_lookups_lock = threading.Lock()
+
+
+def available():
+    return Image is not None
+
+
+def _encoders():
+    if Image is None:
+        return []
+    exts = set(Image.registered_extensions().values())
+    return [f for f in FORMATS if f[0] in exts and f[0] in Image.SAVE]
+
+
+def source_path(image_url):
+    """Filesystem path of a local product image, or None for remote/unknown URLs."""
+    if not image_url or image_url.startswith(('http://', 'https://', '//')):
+        return None
+    if image_url.startswith('/static/'):
+        rel = image_url[len('/static/'):]
+    elif image_url.startswith('/'):
+        return None
+    else:
+        # bare filenames live in static/img (see the product forms)
+        rel = 'img/' + image_url
+    path = os.path.normpath(os.path.join(STATIC_DIR, rel))
+    if not path.startswith(STATIC_DIR + os.sep):
+        return None
+    return path
+
+
+def _sidecar_path(image_url):
+    key = hashlib.sha1(image_url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(STATIC_DIR, DERIVED_SUBDIR, f"{key}.json")
+
+
+def generate(image_url, widths=WIDTHS):
+    """Write the resized variants of a local image; returns the sidecar dict or None.
+
+    Variants that already exist for the same content are reused. Widths larger
+    than the original are skipped (the original width is used once instead).
+    """
+    path = source_path(image_url)
+    encoders = _encoders()
+    if not path or not encoders or not os.path.isfile(path):
+        return None
+    if path.lower().endswith('.svg'):
+        # vector images scale by themselves
+        return None
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    sidecar = _sidecar_path(image_url)
+    try:
+        with open(sidecar, encoding='utf-8') as f:
+            existing = json.load(f)
+        if existing.get('hash') == digest:
+            return existing
+    except (OSError, ValueError):
+        pass
+
+    out_dir = os.path.join(STATIC_DIR, DERIVED_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = {}
+    with Image.open(path) as im:
+        im.load()
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands() or 'transparency' in im.info else 'RGB')
+        targets = sorted({min(w, im.width) for w in widths})
+        for fmt, ext, mime, options in encoders:
+            entries = []
+            for w in targets:
+                name = f"{stem}-{digest}-{w}.{ext}"
+                dest = os.path.join(out_dir, name)
+                if not os.path.exists(dest):
+                    h = max(1, round(im.height * w / im.width))
+                    resized = im if w == im.width else im.resize((w, h), Image.LANCZOS)
+                    tmp = f"{dest}.{os.getpid()}.tmp"
+                    try:
+                        resized.save(tmp, fmt, **options)
+                    except Exception:
+                        # encoder present but unusable for this image; skip the format
+                        if os.path.exists(tmp):
+                            os.remove(tmp)
+                        entries = []
+                        break
+                    os.replace(tmp, dest)
+                entries.append([w, f"/static/{DERIVED_SUBDIR}/{name}"])
+            if entries:
+                variants[mime] = entries
+    data = {'source': image_url, 'hash': digest, 'variants': variants}
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, sidecar)
+    with _lookups_lock:
+        _lookups.pop(image_url, None)
+    return data
+
+
+def sources(image_url):
+    """[{'type': mime, 'srcset': '<url> <w>w, ...'}] for a product image, best format first.
+
+    Empty when no variants were generated (remote image, no Pillow, not yet
+    processed); callers then just render the original.
+    """
+    if not image_url:
+        return []
+    now = time.monotonic()
+    with _lookups_lock:
+        hit = _lookups.get(image_url)
+    if hit and hit[0] > now:
+        return hit[1]
+    result = []
+    if source_path(image_url):
+        try:
+            with open(_sidecar_path(image_url), encoding='utf-8') as f:
+                data = json.load(f)
+            for _, _, mime, _ in FORMATS:
+                entries = data.get('variants', {}).get(mime)
+                if entries:
+                    result.append({'type': mime, 'srcset': ', '.join(f"{url} {w}w" for w, url in entries)})
+        except (OSError, ValueError):
+            result = []
+    with _lookups_lock:
+        _lookups[image_url] = (now + _LOOKUP_TTL, result)
+    return result
@@ -0,0 +1,394 @@
+"""Versioned schema migrations for webstore.db.
+
+Each migration is a numbered step recorded in the `schema_version` table once it
+has been applied, so a database only ever runs the steps it is missing. Apply
+them with `flask --app app migrate` (app.py also applies pending steps once at
+startup unless AUTO_MIGRATE=0). Request handlers never run DDL.
+
+Steps are written to be safe on databases created by older versions of the app,
+which already carry some of these tables/columns from the old ensure_* helpers.
+"""
+
+
+def _columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [r[1] for r in cur.fetchall()]
+
+
+def _add_column(cur, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if column not in _columns(cur, table):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _m001_base_schema(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            is_admin INTEGER NOT NULL DEFAULT 0,
+            is_seller INTEGER NOT NULL DEFAULT 0,
+            business_name TEXT,
+            seller_description TEXT,
+            rating REAL DEFAULT 0,
+            total_sales INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            seller_id INTEGER,
+            title TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL CHECK(price >= 0),
+            stock INTEGER DEFAULT 0,
+            image_url TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            is_active INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY(seller_id) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            buyer_id INTEGER,
+            buyer_name TEXT,
+            buyer_email TEXT,
+            shipping_address TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total REAL NOT NULL CHECK(total >= 0),
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(buyer_id) REFERENCES users(id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            unit_price REAL NOT NULL CHECK(unit_price >= 0),
+            FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE RESTRICT
+        )
+    """)
+    # saved shipping addresses per user
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            label TEXT,
+            address_text TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            UNIQUE(user_id, address_text)
+        )
+    """)
+
+
+def _m002_products_is_active(cur):
+    # legacy databases predate archiving
+    _add_column(cur, 'products', 'is_active', "INTEGER NOT NULL DEFAULT 1")
+
+
+def _m003_categories(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            slug TEXT UNIQUE,
+            description TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+    # legacy single-category column (nullable)
+    _add_column(cur, 'products', 'category_id', "INTEGER")
+    # association table for the many-to-many product <-> category mapping
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_categories (
+            product_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            PRIMARY KEY (product_id, category_id),
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE,
+            FOREIGN KEY(category_id) REFERENCES categories(id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_category_id ON product_categories(category_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_product_id ON product_categories(product_id)")
+
+
+def _m004_reviews(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            user_id INTEGER,
+            title TEXT,
+            body TEXT,
+            rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+
+
+def _m005_products_rating(cur):
+    # aggregated approved-review rating per product
+    _add_column(cur, 'products', 'rating', "REAL DEFAULT 0.0")
+
+
+def _m006_seller_applications(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS seller_applications (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            business_name TEXT,
+            message TEXT,
+            logo_url TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+    # older installs may have the table without these columns
+    _add_column(cur, 'seller_applications', 'status', "TEXT DEFAULT 'pending'")
+    _add_column(cur, 'seller_applications', 'seller_description', "TEXT")
+
+
+def _m007_seller_messages(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS seller_messages (
+            id INTEGER PRIMARY KEY,
+            seller_id INTEGER,
+            sender_name TEXT,
+            sender_email TEXT,
+            subject TEXT,
+            message TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+
+
+def _m008_users_logo_url(cur):
+    # seller logos are set by admins when approving applications
+    _add_column(cur, 'users', 'logo_url', "TEXT")
+
+
+def _m009_products_fts(cur):
+    # external-content FTS5 index over product text, kept in sync by triggers so
+    # every write path (raw sqlite3 or ORM) updates it
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            title, description,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF title, description ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO products_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """)
+    cur.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def _m010_hot_query_indexes(cur):
+    # indexes for the filters/sorts the views actually run; query_plans.py lists
+    # the queries they serve (`flask check-query-plans`)
+    # catalog listings: active products in each keyset sort order (sort key, id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_active_created ON products(is_active, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_active_title ON products(is_active, title, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_active_price ON products(is_active, price, id)")
+    # seller profile/dashboard listings and per-seller rating/sales aggregates
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_seller_active ON products(seller_id, is_active, created_at)")
+    # approved reviews on the product page, moderation queue on the admin side
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_product_status_created ON reviews(product_id, status, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_status_created ON reviews(status, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_addresses_user_created ON addresses(user_id, created_at)")
+
+
+def _m011_carts(cur):
+    # server-side carts; the session cookie only carries the cart id
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS carts (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cart_items (
+            id INTEGER PRIMARY KEY,
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            UNIQUE(cart_id, product_id),
+            FOREIGN KEY(cart_id) REFERENCES carts(id) ON DELETE CASCADE,
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_carts_user_id ON carts(user_id, updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_carts_updated_at ON carts(updated_at)")
+
+
+def _m012_stock_reservations(cur):
+    # time-limited stock holds taken when products are added to a cart
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id INTEGER PRIMARY KEY,
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            expires_at REAL NOT NULL,
+            UNIQUE(cart_id, product_id),
+            FOREIGN KEY(cart_id) REFERENCES carts(id) ON DELETE CASCADE,
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stock_reservations_product ON stock_reservations(product_id, expires_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires_at ON stock_reservations(expires_at)")
+
+
+def _m013_rating_totals(cur):
+    # running totals of approved review ratings (kept up to date by ratings.py)
+    for table in ('products', 'users'):
+        _add_column(cur, table, 'rating_sum', "INTEGER NOT NULL DEFAULT 0")
+        _add_column(cur, table, 'rating_count', "INTEGER NOT NULL DEFAULT 0")
+    # one-shot backfill; replaces the per-seller recompute app.py ran at every startup
+    cur.execute("""
+        UPDATE products SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE product_id = products.id AND status = 'approved'),
+            rating_count = (SELECT COUNT(*) FROM reviews WHERE product_id = products.id AND status = 'approved')
+    """)
+    cur.execute("""
+        UPDATE users SET
+            rating_sum = (SELECT COALESCE(SUM(rating_sum), 0) FROM products WHERE seller_id = users.id),
+            rating_count = (SELECT COALESCE(SUM(rating_count), 0) FROM products WHERE seller_id = users.id)
+    """)
+    cur.execute("UPDATE products SET rating = CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0.0 END")
+    cur.execute("UPDATE users SET rating = CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0.0 END "
+                "WHERE is_seller = 1 OR id IN (SELECT seller_id FROM products)")
+
+
+def _m014_product_facets(cur):
+    # active product counts per (category, price bucket), kept up to date by facets.py;
+    # category_id 0 holds the totals over all categories
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_facets (
+            category_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            product_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, bucket)
+        ) WITHOUT ROWID
+    """)
+    # category filters read product ids straight from this index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_category_product ON product_categories(category_id, product_id)")
+    cur.execute("DROP INDEX IF EXISTS idx_product_categories_category_id")
+    # the primary category counts as a linked one
+    cur.execute("INSERT OR IGNORE INTO product_categories (product_id, category_id) "
+                "SELECT id, category_id FROM products WHERE category_id IS NOT NULL")
+    # price buckets as of this migration: 0, 5, 10, 25, 50, 100, 250+
+    bucket = ("CASE WHEN {0} >= 250 THEN 6 WHEN {0} >= 100 THEN 5 WHEN {0} >= 50 THEN 4 "
+              "WHEN {0} >= 25 THEN 3 WHEN {0} >= 10 THEN 2 WHEN {0} >= 5 THEN 1 ELSE 0 END")
+    cur.execute("DELETE FROM product_facets")
+    cur.execute(f"""
+        INSERT INTO product_facets (category_id, bucket, product_count)
+        SELECT category_id, bucket, COUNT(*) FROM (
+            SELECT pc.category_id AS category_id, {bucket.format('p.price')} AS bucket
+              FROM product_categories pc JOIN products p ON p.id = pc.product_id
+             WHERE p.is_active = 1
+            UNION ALL
+            SELECT 0, {bucket.format('price')} FROM products WHERE is_active = 1
+        ) GROUP BY category_id, bucket
+    """)
+
+
+# Ordered list of (version, description, step). Append new steps at the end and
+# never renumber or edit a released step.
+MIGRATIONS = [
+    (1, 'base schema', _m001_base_schema),
+    (2, 'products.is_active', _m002_products_is_active),
+    (3, 'categories and product_categories', _m003_categories),
+    (4, 'reviews', _m004_reviews),
+    (5, 'products.rating', _m005_products_rating),
+    (6, 'seller_applications', _m006_seller_applications),
+    (7, 'seller_messages', _m007_seller_messages),
+    (8, 'users.logo_url', _m008_users_logo_url),
+    (9, 'products_fts full-text index', _m009_products_fts),
+    (10, 'indexes for hot queries', _m010_hot_query_indexes),
+    (11, 'carts and cart_items', _m011_carts),
+    (12, 'stock_reservations', _m012_stock_reservations),
+    (13, 'rating_sum/rating_count on products and users', _m013_rating_totals),
+    (14, 'product_facets and covering product_categories index', _m014_product_facets),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_schema_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.commit()
+
+
+def current_version(conn):
+    """Return the highest applied migration version (0 for an unversioned database)."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except Exception:
+        return 0
+    return (row[0] if row else None) or 0
+
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def run_migrations(conn):
+    """Apply every pending migration, each in its own transaction.
+
+    Returns the list of (version, description) pairs that were applied. A failing
+    step is rolled back and re-raised; earlier steps stay applied.
+    """
+    ensure_schema_version_table(conn)
+    applied = []
+    for version, description, step in pending_migrations(conn):
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            step(cur)
+            cur.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
@@ -4,6 +4,9 @@ from flask_sqlalchemy import SQLAlchemy
 # Instantiate SQLAlchemy here and call db.init_app(app) from application startup.
 db = SQLAlchemy()
 
+# Relationships use the default lazy='select' loading so queries can eager-load
+# them with joinedload/selectinload (lazy='dynamic' collections can't be).
+
 # Association table to support many-to-many product <-> category relationship
 product_categories = db.Table(
     'product_categories',
@@ -23,13 +26,15 @@ class User(db.Model):
     business_name = db.Column(db.String(255))
     seller_description = db.Column(db.Text)
     rating = db.Column(db.Float, default=0.0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
     total_sales = db.Column(db.Integer, default=0)
     logo_url = db.Column(db.String(512))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # relationships
-    products = db.relationship('Product', back_populates='seller', lazy='dynamic')
-    orders = db.relationship('Order', back_populates='buyer', lazy='dynamic')
+    products = db.relationship('Product', back_populates='seller')
+    orders = db.relationship('Order', back_populates='buyer')
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -48,14 +53,16 @@ class Product(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
     rating = db.Column(db.Float, default=0.0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
 
     seller = db.relationship('User', back_populates='products')
     # legacy single-category relationship (kept for compatibility)
     category = db.relationship('Category', back_populates='legacy_products')
     # many-to-many relationship for products belonging to multiple categories
-    categories = db.relationship('Category', secondary=product_categories, back_populates='products', lazy='dynamic')
+    categories = db.relationship('Category', secondary=product_categories, back_populates='products')
 
-    order_items = db.relationship('OrderItem', back_populates='product', lazy='dynamic')
+    order_items = db.relationship('OrderItem', back_populates='product')
 
     def __repr__(self):
         return f"<Product {self.title}>"
@@ -70,9 +77,9 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # legacy_products maps the old Product.category relationship (category_id FK)
-    legacy_products = db.relationship('Product', back_populates='category', lazy='dynamic')
+    legacy_products = db.relationship('Product', back_populates='category')
     # products through the association table (many-to-many)
-    products = db.relationship('Product', secondary=product_categories, back_populates='categories', lazy='dynamic')
+    products = db.relationship('Product', secondary=product_categories, back_populates='categories')
 
     def __repr__(self):
         return f"<Category {self.name}>"
@@ -90,7 +97,7 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     buyer = db.relationship('User', back_populates='orders')
-    items = db.relationship('OrderItem', back_populates='order', cascade='all, delete-orphan', lazy='dynamic')
+    items = db.relationship('OrderItem', back_populates='order', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f"<Order {self.id} (buyer={self.buyer_id})>"
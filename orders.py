@@ -0,0 +1,123 @@
+"""Order placement (the write side of checkout).
+
+place_order() creates an order from a cart in one IMMEDIATE transaction: the
+write lock is taken up front, so two checkouts can't both read the same stock
+and the transaction never has to upgrade from a read lock halfway through
+(the usual source of SQLITE_BUSY under load). Prices and stock are re-read
+inside the transaction, and every stock decrement is conditional
+(`... WHERE stock >= ?`) with its rowcount checked, so stock can never go
+negative or oversell. Lock contention that outlasts the connection's
+busy_timeout is retried a few times with jittered exponential backoff.
+
+Live stock holds of other carts (reservations.py) count as unavailable, and
+the order consumes the buying cart's own holds in the same transaction.
+"""
+import random
+import sqlite3
+import time
+from decimal import Decimal
+
+import cart_pricing
+import reservations
+
+# flat shipping fee added to every order
+SHIPPING_FEE = Decimal('5.00')
+
+
+class OutOfStock(Exception):
+    """Some cart lines can't be fulfilled; `shortages` is [(product id, available, wanted)]."""
+
+    def __init__(self, shortages):
+        super().__init__(f"insufficient stock for {len(shortages)} product(s)")
+        self.shortages = shortages
+
+
+class CheckoutBusy(Exception):
+    """The database stayed locked through every retry."""
+
+
+def _is_busy(exc):
+    msg = str(exc).lower()
+    return 'locked' in msg or 'busy' in msg
+
+
+def _place_order_once(conn, cart, buyer_id, name, email, address, shipping_fee, cart_id):
+    if conn.in_transaction:
+        conn.rollback()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        products = cart_pricing.load_products(conn, cart.keys())
+        # stock other carts are holding isn't available to this order
+        for pid, held in reservations.held_by_others(conn, products.keys(), cart_id, now).items():
+            if products[pid].get('stock') is not None:
+                products[pid]['stock'] = max(0, products[pid]['stock'] - held)
+        summary = cart_pricing.price_cart(cart, products)
+        shortages = summary.insufficient_stock()
+        if shortages or not summary.lines:
+            raise OutOfStock(shortages)
+
+        total_with_shipping = summary.total_amount + shipping_fee
+        cur.execute(
+            "INSERT INTO orders (buyer_id, buyer_name, buyer_email, shipping_address, total) VALUES (?, ?, ?, ?, ?)",
+            (buyer_id, name, email, address, float(total_with_shipping))
+        )
+        order_id = cur.lastrowid
+
+        # save address for user (avoid duplicates due to UNIQUE constraint)
+        if buyer_id:
+            cur.execute("INSERT OR IGNORE INTO addresses (user_id, label, address_text) VALUES (?, ?, ?)",
+                        (buyer_id, None, address))
+
+        cur.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)",
+            [(order_id, int(line.product_id), line.quantity, float(line.unit_price)) for line in summary.lines]
+        )
+
+        # conditional decrement; NULL stock means unlimited and is left alone
+        for line in summary.lines:
+            if line.product.get('stock') is None:
+                continue
+            pid = int(line.product_id)
+            cur.execute(f"UPDATE products SET stock = stock - ? WHERE id = ? "
+                        f"AND stock - ({reservations.HELD_BY_OTHERS_SQL}) >= ?",
+                        (line.quantity, pid, pid, cart_id or '', now, line.quantity))
+            if cur.rowcount != 1:
+                current = conn.execute("SELECT stock FROM products WHERE id = ?", (int(line.product_id),)).fetchone()
+                raise OutOfStock([(line.product_id, current[0] if current else 0, line.quantity)])
+
+        sales = {}
+        for line in summary.lines:
+            seller_id = line.product.get('seller_id')
+            if seller_id:
+                sales[seller_id] = sales.get(seller_id, 0) + line.quantity
+        cur.executemany("UPDATE users SET total_sales = COALESCE(total_sales, 0) + ? WHERE id = ?",
+                        [(qty, seller_id) for seller_id, qty in sales.items()])
+        if cart_id:
+            cur.execute("DELETE FROM stock_reservations WHERE cart_id = ?", (cart_id,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return order_id, summary
+
+
+def place_order(conn, cart, buyer_id, name, email, address, shipping_fee=SHIPPING_FEE, attempts=5, backoff=0.05,
+                cart_id=None):
+    """Create an order for `cart` and decrement stock atomically.
+
+    Returns (order_id, CartSummary of what was ordered). Raises OutOfStock when
+    a line can't be fulfilled (nothing is written) and CheckoutBusy when the
+    write lock couldn't be obtained after `attempts` tries. `cart_id` is the
+    cart being bought; its stock holds are consumed by the order.
+    """
+    for attempt in range(attempts):
+        try:
+            return _place_order_once(conn, cart, buyer_id, name, email, address, shipping_fee, cart_id)
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+            if attempt == attempts - 1:
+                raise CheckoutBusy(str(e)) from e
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
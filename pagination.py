@@ -0,0 +1,94 @@
+"""Keyset (cursor) pagination for the product listing.
+
+Instead of LIMIT/OFFSET, each page starts right after the last row of the
+previous one: for the active sort the query filters on
+`(sort_key, id) > (last_key, last_id)` and reads page_size + 1 rows, so page 500
+costs the same as page 1. The position is handed to the browser as an opaque
+cursor token in the next/prev links.
+
+Tokens are URL-safe base64 JSON. They are not signed: a forged token can only
+move the start of the page, and every value in it is bound as a query
+parameter. Tokens issued for another sort are ignored.
+"""
+import base64
+import binascii
+import json
+
+# sort name -> (sort key, ascending). Every sort is tie-broken on the product id
+# in the same direction so the ordering is total and cursors are unambiguous.
+KEYSET_SORTS = {
+    'newest': ('created_at', False),
+    'price_low': ('price', True),
+    'price_high': ('price', False),
+    'title_az': ('title', True),
+    'title_za': ('title', False),
+    # FTS5 bm25 rank: lower is better
+    'relevance': ('rank', True),
+}
+DEFAULT_SORT = 'newest'
+
+
+def keyset_sort(sort):
+    """Return (sort key, ascending) for a sort name, falling back to newest first."""
+    return KEYSET_SORTS.get(sort) or KEYSET_SORTS[DEFAULT_SORT]
+
+
+def encode_cursor(sort, direction, key, last_id):
+    """Build the token for the page after ('next') or before ('prev') a row."""
+    payload = json.dumps({'s': sort, 'd': direction, 'k': key, 'i': last_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    """Parse a cursor token issued for `sort`.
+
+    Returns (direction, key, last_id), or None for a missing, malformed or
+    foreign token (the listing then starts from the first page).
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw.decode('utf-8'))
+        direction, key, last_id = data['d'], data['k'], data['i']
+        if data['s'] != sort or direction not in ('next', 'prev'):
+            return None
+        if not isinstance(last_id, int) or isinstance(key, bool) or not isinstance(key, (str, int, float)):
+            return None
+        return direction, key, last_id
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+
+def scan_ascending(sort, cursor):
+    """Whether the query for this page has to read rows in ascending key order.
+
+    Paging backwards reads the rows just before the cursor in reverse order;
+    finish_page() flips them back.
+    """
+    ascending = keyset_sort(sort)[1]
+    if cursor and cursor[0] == 'prev':
+        return not ascending
+    return ascending
+
+
+def finish_page(rows, page_size, sort, cursor, key_of, id_of):
+    """Trim a page read with LIMIT page_size + 1 and build its navigation tokens.
+
+    `rows` are in scan order (see scan_ascending()); `key_of`/`id_of` extract
+    the sort key and product id from a row. Returns (rows, next_token, prev_token)
+    with rows in display order and a token of None when there is no such page.
+    """
+    backwards = bool(cursor) and cursor[0] == 'prev'
+    more = len(rows) > page_size
+    rows = list(rows[:page_size])
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = bool(cursor), more
+    if not rows:
+        return rows, None, None
+    next_token = encode_cursor(sort, 'next', key_of(rows[-1]), id_of(rows[-1])) if has_next else None
+    prev_token = encode_cursor(sort, 'prev', key_of(rows[0]), id_of(rows[0])) if has_prev else None
+    return rows, next_token, prev_token
@@ -0,0 +1,107 @@
+"""Query-plan regression check for the hot queries in app.py.
+
+HOT_QUERIES mirrors the SQL the views run on busy pages (catalog listing and
+count, product page, seller pages, cart, checkout/order pages, the admin
+queues). check_query_plans() runs EXPLAIN QUERY PLAN for each of them and
+reports every step that reads a whole table instead of searching an index.
+Run it with `flask --app app check-query-plans`, which exits non-zero on a
+regression. Statements are imported from the modules that run them
+(repository.py, cart_pricing.py, summaries.py, sitemaps.py, ...); the few
+still inline in app.py are copied here and must be kept in sync by hand.
+
+By default the plans are checked against an empty in-memory database built
+by the migrations, so the result depends only on the schema and indexes and
+not on the size or ANALYZE statistics of a particular webstore.db (on a tiny
+database SQLite rightly prefers scanning a few pages over an index).
+"""
+import re
+import sqlite3
+
+import cart_pricing
+import facets
+import repository
+import reservations
+import sitemaps
+from migrations import run_migrations
+from summaries import SUMMARY_SQL
+
+
+def _listing(sort_key, ascending, after=False, searching=False, n_categories=None, price_buckets=()):
+    return repository.listing_sql(sort_key, ascending, after, searching, n_categories, tuple(price_buckets))
+
+
+_PAGE = 25
+_DATE = '2025-01-01 00:00:00'
+
+# (name, sql, params)
+HOT_QUERIES = [
+    ('listing newest', _listing('created_at', False), (_PAGE,)),
+    ('listing newest, next page', _listing('created_at', False, after=True), (_DATE, _DATE, 10, _PAGE)),
+    ('listing by title', _listing('title', True), (_PAGE,)),
+    ('listing by price, next page', _listing('price', True, after=True), (5.0, 5.0, 10, _PAGE)),
+    ('listing by category', _listing('title', True, n_categories=2), (1, 2, _PAGE)),
+    ('listing by category and price',
+     _listing('created_at', False, n_categories=1, price_buckets=(1,)), (1, 5, 10, _PAGE)),
+    ('listing search', _listing('rank', True, searching=True), ('"card"*', _PAGE)),
+    ('listing category count', repository.count_sql(False, 2, ()), (1, 2)),
+    ('listing search count', repository.count_sql(True, None, ()), ('"card"*',)),
+    # (the per-category facet counts read all of product_facets, which only has
+    # a row per category and price bucket, so they are not listed)
+    ('facet price buckets', facets.BUCKET_COUNTS_SQL, (0,)),
+    ('product facet membership', facets.LINKED_CATEGORIES_SQL, (10,)),
+    ('home page newest', repository.CARD_SQL, (6,)),
+    ('product summaries', SUMMARY_SQL.format('?, ?, ?'), (10, 11, 12)),
+    ('product page', repository.PRODUCT_SQL, (10,)),
+    ('product categories', repository.PRODUCT_CATEGORIES_SQL, (10,)),
+    ('product reviews', repository.REVIEWS_SQL, (10,)),
+    ('seller profile products', repository.SELLER_PRODUCT_IDS_SQL, (9,)),
+    ('seller dashboard products',
+     "SELECT id, title, price, stock, created_at, image_url, is_active FROM products WHERE seller_id = ? ORDER BY created_at DESC", (9,)),
+    ('seller sales, 30 days',
+     "SELECT SUM(oi.quantity) AS qty_30 FROM order_items oi JOIN orders o ON oi.order_id = o.id "
+     "JOIN products p ON oi.product_id = p.id WHERE p.seller_id = ? AND o.created_at >= datetime('now', '-30 days')", (9,)),
+    ('seller top products',
+     "SELECT p.id, p.title, SUM(oi.quantity) AS sold FROM order_items oi JOIN products p ON oi.product_id = p.id "
+     "WHERE p.seller_id = ? GROUP BY p.id ORDER BY sold DESC LIMIT 5", (9,)),
+    ('cart prices', cart_pricing.PRODUCT_SQL.format('?, ?, ?'), (10, 11, 12)),
+    ('sitemap fingerprint', sitemaps.FINGERPRINT_SQL, ()),
+    ('sitemap shard', sitemaps.SHARD_SQL, (50000, 0)),
+    ('stock held by other carts', reservations.HELD_BY_OTHERS_SQL, (10, 'cart', 0.0)),
+    ('order items',
+     "SELECT oi.quantity, oi.unit_price, p.title FROM order_items oi JOIN products p ON oi.product_id = p.id WHERE oi.order_id = ?", (1,)),
+    ('product order count', "SELECT COUNT(1) AS cnt FROM order_items WHERE product_id = ?", (10,)),
+    ('saved addresses',
+     "SELECT id, label, address_text FROM addresses WHERE user_id = ? ORDER BY created_at DESC LIMIT 8", (1,)),
+    ('admin orders', "SELECT id, buyer_id, buyer_name, total, created_at FROM orders ORDER BY created_at DESC", ()),
+    ('admin pending reviews',
+     "SELECT r.id, r.product_id, r.title, r.body, r.rating, r.created_at, u.username AS author, p.title AS product_title "
+     "FROM reviews r LEFT JOIN users u ON r.user_id = u.id LEFT JOIN products p ON r.product_id = p.id "
+     "WHERE r.status = 'pending' ORDER BY r.created_at DESC", ()),
+    ('login', "SELECT id, username, password_hash FROM users WHERE username = ? OR email = ?", ('admin', 'admin')),
+]
+
+# "SCAN t" without an index is a full table scan; index scans ("SCAN t USING
+# [COVERING] INDEX ...") and FTS5 virtual-table lookups are fine
+_FULL_SCAN_RE = re.compile(r'^SCAN (?!.*\bUSING\b)(?!.*\bVIRTUAL TABLE\b)(?!CONSTANT ROW)')
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def schema_connection():
+    """Open an in-memory database with the current schema and no statistics."""
+    conn = sqlite3.connect(':memory:')
+    run_migrations(conn)
+    return conn
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """Return [(name, plan detail)] for every hot query step that is a full table scan."""
+    regressions = []
+    for name, sql, params in queries:
+        for detail in explain(conn, sql, params):
+            if _FULL_SCAN_RE.match(detail):
+                regressions.append((name, detail))
+    return regressions
@@ -0,0 +1,80 @@
+"""Incremental product and seller ratings.
+
+products and users carry rating_sum / rating_count over approved reviews
+(migration 13), and `rating` is kept equal to rating_sum / rating_count (0.0
+without reviews). A review changing status only adds or subtracts its own
+rating, instead of re-running AVG() over every review of the product and the
+seller. Callers run these updates in the same transaction as the change that
+caused them and commit themselves.
+
+rebuild() recomputes everything from the reviews table; run it with
+`flask --app app rebuild-ratings` after editing reviews by hand.
+"""
+
+_RATING_EXPR = "CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0.0 END"
+
+
+def _apply(cur, product_id, delta_sum, delta_count):
+    cur.execute(
+        "UPDATE products SET rating_sum = rating_sum + ?, rating_count = rating_count + ? "
+        "WHERE id = ?", (delta_sum, delta_count, product_id)
+    )
+    cur.execute(
+        "UPDATE users SET rating_sum = rating_sum + ?, rating_count = rating_count + ? "
+        "WHERE id = (SELECT seller_id FROM products WHERE id = ?)", (delta_sum, delta_count, product_id)
+    )
+    cur.execute(f"UPDATE products SET rating = {_RATING_EXPR} WHERE id = ?", (product_id,))
+    cur.execute(f"UPDATE users SET rating = {_RATING_EXPR} WHERE id = (SELECT seller_id FROM products WHERE id = ?)",
+                (product_id,))
+
+
+def review_status_changed(conn, product_id, rating, old_status, new_status):
+    """Account for a review of `product_id` moving from `old_status` to `new_status`.
+
+    Only transitions into or out of 'approved' change the aggregates. Returns
+    True when they did.
+    """
+    was, now = old_status == 'approved', new_status == 'approved'
+    if was == now:
+        return False
+    sign = 1 if now else -1
+    _apply(conn.cursor(), product_id, sign * rating, sign)
+    return True
+
+
+def product_seller_changed(conn, product_id, old_seller_id, new_seller_id):
+    """Move a product's review totals from its previous seller to its new one."""
+    if old_seller_id == new_seller_id:
+        return
+    cur = conn.cursor()
+    row = cur.execute("SELECT rating_sum, rating_count FROM products WHERE id = ?",
+                      (product_id,)).fetchone()
+    if not row or not row[1]:
+        return
+    for seller_id, sign in ((old_seller_id, -1), (new_seller_id, 1)):
+        if seller_id:
+            cur.execute(
+                "UPDATE users SET rating_sum = rating_sum + ?, rating_count = rating_count + ? "
+                "WHERE id = ?", (sign * row[0], sign * row[1], seller_id)
+            )
+            cur.execute(f"UPDATE users SET rating = {_RATING_EXPR} WHERE id = ?", (seller_id,))
+
+
+def rebuild(conn):
+    """Recompute every product's and seller's totals and rating from approved reviews."""
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE products SET "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE product_id = products.id AND status = 'approved'), "
+        "rating_count = (SELECT COUNT(*) FROM reviews WHERE product_id = products.id AND status = 'approved')"
+    )
+    cur.execute(f"UPDATE products SET rating = {_RATING_EXPR}")
+    # sellers: the sum of their products' totals
+    cur.execute(
+        "UPDATE users SET "
+        "rating_sum = (SELECT COALESCE(SUM(rating_sum), 0) FROM products WHERE seller_id = users.id), "
+        "rating_count = (SELECT COALESCE(SUM(rating_count), 0) FROM products WHERE seller_id = users.id) "
+        "WHERE is_seller = 1 OR id IN (SELECT seller_id FROM products)"
+    )
+    cur.execute(f"UPDATE users SET rating = {_RATING_EXPR} WHERE is_seller = 1 OR id IN (SELECT seller_id FROM products)")
+    conn.commit()
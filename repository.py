@@ -0,0 +1,158 @@
+"""Catalog reads for the listing, product and home pages.
+
+One code path over the pooled sqlite3 connections, replacing the ORM branch,
+the sqlite3 branch and the exception fallback the views used to carry. The
+SQL for each query shape (sort order, direction, whether a cursor, search or
+which filters are present) is composed once and memoized, so every request of
+the same shape hands sqlite3 the identical text and the connection's
+statement cache reuses the prepared statement instead of compiling it again.
+Rows come back as plain dicts, ready for templates and cheap to build.
+
+The statements are public so query_plans.py checks the exact SQL run here.
+"""
+import functools
+
+import facets
+
+_LISTING_SELECT = (
+    "SELECT p.id, p.title, p.description, p.price, p.created_at, p.stock, p.image_url, "
+    "u.business_name, u.rating, p.seller_id, c.name AS category_name, c.slug AS category_slug, "
+    "{key} AS sort_key "
+    "FROM products p{fts} LEFT JOIN users u ON p.seller_id = u.id LEFT JOIN categories c ON p.category_id = c.id"
+)
+
+_SORT_COLUMNS = {'created_at': 'p.created_at', 'price': 'p.price', 'title': 'p.title', 'rank': 'products_fts.rank'}
+
+_FTS_JOIN = " JOIN products_fts ON products_fts.rowid = p.id"
+
+CARD_SQL = (
+    "SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, "
+    "u.business_name, u.rating, u.username AS seller_username "
+    "FROM products p LEFT JOIN users u ON p.seller_id = u.id "
+    "WHERE p.is_active = 1 ORDER BY p.created_at DESC LIMIT ?"
+)
+
+PRODUCT_SQL = (
+    "SELECT p.id, p.title, p.description, p.price, p.stock, p.image_url, p.created_at, "
+    "p.seller_id, u.business_name, u.seller_description, u.rating, "
+    "p.category_id, c.name AS category_name, c.slug AS category_slug "
+    "FROM products p LEFT JOIN users u ON p.seller_id = u.id LEFT JOIN categories c ON p.category_id = c.id "
+    "WHERE p.id = ? AND p.is_active = 1"
+)
+
+PRODUCT_CATEGORIES_SQL = (
+    "SELECT c.id, c.name, c.slug FROM categories c JOIN product_categories pc ON c.id = pc.category_id "
+    "WHERE pc.product_id = ? ORDER BY c.name"
+)
+
+REVIEWS_SQL = (
+    "SELECT r.id, r.title, r.body, r.rating, r.created_at, u.username AS author FROM reviews r "
+    "LEFT JOIN users u ON r.user_id = u.id WHERE r.product_id = ? AND r.status = 'approved' "
+    "ORDER BY r.created_at DESC"
+)
+
+SELLER_PRODUCT_IDS_SQL = "SELECT id FROM products WHERE seller_id = ? AND is_active = 1 ORDER BY created_at DESC"
+
+
+def _rows(cur):
+    return [dict(r) for r in cur.fetchall()]
+
+
+@functools.lru_cache(maxsize=256)
+def _filter_sql(searching, n_categories, price_buckets):
+    """FROM-clause joins and WHERE clause shared by a listing page and its count."""
+    where = " WHERE p.is_active = 1"
+    if searching:
+        where += " AND products_fts MATCH ?"
+    if n_categories is not None:
+        # product_categories also holds each product's primary category (facets.py)
+        where += " AND " + facets.category_filter('p.id', [0] * n_categories)[0]
+    if price_buckets:
+        where += " AND " + facets.price_filter('p.price', price_buckets)[0]
+    return (_FTS_JOIN if searching else ''), where
+
+
+def _filter_params(match, category_ids, price_buckets):
+    params = [match] if match else []
+    if category_ids is not None:
+        params.extend(category_ids)
+    if price_buckets:
+        params.extend(facets.price_filter('p.price', price_buckets)[1])
+    return params
+
+
+@functools.lru_cache(maxsize=256)
+def listing_sql(sort_key, ascending, after, searching, n_categories, price_buckets):
+    """SQL of a listing page of the given shape (see listing() for the parameters)."""
+    fts, where = _filter_sql(searching, n_categories, price_buckets)
+    key = _SORT_COLUMNS[sort_key]
+    op, direction = ('>', 'ASC') if ascending else ('<', 'DESC')
+    if after:
+        where += f" AND ({key} {op} ? OR ({key} = ? AND p.id {op} ?))"
+    return (_LISTING_SELECT.format(key=key, fts=fts) + where
+            + f" ORDER BY {key} {direction}, p.id {direction} LIMIT ?")
+
+
+@functools.lru_cache(maxsize=256)
+def count_sql(searching, n_categories, price_buckets):
+    """SQL counting the products of a listing of the given shape."""
+    fts, where = _filter_sql(searching, n_categories, price_buckets)
+    return "SELECT COUNT(*) FROM products p" + fts + where
+
+
+def listing(conn, sort_key, ascending, limit, match=None, category_ids=None, price_buckets=(), after=None):
+    """A page of active products in (sort key, id) order, each with a 'sort_key' column.
+
+    `match` is an FTS5 query, `category_ids` (None for no filter) and
+    `price_buckets` restrict the products as described in facets.py, and
+    `after` is the (sort key, id) position to continue from.
+    """
+    price_buckets = tuple(price_buckets)
+    n_categories = None if category_ids is None else len(category_ids)
+    sql = listing_sql(sort_key, ascending, after is not None, bool(match), n_categories, price_buckets)
+    params = _filter_params(match, category_ids, price_buckets)
+    if after is not None:
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit)
+    return _rows(conn.execute(sql, params))
+
+
+def listing_count(conn, match=None, category_ids=None, price_buckets=()):
+    """Number of active products matching the same filters as listing()."""
+    price_buckets = tuple(price_buckets)
+    n_categories = None if category_ids is None else len(category_ids)
+    sql = count_sql(bool(match), n_categories, price_buckets)
+    return conn.execute(sql, _filter_params(match, category_ids, price_buckets)).fetchone()[0]
+
+
+def newest(conn, limit):
+    """The newest active products with their card fields."""
+    return _rows(conn.execute(CARD_SQL, (limit,)))
+
+
+def seller_product_ids(conn, seller_id):
+    """Ids of a seller's active products, newest first."""
+    return [r[0] for r in conn.execute(SELLER_PRODUCT_IDS_SQL, (seller_id,))]
+
+
+def product_detail(conn, product_id):
+    """(product, reviews) for an active product, or (None, []) if it is missing or archived.
+
+    The product dict carries its seller and primary category fields and a
+    'categories' list of every linked category.
+    """
+    row = conn.execute(PRODUCT_SQL, (product_id,)).fetchone()
+    if row is None:
+        return None, []
+    product = dict(row)
+    product['categories'] = _rows(conn.execute(PRODUCT_CATEGORIES_SQL, (product_id,)))
+    return product, _rows(conn.execute(REVIEWS_SQL, (product_id,)))
+
+
+def stats():
+    """Hit/miss counts of the memoized SQL shapes."""
+    info = {}
+    for name, fn in (('listing', listing_sql), ('count', count_sql), ('filters', _filter_sql)):
+        ci = fn.cache_info()
+        info[name] = {'hits': ci.hits, 'misses': ci.misses, 'size': ci.currsize}
+    return info
@@ -0,0 +1,112 @@
+"""Stock reservations: time-limited holds on stock for cart lines.
+
+Adding a product to a cart places a hold (`stock_reservations`, migration
+12) for the cart's quantity that lasts `ttl` seconds. The stock other
+shoppers can add to their carts or buy is the product's stock minus every
+live hold of *other* carts, so during a sale people can't fill carts with
+stock that is already spoken for and then fail at checkout. Checkout
+consumes the cart's own holds (see orders.py).
+
+Expired holds stop counting immediately (every query filters on expires_at);
+sweep() just deletes the dead rows. Products with NULL stock are unlimited
+and never get holds.
+"""
+import time
+
+# SQL for the units held by other carts' live holds on one product;
+# parameters: product id, cart id, now
+HELD_BY_OTHERS_SQL = (
+    "SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations "
+    "WHERE product_id = ? AND cart_id != ? AND expires_at > ?"
+)
+
+
+def held_by_others(conn, product_ids, cart_id, now=None):
+    """Return {product id (str): units held by live holds of carts other than `cart_id`}."""
+    now = time.time() if now is None else now
+    ids = [int(i) for i in product_ids]
+    if not ids:
+        return {}
+    placeholders = ",".join("?" for _ in ids)
+    rows = conn.execute(
+        f"SELECT product_id, SUM(quantity) FROM stock_reservations "
+        f"WHERE product_id IN ({placeholders}) AND cart_id != ? AND expires_at > ? GROUP BY product_id",
+        ids + [cart_id or '', now]
+    ).fetchall()
+    return {str(r[0]): r[1] for r in rows}
+
+
+def _hold(cur, cart_id, product_id, quantity, ttl, now):
+    cur.execute("SELECT stock FROM products WHERE id = ? AND is_active = 1", (int(product_id),))
+    row = cur.fetchone()
+    if row is None:
+        granted = 0
+    elif row[0] is None:
+        granted = quantity
+    else:
+        cur.execute(HELD_BY_OTHERS_SQL, (int(product_id), cart_id, now))
+        granted = max(0, min(quantity, row[0] - cur.fetchone()[0]))
+    if granted > 0 and row[0] is not None:
+        cur.execute(
+            "INSERT INTO stock_reservations (cart_id, product_id, quantity, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(cart_id, product_id) DO UPDATE SET quantity = excluded.quantity, expires_at = excluded.expires_at",
+            (cart_id, int(product_id), granted, now + ttl)
+        )
+    else:
+        cur.execute("DELETE FROM stock_reservations WHERE cart_id = ? AND product_id = ?", (cart_id, int(product_id)))
+    return granted
+
+
+def hold_many(conn, cart_id, quantities, ttl):
+    """Set the cart's holds to `quantities` ({product id: units}) in one transaction.
+
+    Each hold is replaced as hold() does; a quantity of 0 releases the hold.
+    Returns {product id: units granted} (0 for ids that aren't integers).
+    """
+    if conn.in_transaction:
+        conn.rollback()
+    now = time.time()
+    cur = conn.cursor()
+    # serialize holds against each other and against checkout
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        granted = {}
+        for pid, qty in quantities.items():
+            try:
+                int(pid)
+            except (TypeError, ValueError):
+                # not a product id (e.g. a tampered form field): nothing to hold
+                granted[pid] = 0
+                continue
+            granted[pid] = _hold(cur, cart_id, pid, qty, ttl, now)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return granted
+
+
+def hold(conn, cart_id, product_id, quantity, ttl):
+    """Set the cart's hold on a product to `quantity` units, as far as stock allows.
+
+    Replaces any previous hold of the cart on that product. Returns the number
+    of units granted (0 when nothing is available or the product is inactive).
+    """
+    return hold_many(conn, cart_id, {product_id: quantity}, ttl)[product_id]
+
+
+def release(conn, cart_id, product_id=None):
+    """Drop the cart's hold on one product, or all of its holds."""
+    if product_id is None:
+        conn.execute("DELETE FROM stock_reservations WHERE cart_id = ?", (cart_id,))
+    else:
+        conn.execute("DELETE FROM stock_reservations WHERE cart_id = ? AND product_id = ?", (cart_id, int(product_id)))
+    conn.commit()
+
+
+def sweep(conn, now=None):
+    """Delete expired holds; returns how many were removed."""
+    now = time.time() if now is None else now
+    cur = conn.execute("DELETE FROM stock_reservations WHERE expires_at <= ?", (now,))
+    conn.commit()
+    return max(cur.rowcount, 0)
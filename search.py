@@ -0,0 +1,69 @@
+"""Full-text product search backed by the `products_fts` FTS5 index.
+
+The index is an external-content FTS5 table over products.title/description,
+created by migration 9 and kept in sync by triggers on `products`, so every
+write path (raw sqlite3 and ORM alike) updates it without extra code.
+"""
+import re
+
+from markupsafe import Markup, escape
+
+# Lightweight (unregistered) table construct so ORM queries can join the index
+# without db.create_all() ever trying to create it. SQLAlchemy is optional.
+try:
+    from sqlalchemy.sql import column, table
+    products_fts = table('products_fts', column('rowid'), column('rank'), column('products_fts'))
+except ImportError:
+    products_fts = None
+
+# control characters used as snippet markers; escaped text can never contain them
+_MARK_OPEN = '\x02'
+_MARK_CLOSE = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(term, max_tokens=8):
+    """Turn free-text user input into an FTS5 MATCH expression.
+
+    Each word becomes a quoted prefix query ("mag"* matches "magic"), and all
+    words must match. FTS5 syntax characters in the input are dropped, so user
+    input can never produce a malformed query. Returns None when the input has
+    no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(term or '')[:max_tokens]
+    if not tokens:
+        return None
+    return ' '.join(f'"{t}"*' for t in tokens)
+
+
+def highlight(snippet):
+    """Escape a marked-up FTS5 snippet and wrap the matched terms in <mark>."""
+    if not snippet:
+        return None
+    html = str(escape(snippet))
+    return Markup(html.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>'))
+
+
+def snippets(conn, match, product_ids, tokens=16):
+    """Return {product_id: highlighted description snippet} for the given ids.
+
+    Run after pagination so snippets are only built for the rows on the page.
+    """
+    ids = [int(i) for i in product_ids]
+    if not match or not ids:
+        return {}
+    placeholders = ",".join("?" for _ in ids)
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT rowid AS id, snippet(products_fts, 1, ?, ?, '…', ?) AS snip "
+        f"FROM products_fts WHERE products_fts MATCH ? AND rowid IN ({placeholders})",
+        [_MARK_OPEN, _MARK_CLOSE, tokens, match] + ids
+    )
+    return {r['id']: highlight(r['snip']) for r in cur.fetchall()}
+
+
+def rebuild_index(conn):
+    """Rebuild products_fts from the products table (e.g. after bulk imports)."""
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    conn.commit()
@@ -1,68 +1,12 @@
 import sqlite3
 import os
 from werkzeug.security import generate_password_hash
+from migrations import run_migrations
+import facets
+import ratings
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "webstore.db")
 
-CREATE_SCHEMA = """
-PRAGMA foreign_keys = ON;
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT NOT NULL UNIQUE,
-    email TEXT NOT NULL UNIQUE,
-    password_hash TEXT NOT NULL,
-    is_admin INTEGER NOT NULL DEFAULT 0,
-    is_seller INTEGER NOT NULL DEFAULT 0,
-    business_name TEXT,
-    seller_description TEXT,
-    rating REAL DEFAULT 0,
-    total_sales INTEGER DEFAULT 0,
-    created_at TEXT NOT NULL DEFAULT (datetime('now'))
-);
-CREATE TABLE IF NOT EXISTS products (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    seller_id INTEGER,
-    title TEXT NOT NULL,
-    description TEXT,
-    price REAL NOT NULL CHECK(price >= 0),
-    stock INTEGER DEFAULT 0,
-    image_url TEXT,
-    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-    is_active INTEGER NOT NULL DEFAULT 1,
-    FOREIGN KEY(seller_id) REFERENCES users(id) ON DELETE SET NULL
-);
-CREATE TABLE IF NOT EXISTS orders (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    buyer_id INTEGER,
-    buyer_name TEXT,
-    buyer_email TEXT,
-    shipping_address TEXT,
-    status TEXT NOT NULL DEFAULT 'pending',
-    total REAL NOT NULL CHECK(total >= 0),
-    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-    FOREIGN KEY(buyer_id) REFERENCES users(id)
-);
-CREATE TABLE IF NOT EXISTS order_items (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    order_id INTEGER NOT NULL,
-    product_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL CHECK(quantity > 0),
-    unit_price REAL NOT NULL CHECK(unit_price >= 0),
-    FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE,
-    FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE RESTRICT
-);
--- new addresses table to store saved shipping addresses per user
-CREATE TABLE IF NOT EXISTS addresses (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    label TEXT,
-    address_text TEXT NOT NULL,
-    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-    FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
-    UNIQUE(user_id, address_text)
-);
-"""
-
 SAMPLE_USERS = [
     # username, email, password_plain, is_admin, is_seller, business_name, desc, rating, total_sales
     ("angus", "angus@example.com", "password123", 1, 1, "Alice's Antiques", "Specialized in rare items", 4.5, 25),
@@ -83,14 +27,15 @@ SAMPLE_ADDRESSES = [
     (3, "Office", "99 Tech Park, Suite 200, Metropolis, MT 54321")
 ]
 
-def initialize_db():
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-    conn = sqlite3.connect(DB_PATH)
+def initialize_db(path=DB_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
+    # build the schema through the same versioned migrations the app uses
+    run_migrations(conn)
     c = conn.cursor()
-    c.executescript(CREATE_SCHEMA)
     users_hashed = []
     for u in SAMPLE_USERS:
         pw_hash = generate_password_hash(u[2])
@@ -108,8 +53,12 @@ def initialize_db():
         INSERT OR IGNORE INTO addresses (user_id, label, address_text) VALUES (?, ?, ?)
     ''', SAMPLE_ADDRESSES)
     conn.commit()
+    # the migrations built the derived facet counts and ratings on empty tables
+    facets.rebuild(conn)
+    ratings.rebuild(conn)
+    conn.commit()
     conn.close()
-    print("Database created at", DB_PATH)
+    print("Database created at", path)
 
 if __name__ == "__main__":
     initialize_db()
@@ -0,0 +1,162 @@
+"""Sharded, persisted sitemaps.
+
+/sitemap.xml is a sitemap index pointing at /sitemap-1.xml ... /sitemap-N.xml,
+each holding at most `max_urls` URLs (the protocol limit is 50,000). Shards
+are written gzip-compressed to `directory` by streaming rows from a cursor, so
+no request ever holds the whole catalog in memory, and they survive restarts:
+a shard is only rebuilt when the active catalog changes.
+
+Whether the files are current is decided by a fingerprint of the active
+products (count, sum of ids, newest created_at) plus the site's base URL,
+which is hashed into the shard file names: after a catalog change the next
+request simply finds no file for the new hash and builds it. Files of older
+hashes are removed once they are `keep_stale` seconds old.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+STATIC_PATHS = ['/', '/products', '/about', '/contact', '/terms', '/privacy', '/cookies', '/returns']
+
+FINGERPRINT_SQL = "SELECT COUNT(*), COALESCE(SUM(id), 0), MAX(created_at) FROM products WHERE is_active = 1"
+
+# products in (created_at, id) order, which idx_products_active_created returns
+# without sorting; shard boundaries are offsets into this list
+SHARD_SQL = "SELECT id, created_at FROM products WHERE is_active = 1 ORDER BY created_at, id LIMIT ? OFFSET ?"
+
+_CHUNK = 64 * 1024
+
+
+def fingerprint(conn):
+    """Cheap summary of the active catalog; changes whenever a product is added, archived or restored."""
+    row = conn.execute(FINGERPRINT_SQL).fetchone()
+    return [row[0], row[1], row[2]]
+
+
+def _lastmod(value, default):
+    # stored as 'YYYY-MM-DD HH:MM:SS'; sitemaps want the date
+    try:
+        return str(value).split(' ')[0] if value else default
+    except Exception:
+        return default
+
+
+class SitemapStore:
+    """Builds and serves sitemap shards persisted under `directory`."""
+
+    def __init__(self, directory, max_urls=50000, keep_stale=3600):
+        self.directory = directory
+        self.max_urls = max(len(STATIC_PATHS) + 1, int(max_urls))
+        self.keep_stale = keep_stale
+
+    def manifest(self, fp, base):
+        """Describe the sitemap set for catalog fingerprint `fp` and site `base`."""
+        count = fp[0] or 0
+        return {
+            'token': hashlib.sha1(json.dumps([fp, base]).encode('utf-8')).hexdigest()[:12],
+            'base': base,
+            'shards': max(1, -(-(count + len(STATIC_PATHS)) // self.max_urls)),
+            'lastmod': _lastmod(fp[2], datetime.utcnow().date().isoformat()),
+        }
+
+    def _remove_stale(self, token):
+        # shards of older catalog versions; kept for a while in case another
+        # worker still serves an index that points at them
+        cutoff = time.time() - self.keep_stale
+        for path in glob.glob(os.path.join(self.directory, 'sitemap-*.xml.gz')):
+            if os.path.basename(path).startswith(f"sitemap-{token}-"):
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # index
+
+    def index_xml(self, manifest, gzip_links=False):
+        """The sitemap index (small: one entry per shard)."""
+        suffix = '.xml.gz' if gzip_links else '.xml'
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>', f'<sitemapindex xmlns="{XMLNS}">']
+        for n in range(1, manifest['shards'] + 1):
+            parts.append('  <sitemap>')
+            parts.append(f"    <loc>{escape(manifest['base'])}/sitemap-{n}{suffix}</loc>")
+            parts.append(f"    <lastmod>{manifest['lastmod']}</lastmod>")
+            parts.append('  </sitemap>')
+        parts.append('</sitemapindex>')
+        return '\n'.join(parts) + '\n'
+
+    # shards
+
+    def _iter_urls(self, conn, manifest, n):
+        base = manifest['base']
+        today = datetime.utcnow().date().isoformat()
+        if n == 1:
+            for p in STATIC_PATHS:
+                yield base + p, today
+            offset, limit = 0, self.max_urls - len(STATIC_PATHS)
+        else:
+            offset, limit = (n - 1) * self.max_urls - len(STATIC_PATHS), self.max_urls
+        cur = conn.execute(SHARD_SQL, (limit, offset))
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            for r in rows:
+                yield f"{base}/product/{r[0]}", _lastmod(r[1], today)
+
+    def _iter_xml(self, conn, manifest, n):
+        yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+        for loc, lastmod in self._iter_urls(conn, manifest, n):
+            yield f"  <url>\n    <loc>{escape(loc)}</loc>\n    <lastmod>{lastmod}</lastmod>\n  </url>\n"
+        yield '</urlset>\n'
+
+    def shard_path(self, manifest, n, get_conn):
+        """Path of the gzipped shard `n`, building it first if it isn't on disk.
+
+        Returns None for shard numbers outside the index. `get_conn` is only
+        called when the shard has to be built.
+        """
+        if not 1 <= n <= manifest['shards']:
+            return None
+        path = os.path.join(self.directory, f"sitemap-{manifest['token']}-{n}.xml.gz")
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        conn = get_conn()
+        try:
+            # mtime=0 keeps the output identical for identical content
+            with gzip.GzipFile(tmp, 'wb', mtime=0) as f:
+                for chunk in self._iter_xml(conn, manifest, n):
+                    f.write(chunk.encode('utf-8'))
+            os.replace(tmp, path)
+        finally:
+            conn.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._remove_stale(manifest['token'])
+        return path
+
+    @staticmethod
+    def stream(path, decompress=False):
+        """Generator over a shard file's bytes, optionally gunzipped on the fly."""
+        # opened here, not in the generator, so a concurrent cleanup can't remove it first
+        f = gzip.open(path, 'rb') if decompress else open(path, 'rb')
+
+        def generate():
+            with f:
+                while True:
+                    chunk = f.read(_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+        return generate()
@@ -1,4 +1,5 @@
 // Bump cache name when changing caching rules so clients pick up updates
+// (with an asset build, /sw.js is served with the build version as the name)
 const CACHE_NAME = 'cardhaven-v5';
 const ASSETS = [
   '/',
@@ -58,7 +59,7 @@ self.addEventListener('fetch', event => {
   }
 
   // static assets: cache-first
-  if (ASSETS.includes(url.pathname) || (url.origin === location.origin && url.pathname.startsWith('/static/'))) {
+  if (ASSETS.includes(url.pathname) || (url.origin === location.origin && (url.pathname.startsWith('/static/') || url.pathname.startsWith('/assets/')))) {
     event.respondWith(
       caches.match(req).then(cached => cached || fetch(req).then(networkRes => {
         caches.open(CACHE_NAME).then(cache => cache.put(req, networkRes.clone()));
@@ -0,0 +1,78 @@
+"""Product summary lookups for listing-style views.
+
+Recently viewed, cart, seller profile and featured products all show the same
+card fields (product columns plus the seller's name and rating).
+ProductSummaries.get_many() returns those rows for a list of ids, in the
+order given, with one `IN (...)` query for whatever is not already in a small
+in-process LRU cache. Inactive and unknown ids are left out.
+
+Entries expire after `ttl` seconds; app.py also drops them as soon as it
+invalidates the matching 'product:<id>' or 'seller:<id>' cache tag.
+"""
+from cache import LRUCache
+
+SUMMARY_SQL = (
+    "SELECT p.id, p.title, p.description, p.price, p.stock, p.created_at, p.seller_id, p.image_url, "
+    "u.business_name, u.rating, u.username AS seller_username "
+    "FROM products p LEFT JOIN users u ON p.seller_id = u.id WHERE p.is_active = 1 AND p.id IN ({})"
+)
+
+# stay well below SQLite's bound-parameter limit
+_CHUNK = 500
+
+# cached for ids that are missing or archived, so they don't hit the database each time
+_MISSING = {}
+
+
+class ProductSummaries:
+    """Batched, cached product summary lookups."""
+
+    def __init__(self, max_entries=2048, ttl=60):
+        self._cache = LRUCache(max_entries=max_entries, default_ttl=ttl)
+
+    def get_many(self, ids, get_conn):
+        """Return summary dicts for `ids` in the same order (duplicates removed).
+
+        `get_conn` is only called when some ids are not cached.
+        """
+        wanted = []
+        for i in ids:
+            try:
+                i = int(i)
+            except (TypeError, ValueError):
+                continue
+            if i not in wanted:
+                wanted.append(i)
+        found = {}
+        missing = []
+        for i in wanted:
+            row = self._cache.get(i)
+            if row is None:
+                missing.append(i)
+            else:
+                found[i] = row
+        if missing:
+            conn = get_conn()
+            try:
+                cur = conn.cursor()
+                for n in range(0, len(missing), _CHUNK):
+                    chunk = missing[n:n + _CHUNK]
+                    cur.execute(SUMMARY_SQL.format(",".join("?" for _ in chunk)), chunk)
+                    for r in cur.fetchall():
+                        found[r['id']] = dict(r)
+            finally:
+                conn.close()
+            for i in missing:
+                self._cache.set(i, found.get(i, _MISSING))
+        # copies, so views/templates can't mutate cached rows
+        return [dict(found[i]) for i in wanted if found.get(i)]
+
+    def invalidate(self, *product_ids):
+        for i in product_ids:
+            self._cache.delete(int(i))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
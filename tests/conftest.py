@@ -0,0 +1,64 @@
+import importlib
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import facets  # noqa: E402
+import ratings  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database file with the app's schema and one seller."""
+    path = str(tmp_path / 'webstore.db')
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    run_migrations(conn)
+    conn.execute("INSERT INTO users (username, email, password_hash, is_seller, business_name) "
+                 "VALUES ('seller', 'seller@example.com', 'x', 1, 'Test Shop')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture(scope='session')
+def webstore(tmp_path_factory):
+    """The app module, pointed at a small catalog: 30 products from 3 sellers, reviews by several buyers.
+
+    The app reads DATABASE_PATH on import, so every test shares this one database.
+    """
+    path = str(tmp_path_factory.mktemp('webstore') / 'webstore.db')
+    conn = sqlite3.connect(path)
+    run_migrations(conn)
+    for i in range(3):
+        conn.execute("INSERT INTO users (username, email, password_hash, is_seller, business_name) "
+                     "VALUES (?, ?, 'x', 1, ?)", (f"seller{i}", f"seller{i}@example.com", f"Shop {i}"))
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                     (f"buyer{i}", f"buyer{i}@example.com"))
+    conn.execute("INSERT INTO categories (name, slug) VALUES ('Pokemon', 'pokemon'), ('Lorcana', 'lorcana')")
+    for i in range(30):
+        pid = conn.execute(
+            "INSERT INTO products (seller_id, title, price, stock, category_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (1 + 2 * (i % 3), f"Product {i}", 1 + i, 10, 1 + i % 2, f"2025-01-{1 + i % 28:02d} 00:00:00")).lastrowid
+        conn.execute("INSERT INTO product_categories (product_id, category_id) VALUES (?, 2)", (pid,))
+        for buyer in (2, 4, 6):
+            conn.execute("INSERT INTO reviews (product_id, user_id, title, body, rating, status) "
+                         "VALUES (?, ?, 'Nice', 'Good card', 4, 'approved')", (pid, buyer))
+    conn.commit()
+    facets.rebuild(conn)
+    ratings.rebuild(conn)
+    conn.commit()
+    conn.close()
+    os.environ['DATABASE_PATH'] = path
+    try:
+        app = importlib.import_module('app')
+    finally:
+        del os.environ['DATABASE_PATH']
+    assert app.DB_PATH == path
+    app.app.config['TESTING'] = True
+    return app
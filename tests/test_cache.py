@@ -0,0 +1,29 @@
+"""Tag-based page cache (cache.py)."""
+from cache import LRUCache, PageCache
+
+
+def test_invalidation_during_load_is_a_miss():
+    cache = PageCache(LRUCache())
+    versions = cache.snapshot(['product:1'])
+    # a write lands between loading the page and storing it
+    cache.invalidate('product:1')
+    cache.set('page', 'stale', tags=['product:1'], versions=versions)
+    assert cache.get('page') is None
+
+    versions = cache.snapshot(['product:1'])
+    cache.set('page', 'fresh', tags=['product:1'], versions=versions)
+    assert cache.get('page') == 'fresh'
+
+
+def test_coarse_snapshot_tag_change_skips_the_entry():
+    cache = PageCache(LRUCache())
+    versions = cache.snapshot(['product:1', 'sellers'])
+    cache.invalidate('seller:3', 'sellers')
+    cache.set('page', 'stale', tags=['product:1', 'seller:3'], versions=versions)
+    assert cache.get('page') is None
+
+    # the coarse tag isn't recorded, so later edits of other sellers keep the entry
+    versions = cache.snapshot(['product:1', 'sellers'])
+    cache.set('page', 'fresh', tags=['product:1', 'seller:3'], versions=versions)
+    cache.invalidate('seller:4', 'sellers')
+    assert cache.get('page') == 'fresh'
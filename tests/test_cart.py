@@ -0,0 +1,9 @@
+"""Cart views."""
+
+
+def test_cart_update_ignores_fields_that_are_not_product_ids(webstore):
+    client = webstore.app.test_client()
+    client.post('/cart/add', data={'product_id': '1', 'quantity': '1'})
+    resp = client.post('/cart/update', data={'qty_1': '2', 'qty_abc': '3', 'qty_': '1'})
+    assert resp.status_code == 302
+    assert client.get('/cart/summary').get_json()['total_items'] == 2
@@ -0,0 +1,61 @@
+"""Parallel checkouts against one low-stock product must never oversell."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orders
+from database import open_connection, storage_profile
+
+STOCK = 5
+CHECKOUTS = 300
+WORKERS = 32
+
+
+def test_parallel_checkouts_do_not_oversell(db_path, capsys):
+    conn = open_connection(db_path, pragmas=storage_profile('wal'))
+    product_id = conn.execute(
+        "INSERT INTO products (seller_id, title, price, stock, is_active) VALUES (1, 'Last boxes', 9.99, ?, 1)",
+        (STOCK,)).lastrowid
+    conn.commit()
+    conn.close()
+
+    local = threading.local()
+    connections = []
+    # every worker opens its connection first, then they all start together
+    start = threading.Barrier(WORKERS, timeout=30)
+
+    def checkout(i):
+        if not hasattr(local, 'conn'):
+            local.conn = open_connection(db_path, pragmas=storage_profile('wal'), check_same_thread=False)
+            connections.append(local.conn)
+            start.wait()
+        try:
+            orders.place_order(local.conn, {str(product_id): 1}, None, f"Buyer {i}", 'b@example.com', '1 Test St')
+            return 'ok'
+        except orders.OutOfStock:
+            return 'out'
+        except orders.CheckoutBusy:
+            return 'busy'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(checkout, range(CHECKOUTS)))
+    elapsed = time.perf_counter() - started
+    for c in connections:
+        c.close()
+
+    conn = open_connection(db_path)
+    stock = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+    sold = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = ?",
+                        (product_id,)).fetchone()[0]
+    placed = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    conn.close()
+
+    assert stock == 0
+    assert sold == STOCK
+    assert placed == results.count('ok') == STOCK
+    assert results.count('out') + results.count('busy') == CHECKOUTS - STOCK
+    with capsys.disabled():
+        print(f"\n{CHECKOUTS} checkouts on {WORKERS} threads in {elapsed:.2f}s "
+              f"({CHECKOUTS / elapsed:.0f}/s): {results.count('ok')} placed, "
+              f"{results.count('out')} out of stock, {results.count('busy')} gave up on the lock")
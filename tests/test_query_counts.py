@@ -0,0 +1,38 @@
+"""The catalog pages run a fixed number of SQL statements, however many rows they show."""
+import pytest
+
+
+@pytest.fixture
+def statements(webstore, monkeypatch):
+    """SQL run on the app's pooled connections during the test (page cache cleared first)."""
+    log = []
+    for pool in (webstore._db_pool, webstore._db_read_pool):
+        def traced(acquire=pool.acquire):
+            conn = acquire()
+            conn.set_trace_callback(log.append)
+            return conn
+        monkeypatch.setattr(pool, 'acquire', traced)
+    webstore._cache.clear()
+    yield log
+    for pool in (webstore._db_pool, webstore._db_read_pool):
+        pool.close_all()
+
+
+@pytest.mark.parametrize('query', ['', '?sort=price_low', '?category=pokemon&price=2'])
+def test_listing_statements(webstore, statements, query):
+    resp = webstore.app.test_client().get('/products' + query)
+    assert resp.status_code == 200
+    assert b'Product' in resp.data
+    # categories, the two facet counts and one query for the page of products
+    # with their seller and category joined in
+    assert len(statements) == 4
+    assert sum(' FROM products p ' in s for s in statements) == 1
+
+
+def test_detail_statements(webstore, statements):
+    resp = webstore.app.test_client().get('/product/1')
+    assert resp.status_code == 200
+    assert resp.data.count(b'Good card') == 3
+    # the product with seller and category, its linked categories, and the
+    # reviews with their authors
+    assert len(statements) == 3
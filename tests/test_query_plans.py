@@ -0,0 +1,20 @@
+"""Every hot query (query_plans.HOT_QUERIES) must use an index, not a full table scan."""
+import query_plans
+
+
+def test_hot_queries_use_indexes():
+    conn = query_plans.schema_connection()
+    try:
+        assert query_plans.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_full_scans_are_reported():
+    conn = query_plans.schema_connection()
+    try:
+        regressions = query_plans.check_query_plans(
+            conn, [('unindexed', "SELECT id FROM products WHERE description = ?", ('x',))])
+    finally:
+        conn.close()
+    assert [name for name, _ in regressions] == ['unindexed']
@@ -0,0 +1,42 @@
+"""Stock holds for carts (reservations.py)."""
+import cart_store
+import reservations
+from database import open_connection
+
+
+def _product(conn, stock):
+    pid = conn.execute("INSERT INTO products (seller_id, title, price, stock) VALUES (1, 'Booster', 4.5, ?)",
+                       (stock,)).lastrowid
+    conn.commit()
+    return pid
+
+
+def _holds(conn):
+    return {(r[0], r[1]): r[2] for r in conn.execute("SELECT cart_id, product_id, quantity FROM stock_reservations")}
+
+
+def test_hold_many_skips_ids_that_are_not_integers(db_path):
+    conn = open_connection(db_path)
+    pid = _product(conn, 5)
+    cart_store.ensure(conn, 'cart-a')
+    granted = reservations.hold_many(conn, 'cart-a', {'abc': 3, None: 1, str(pid): 2}, ttl=60)
+    assert granted == {'abc': 0, None: 0, str(pid): 2}
+    assert _holds(conn) == {('cart-a', pid): 2}
+    conn.close()
+
+
+def test_login_merge_keeps_the_guest_carts_holds(db_path):
+    conn = open_connection(db_path)
+    shared, guest_only, expired = _product(conn, 10), _product(conn, 10), _product(conn, 10)
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('buyer', 'buyer@example.com', 'x')")
+    cart_store.save(conn, 'user-cart', {str(shared): 2, str(expired): 1}, user_id=2)
+    reservations.hold_many(conn, 'user-cart', {shared: 2, expired: 1}, ttl=60)
+    conn.execute("UPDATE stock_reservations SET expires_at = 0 WHERE product_id = ?", (expired,))
+    conn.commit()
+    cart_store.save(conn, 'guest-cart', {str(shared): 1, str(guest_only): 1, str(expired): 3})
+    reservations.hold_many(conn, 'guest-cart', {shared: 1, guest_only: 1, expired: 3}, ttl=60)
+
+    assert cart_store.attach_to_user(conn, 'guest-cart', 2) == 'user-cart'
+    assert cart_store.load(conn, 'user-cart', 2) == {str(shared): 3, str(expired): 4, str(guest_only): 1}
+    assert _holds(conn) == {('user-cart', shared): 3, ('user-cart', guest_only): 1, ('user-cart', expired): 3}
+    conn.close()
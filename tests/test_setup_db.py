@@ -0,0 +1,16 @@
+"""setup_db.py seeds a database whose derived tables agree with its data."""
+import sqlite3
+from collections import Counter
+
+import facets
+import setup_db
+
+
+def test_seeded_facet_counts_match_active_products(tmp_path):
+    path = str(tmp_path / 'webstore.db')
+    setup_db.initialize_db(path)
+    conn = sqlite3.connect(path)
+    active = Counter(facets.bucket_of(r[0]) for r in conn.execute("SELECT price FROM products WHERE is_active = 1"))
+    assert sum(active.values()) == len(setup_db.SAMPLE_PRODUCTS)
+    assert facets.bucket_counts(conn) == dict(active)
+    conn.close()